@@ -16,7 +16,7 @@ setup(name='snclass',
       author=snclass.__author__,
       author_email=snclass.__email__,
       license='GPL3',
-      packages=['snclass'],
+      packages=['snclass', 'snclass.benchmark'],
       install_requires=[
                       'numpy>=1.8.2',
                       'matplotlib>=1.3.1',
@@ -24,7 +24,12 @@ setup(name='snclass',
                       'scikit-learn>=0.17'
       ],
       scripts=['snclass/bin/fit_plot_lc.py', 
-               'snclass/bin/build_synthetic_spec.py'],
+               'snclass/bin/build_synthetic_spec.py',
+               'snclass/bin/run_benchmark.py',
+               'snclass/bin/classify_server.py',
+               'snclass/bin/watch_classify.py',
+               'snclass/bin/run_workflow.py',
+               'snclass/bin/run_sweep.py'],
       package_dir={'snclass': 'snclass', 'examples':'snclass/examples',
                    'ishida2015':'snclass/ishida2015'},
       zip_safe=False,
@@ -3,6 +3,8 @@ Created by Emille Ishida in July 16th, 2015.
 
 Collection of functions to implement supernova photometric classification.
 
+- lclist_name:
+    Name of the list of objects written by set_lclist.
 - set_lc_list:
     Build a list of all objects satisfying selection cuts and plot them.
 - build_sample:
@@ -15,8 +17,16 @@ Collection of functions to implement supernova photometric classification.
     Separate object identification according to class.
 - set_parameters:
     Set extra sample parameters and copy raw files to new directory.
+- check_realization:
+    Check if one GP realization satisfies epoch cuts.
 - select_GP:
     Select original objs to build a synthetic spectroscopic sample.
+- matrix_name:
+    Root name of the spectroscopic data matrix files.
+- build_train_matrix:
+    Build data matrix of the synthetic spectroscopic sample.
+- train_model:
+    Optimize hyperparameters and store trained model for one number of PCs.
 - build_spec_matrix:
     Build spectroscopic data matrix.
 - plot_proj:
@@ -27,12 +37,39 @@ Collection of functions to implement supernova photometric classification.
     Read hyperparameters result from cross-validation.
 - set_kpca_obj:
     Set kpca object based on cross-validation results.
+- prepare_1obj:
+    Load and treat 1 supernova, building its realizations matrix.
+- prepare_lc:
+    Treat a fitted light curve and build its realizations matrix.
 - classify_1obj:
     Perform classification of 1 supernova.
+- classify_batch:
+    Perform classification of a batch of supernovae.
+- classify_models:
+    Classify a batch of supernovae under all trained models.
+- prepare_batch:
+    Load and treat a batch of supernovae.
+- classify_prepared:
+    Classify a set of previously treated supernovae.
+- load_model:
+    Set kpca object and spatial index for one number of PCs.
+- init_worker:
+    Store trained artifacts once per pool worker.
+- task_input:
+    Complete task dictionary with artifacts stored by init_worker.
+- run_tasks:
+    Apply function to a list of tasks, in parallel if required.
+- write_class_res:
+    Write classification results for one number of PCs.
 - classify:
     Classify all objects in photometric sample.
 """
 
+from snclass.instrument import record_array, timed
+
+# trained artifacts shared by all tasks in a pool worker, see init_worker
+WORKER_DATA = {}
+
 def read_file(fname):
     """
     Read text file and return a list of all elements.
@@ -55,6 +92,41 @@ def read_file(fname):
 
     return data
 
+def lclist_name(list_dir, sample, user_choices):
+    """
+    Name of the list of objects written by set_lclist.
+
+    input: list_dir, str
+           path to list directory
+
+           sample, str
+           'spec' or 'photo'
+
+           user_choices, dict
+           output from snclass.util.read_user_input
+
+    output: str
+    """
+    # set parameter for file name
+    if int(user_choices['epoch_cut'][0]) < 0:
+        epoch_min = str(abs(int(user_choices['epoch_cut'][0])))
+    else:
+        epoch_min = 'p' + str(abs(int(user_choices['epoch_cut'][0])))
+
+    epoch_max = str(int(user_choices['epoch_cut'][1]) - 1)
+
+    filter_list = ''.join(user_choices['filters'])
+
+    ref_filter = user_choices['ref_filter'][0]
+    if ref_filter is None:
+        ref_fils = 'global'
+    else:
+        ref_fils = ref_filter
+
+    return list_dir + sample + '_' + filter_list + '_' + epoch_min + '_' + \
+           epoch_max + '_ref_' + ref_fils + '.list'
+
+
 def set_lclist(params):
     """
     Build a list of all objects satisfying selection cuts and plot them.
@@ -97,6 +169,7 @@ def set_lclist(params):
     cont = 0
 
     rfil = params['user_choices']['ref_filter'][0]
+    meas = params['user_choices']['measurement'][0]
 
     for obj in flist:
 
@@ -104,7 +177,7 @@ def set_lclist(params):
 
             screen(obj, params['user_choices'])
 
-            rname = translate_snid(obj)[0]
+            rname = translate_snid(obj, meas)[0]
             params['user_choices']['path_to_lc'] = [rname]
             params['user_choices']['n_samples'] = ['0']
 
@@ -112,7 +185,7 @@ def set_lclist(params):
             new_lc = LC(raw, params['user_choices'])
 
             if (params['user_choices']['file_root'][0] + raw['SNID:'][0] + \
-               '_samples.dat' in flist):
+               '_' + meas + '_samples.dat' in flist):
                 new_lc.user_choices['n_samples'] = ['100']
                 new_lc.user_choices['samples_dir'] = [params['fitted_data_dir']]
 
@@ -141,12 +214,14 @@ def set_lclist(params):
                                                     'SN' + raw['SNID:'][0] + \
                                                     '.png')
                         else:
-                            screen('SN' + raw['SNID:'][0] + ' did not satisfy' + \
-                                   ' epoch cuts!\n', params['user_choices'])
+                            screen('SN%s did not satisfy epoch cuts!\n',
+                                   params['user_choices'], raw['SNID:'][0],
+                                   extra={'snid': raw['SNID:'][0]})
                             cont = cont + 1
                     else:
-                        screen('SN' + raw['SNID:'][0] + ' does not exist in ' + \
-                               'all filters!\n', params['user_choices'])
+                        screen('SN%s does not exist in all filters!\n',
+                               params['user_choices'], raw['SNID:'][0],
+                               extra={'snid': raw['SNID:'][0]})
                         cont = cont + 1
 
                 except ValueError:
@@ -154,13 +229,13 @@ def set_lclist(params):
                     cont = cont + 1
 
             else:
-                screen('Samples not found for SN' + raw['SNID:'][0], 
-                       params['user_choices'])
+                screen('Samples not found for SN%s',
+                       params['user_choices'], raw['SNID:'][0])
 
         else:
             cont = cont + 1
 
-    screen('Missed ' + str(cont) + ' SN.', params['user_choices'])
+    screen('Missed %s SN.', params['user_choices'], cont)
 
     # store list of problematic fits
     if len(problem) > 0:
@@ -170,32 +245,12 @@ def set_lclist(params):
         op2.close()
         sys.exit()
 
-    # set parameter for file name
-    if int(params['user_choices']['epoch_cut'][0]) < 0:
-        epoch_min = str(abs(int(params['user_choices']['epoch_cut'][0])))
-    else:
-        epoch_min = 'p' + \
-                    str(abs(int(params['user_choices']['epoch_cut'][0])))
-
-    epoch_max = str(int(params['user_choices']['epoch_cut'][1]) - 1)
-
-    filter_list = params['user_choices']['filters'][0]
-    for item in params['user_choices']['filters'][1:]:
-        filter_list = filter_list + item
-
     # save objs list
     if not os.path.isdir(params['list_dir']):
         os.makedirs(params['list_dir'])
 
-    ref_filter = params['user_choices']['ref_filter'][0]
-    if ref_filter is None:
-        ref_fils = 'global'
-    else:
-        ref_fils = ref_filter
-
-    op1 = open(params['list_dir'] + params['sample'] + '_' + filter_list + \
-               '_' + epoch_min + '_' + epoch_max + '_ref_' + ref_fils + \
-               '.list', 'w')
+    op1 = open(lclist_name(params['list_dir'], params['sample'],
+                           params['user_choices']), 'w')
     for item in photo_list:
         op1.write(item + '\n')
     op1.close()
@@ -267,9 +322,8 @@ def build_sample(params):
                     if new_lc.epoch_cuts:
                         shutil.copy2(data_path + rname, raw_dir + rname)
                     else:
-                        screen('... SN' + raw['SNID:'][0] + \
-                               ' fail to pass epoch cuts!',
-                               params['user_choices'])
+                        screen('... SN%s fail to pass epoch cuts!',
+                               params['user_choices'], raw['SNID:'][0])
 
 def sample_pop(user_choices, params, type_number):
     """
@@ -460,20 +514,60 @@ def set_parameters(params):
         os.makedirs(params['synthetic_dir'])
 
     # copy all mean files to synthetic directory
+    meas = params['user_choices']['measurement'][0]
     fsample = read_file(params['list_name'])
     for fname in fsample:
         new_name = params['user_choices']['file_root'][0] + \
-                   translate_snid(fname[0]) + '_mean.dat'
+                   translate_snid(fname[0], meas) + '_' + meas + '_mean.dat'
         shutil.copy2(params['fitted_data_dir'] + new_name, 
                      params['synthetic_dir'] + new_name)
 
     return params
 
 
+def check_realization(parent, indx, fil_choice):
+    """
+    Check if one GP realization satisfies epoch cuts.
+
+    input: parent, LC object
+           light curve with loaded GP realizations
+
+           indx, int
+           index of the realization to check
+
+           fil_choice, str
+           reference filter for normalization
+
+    output: LC object holding the realization as GP fit,
+            None if it does not satisfy epoch cuts
+    """
+    from snclass.treat_lc import LC
+
+    import numpy as np
+
+    draw = LC(dict(parent.raw), parent.user_choices)
+    draw.fitted = {'GP_fit': {}, 'GP_std': {}, 'xarr': {}}
+    for fil in parent.user_choices['filters']:
+        draw.fitted['GP_fit'][fil] = \
+            np.array(parent.fitted['realizations'][fil][indx])
+        draw.fitted['GP_std'][fil] = parent.fitted['GP_std'][fil]
+        draw.fitted['xarr'][fil] = parent.fitted['xarr'][fil]
+
+    draw.normalize(ref_filter=fil_choice)
+    draw.mjd_shift()
+    draw.check_epoch()
+
+    if draw.epoch_cuts:
+        return draw
+
+
 def select_GP(params, user_choices):
     """
     Select original objs to build a synthetic spectroscopic sample.
 
+    Realizations are drawn, normalized and checked in memory, in batches
+    per type. Only accepted realizations are written to disk.
+
     input: params, dict
            output from set_paramameters
 
@@ -495,6 +589,13 @@ def select_GP(params, user_choices):
     else:
         fil_choice = user_choices['ref_filter'][0] 
 
+    meas = user_choices['measurement'][0]
+
+    # choices for loading original GP realizations
+    lc_choices = dict(user_choices)
+    lc_choices['n_samples'] = ['100']
+    lc_choices['samples_dir'] = [params['fitted_data_dir']]
+
     # select extra GP realizations in order to construct 
     # a representative spec sample
     for key in params['draw_spec_samples'].keys():
@@ -505,132 +606,162 @@ def select_GP(params, user_choices):
         screen('... Check existing objs', user_choices)
         ready = []
         for obj in params['surv_spec_names'][key]:
-            obj_id = translate_snid(obj)
+            obj_id = translate_snid(obj, meas)
 
             for j in xrange(params['draw_spec_samples'][key]):
                 mean_file = params['synthetic_dir'] + '/' + \
                             user_choices['file_root'][0] + str(j) + \
-                            'X' + obj_id + '_mean.dat'
+                            'X' + obj_id + '_' + meas + '_mean.dat'
 
                 if os.path.isfile(mean_file) and mean_file not in ready:
                     cont = cont + 1
                     ready.append(mean_file)
-                    screen('Found ready SN ' + str(cont) + 'X' + \
-                           obj_id, user_choices)
+                    screen('Found ready SN %sX%s', user_choices, cont,
+                           obj_id)
 
         while cont < params['draw_spec_samples'][key]:
-        
-            # draw one of the objs in the spec sample
-            indx = np.random.randint(0, params['spec_pop'][key])
-            name = params['surv_spec_names'][key][indx]
 
-            user_choices['path_to_lc'] = [name]
+            # draw a batch of objs in the spec sample
+            nmiss = params['draw_spec_samples'][key] - cont
+            indx = np.random.randint(0, params['spec_pop'][key], size=nmiss)
+            # bincount instead of unique(return_counts), numpy < 1.9
+            counts = np.bincount(indx)
+            parents = np.nonzero(counts)[0]
+            ndraws = counts[parents]
+
+            accepted = []
+            for k in xrange(len(parents)):
+                name = params['surv_spec_names'][key][parents[k]]
+
+                lc_choices['path_to_lc'] = [name]
 
-            # read light curve raw data
-            raw = read_snana_lc(user_choices)
+                # read light curve raw data
+                raw = read_snana_lc(lc_choices)
 
-            if os.path.isfile(params['fitted_data_dir'] + user_choices['file_root'][0] + \
-                              raw['SNID:'][0] + '_samples.dat'):
+                if not os.path.isfile(params['fitted_data_dir'] + \
+                                      user_choices['file_root'][0] + \
+                                      raw['SNID:'][0] + '_' + meas + \
+                                      '_samples.dat'):
+                    continue
 
                 # initiate light curve object
-                my_lc = LC(raw, user_choices)
+                my_lc = LC(raw, lc_choices)
 
-                screen('Loading SN' + raw['SNID:'][0], user_choices)
+                screen('Loading SN%s', user_choices, raw['SNID:'][0])
 
-                # load GP fit
-                my_lc.user_choices['n_samples'] = ['100']
-                my_lc.user_choices['samples_dir'] = [params['fitted_data_dir']]
-                my_lc.load_fit_GP(params['fitted_data_dir'] + user_choices['file_root'][0] + \
-                                  raw['SNID:'][0] + '_mean.dat')
-  
+                # load GP fit, all realizations are read once
+                my_lc.load_fit_GP(params['fitted_data_dir'] + \
+                                  user_choices['file_root'][0] + \
+                                  raw['SNID:'][0] + '_' + meas + '_mean.dat')
 
                 l1 = [1  if len(my_lc.fitted['GP_fit'][fil]) > 0  else 0 
                       for fil in user_choices['filters']]
-                if sum(l1) == len(user_choices['filters']):
-
-                    # normalize
-                    my_lc.normalize(samples=True, ref_filter=fil_choice)
-
-                    # shift to peak mjd
-                    my_lc.mjd_shift()
-
-                    # check epoch requirements
-                    my_lc.check_epoch()
-
-                    if my_lc.epoch_cuts:
-
-                        screen('... Passed epoch cuts', user_choices)
-                        screen('... ... This is SN type ' +  raw[user_choices['type_flag'][0]][0] + \
-                               ' number ' + str(cont + 1) + ' of ' + 
-                               str(params['draw_spec_samples'][key]), user_choices)
-
-                        # draw one realization
-                        size = len(my_lc.fitted['realizations'][user_choices['filters'][0]])
-                        indx2 = np.random.randint(0, size)
-
-                        for fil in user_choices['filters']:
-                            print '... ... ... filter ' + fil
-
-                            raw['GP_fit'][fil] = my_lc.fitted['realizations'][fil][indx2]
-                            raw['GP_std'][fil] = my_lc.fitted['GP_std'][fil]
-                            raw['xarr'][fil] = my_lc.fitted['xarr'][fil]
- 
-                        # set new file root
-                        raw['file_root'] = [user_choices['file_root'][0] + \
-                                             str(cont) + 'X']
-                        raw['samples_dir'] = [params['synthetic_dir'] + '/']
-                        save_result(raw)
-
-                        # check epoch for this realization
-                        new_lc = LC(raw, user_choices)
-                        new_lc.load_fit_GP(params['synthetic_dir'] + '/' + \
-                                       user_choices['file_root'][0] + str(cont) + \
-                                       'X' + raw['SNID:'][0] + '_mean.dat')
-                        new_lc.normalize(ref_filter=fil_choice)
-                        new_lc.mjd_shift()
-                        new_lc.check_epoch()
+                if sum(l1) < len(user_choices['filters']):
+                    continue
 
-                        if new_lc.epoch_cuts:
-                            cont = cont + 1
-                        else:
-                            screen('Samples failed to pass epoch cuts!\n', user_choices)
-                            os.remove(params['synthetic_dir'] + '/' +
-                                      user_choices['file_root'][0] + str(cont) + \
-                                  'X' + raw['SNID:'][0] + '_mean.dat')
-                        print '\n'
+                # normalize
+                my_lc.normalize(ref_filter=fil_choice)
 
-                    else:
-                        screen('Failed to pass epoch cuts!\n', user_choices)
-                        fail = fail + 1
+                # shift to peak mjd
+                my_lc.mjd_shift()
+
+                # check epoch requirements
+                my_lc.check_epoch()
+
+                if not my_lc.epoch_cuts:
+                    screen('Failed to pass epoch cuts!\n', user_choices)
+                    fail = fail + 1
 
                     if fail > 10 * params['spec_pop'][key]:
-                        cont = 100000
                         sys.exit()
 
-def build_spec_matrix(params, type_number):
+                    continue
+
+                screen('... Passed epoch cuts', user_choices)
+
+                # draw realizations
+                size = len(my_lc.fitted['realizations'][user_choices['filters'][0]])
+                for indx2 in np.random.randint(0, size, size=ndraws[k]):
+                    draw = check_realization(my_lc, indx2, fil_choice)
+
+                    if draw is None:
+                        screen('Samples failed to pass epoch cuts!\n',
+                               user_choices)
+                    else:
+                        accepted.append(draw)
+
+            # write accepted objs
+            for draw in accepted:
+                screen('... ... This is SN type %s number %s of %s',
+                       user_choices, draw.raw[user_choices['type_flag'][0]][0],
+                       cont + 1, params['draw_spec_samples'][key])
+
+                draw.raw['GP_fit'] = draw.fitted['GP_fit']
+                draw.raw['GP_std'] = draw.fitted['GP_std']
+                draw.raw['xarr'] = draw.fitted['xarr']
+
+                # set new file root
+                draw.raw['file_root'] = [user_choices['file_root'][0] + \
+                                         str(cont) + 'X']
+                draw.raw['samples_dir'] = [params['synthetic_dir'] + '/']
+                save_result(draw.raw)
+
+                cont = cont + 1
+
+def matrix_name(mat_dir, representation, user_choices):
     """
-    Build spectroscopic data matrix.
+    Root name of the spectroscopic data matrix files.
+
+    input: mat_dir, str
+           directory to store data matrices
+
+           representation, str
+           'original', 'balanced' or 'representative'
+
+           user_choices, dict
+           output from snclass.util.read_user_input
+
+    output: str
+            data matrix is stored in <root>_data_matrix.npz
+    """
+    # build filter set
+    fils = ''.join(user_choices['filters'])
+
+    # build mjd boundaries
+    if user_choices['epoch_cut'][0][0] == '-' or \
+    user_choices['epoch_cut'][0] == '0':
+        mjd_min = user_choices['epoch_cut'][0][1:]
+    else:
+        mjd_min = 'p' + user_choices['epoch_cut'][0]
+
+    mjd_max = str(int(user_choices['epoch_cut'][1]) - 1)
+
+    # set reference filter flag
+    if user_choices['ref_filter'][0] == None:
+        fil_ref = 'global'
+    else:
+        fil_ref = user_choices['ref_filter'][0]
+
+    return mat_dir + representation + '_' + fils + '_' + mjd_min + '_' + \
+           mjd_max + '_ref_' + fil_ref
+
+
+def build_train_matrix(params):
+    """
+    Build data matrix of the synthetic spectroscopic sample.
 
     input: params, dict
            keywords: 'input_file' -> user input file
                      'synthetic_dir' -> directory with GP fitted spec sample
-                     'out_dir' -> directory to store classification results
                      'mat_dir' -> directory to store data matrices
-                     'range_pcs', list -> min and max number of PCs to be
-                                          probed during cross-validation
-                     'representation' -> type of modificationin 
+                     'representation' -> type of modificationin
 
-           type_number, dict
-           dictionary to translate types between raw data and final
-           classification
-           keywords -> final classificaton elements
-           values -> identifiers in raw data
+    output: DataMatrix object
     """
     import os
-    import numpy as np
 
     from snclass.matrix import DataMatrix
-    from snclass.functions import screen, set_types
+    from snclass.functions import screen
 
     # check matrices directory
     if not os.path.isdir(params['mat_dir']):
@@ -639,31 +770,12 @@ def build_spec_matrix(params, type_number):
     # initiate data matrix obj 
     d = DataMatrix(params['input_file'])
 
-    # build filter set
-    fils = d.user_choices['filters'][0]
-    for item in d.user_choices['filters'][1:]:
-        fils = fils + item
-
-    # build mjd boundaries
-    if d.user_choices['epoch_cut'][0][0] == '-' or \
-    d.user_choices['epoch_cut'][0] == '0':
-        mjd_min = d.user_choices['epoch_cut'][0][1:]
-    else:
-        mjd_min = 'p' + d.user_choices['epoch_cut'][0]      
-
-    mjd_max = str(int(d.user_choices['epoch_cut'][1]) - 1)
-
     # set reference filter flag
     if d.user_choices['ref_filter'][0] == None:
-        fil_ref = 'global'
         d.user_choices['ref_filter'] = [None]
         fil_choice = None
     else:
-        fil_ref = d.user_choices['ref_filter'][0]        
-        fil_choice = fil_ref
-
-    # store user defined number of samples
-    nsamples =  d.user_choices['n_samples']
+        fil_choice = d.user_choices['ref_filter'][0]
 
     # set keywords for spec sample
     d.user_choices['samples_dir'] = [params['synthetic_dir']]
@@ -673,64 +785,146 @@ def build_spec_matrix(params, type_number):
     if fil_choice == 'None':
         fil_choice = None
 
-    d.build(file_out=params['mat_dir'] + params['representation'] + '_' + \
-            fils + '_' + mjd_min + '_' + mjd_max  + '_ref_' + fil_ref + \
-            '_data_matrix.dat', ref_filter=fil_choice)
+    # matrix lines of unchanged GP fits are reused from previous builds
+    mat_name = matrix_name(params['mat_dir'], params['representation'],
+                           d.user_choices)
+    d.build(file_out=mat_name + '_data_matrix.npz', ref_filter=fil_choice,
+            cache_file=mat_name + '_cache.pkl')
+
+    # text export for inspection
+    d.store_training(mat_name + '_data_matrix.dat')
+
+    screen('Spec sample contain %s SNe.', d.user_choices, d.datam.shape[0])
 
-    screen('\n Spec sample contain ' + str(d.datam.shape[0]) + ' SNe.\n',
-           d.user_choices)
+    return d
+
+
+def train_model(d, npcs, params, type_number, orig_codes):
+    """
+    Optimize hyperparameters and store trained model for one number of PCs.
+
+    input: d, DataMatrix object
+           output from build_train_matrix
+
+           npcs, int
+           number of PCs
+
+           params, dict
+           keywords: 'out_dir' -> directory to store classification results
+
+           type_number, dict
+           dictionary to translate types between raw data and final
+           classification
+           keywords -> final classificaton elements
+           values -> identifiers in raw data
+
+           orig_codes, array
+           types of the data matrix objects, as given in raw data
+    """
+    import os
+    import numpy as np
+
+    from snclass.functions import screen, set_types, build_nneighbor
+    from snclass.model_io import save_model
 
     orig_types = []
-    for item in d.sntype:
+    for item in orig_codes:
         for names in type_number.keys():
             if item in type_number[names]:
                 orig_types.append(names)
 
     orig_types = np.array(orig_types)
 
+    screen('npcs = %s', d.user_choices, npcs)
 
-    for npcs in xrange(params['range_pcs'][0], params['range_pcs'][1]):
-
-        screen('npcs = ' + str(npcs), d.user_choices)
+    # create directories if necessary
+    hyperpar_file = params['out_dir'] + str(npcs) + 'PC/hyperpar_values.dat'
 
-        # create directories if necessary
-        hyperpar_file = params['out_dir'] + str(npcs) + 'PC/hyperpar_values.dat'
+    if not os.path.isdir(params['out_dir'] + str(npcs) + 'PC/'):
+        os.makedirs(params['out_dir']  + str(npcs) + 'PC/')
 
-        if not os.path.isdir(params['out_dir'] + str(npcs) + 'PC/'):
-            os.makedirs(params['out_dir']  + str(npcs) + 'PC/')
+    # optimize hyperparameters
+    d.user_choices['ncomp_lim'] = [str(npcs), str(npcs + 1)]
+    d.sntype = set_types(d.sntype, Ia_flag=type_number['Ia'])
+    d.cross_val()
 
-        # optimize hyperparameters
-        d.user_choices['ncomp_lim'] = [str(npcs), str(npcs + 1)]
-        d.sntype = set_types(d.sntype, Ia_flag=type_number['Ia'])
-        d.cross_val()
+    screen('Hyperparameter for %s PCs:', d.user_choices, npcs)
+    screen('     gamma: %s', d.user_choices, d.final['gamma'])
 
-        screen('Hyperparameter for ' + str(npcs) + ' PCs:', d.user_choices)
-        screen('     gamma: ' + str(d.final['gamma']), d.user_choices)
-
-        # update hyperparameter values
-        d.final_configuration()
+    # update hyperparameter values
+    d.final_configuration()
 
+    if hasattr(d.transf_test, 'alphas_'):
         # keep kpcs
         kpcs = d.transf_test.alphas_
 
         # save hyperparameter values
         pars = d.transf_test.get_params()
-
-        # open file for hyperparameter value storage
-        op1 = open(hyperpar_file, 'w')
-        for par in pars.keys():
-            op1.write(str(par) + '    ' + str(pars[par]) + '\n')
-        op1.write('ncomp    ' + str(npcs))
-        op1.write('\n\n\n')
-        for k in xrange(kpcs.shape[1]):
-            op1.write('alphas_' + str(k + 1) + '    ')
+    else:
+        # approximate kpca is rebuilt from its parameters
+        kpcs = np.zeros((0, 0))
+        pars = {}
+        for par in d.user_choices['kpca_pars']:
+            if par != 'ncomp':
+                pars[par] = d.user_choices[par]
+
+    # open file for hyperparameter value storage
+    op1 = open(hyperpar_file, 'w')
+    for par in pars.keys():
+        op1.write(str(par) + '    ' + str(pars[par]) + '\n')
+    op1.write('ncomp    ' + str(npcs))
+    op1.write('\n\n\n')
+    for k in xrange(kpcs.shape[1]):
+        op1.write('alphas_' + str(k + 1) + '    ')
+    op1.write('\n')
+
+    for line in kpcs:
+        for item in line:
+            op1.write(str(item) + '    ')
         op1.write('\n')
+    op1.close()
 
-        for line in kpcs:
-            for item in line:
-                op1.write(str(item) + '    ')
-            op1.write('\n')
-        op1.close()
+    # store trained model for fast classifier startup
+    model = {}
+    model['obj_kpca'] = d.transf_test
+    model['spec_matrix'] = d.low_dim_matrix
+    model['binary_types'] = d.sntype
+    model['labels'] = orig_types
+    model['sntype'] = orig_codes
+    model['nn_clf'] = build_nneighbor(d.low_dim_matrix, d.sntype,
+                                      d.user_choices)
+    model['pars'] = dict(pars)
+    model['pars']['ncomp'] = npcs
+    save_model(model, d.user_choices,
+               params['out_dir'] + str(npcs) + 'PC/model/')
+
+
+def build_spec_matrix(params, type_number):
+    """
+    Build spectroscopic data matrix.
+
+    input: params, dict
+           keywords: 'input_file' -> user input file
+                     'synthetic_dir' -> directory with GP fitted spec sample
+                     'out_dir' -> directory to store classification results
+                     'mat_dir' -> directory to store data matrices
+                     'range_pcs', list -> min and max number of PCs to be
+                                          probed during cross-validation
+                     'representation' -> type of modificationin 
+
+           type_number, dict
+           dictionary to translate types between raw data and final
+           classification
+           keywords -> final classificaton elements
+           values -> identifiers in raw data
+    """
+    import numpy as np
+
+    d = build_train_matrix(params)
+    orig_codes = np.array(d.sntype)
+
+    for npcs in xrange(params['range_pcs'][0], params['range_pcs'][1]):
+        train_model(d, npcs, params, type_number, orig_codes)
 
 def plot_proj(spec_matrix, data_test, labels, new_lc, plot_dir, pcs,
               true_type):
@@ -778,12 +972,12 @@ def plot_proj(spec_matrix, data_test, labels, new_lc, plot_dir, pcs,
     plt.savefig(plot_dir +  '/proj_SN' + new_lc.raw['SNID:'][0] + '.png')
     plt.close()
 
-def read_matrix(data_matrix, Ia_codes, convert_types=True):
+def read_matrix(data_matrix, Ia_codes, convert_types=True, dtype=float):
     """
     Read spectroscopic sample matrix.
 
     input: data_matrix, str
-           file holding spectroscopic matrix
+           file holding spectroscopic matrix, binary ('.npz') or text
 
            Ia_codes, list
            list of all codes corresponding to SNIa
@@ -792,6 +986,10 @@ def read_matrix(data_matrix, Ia_codes, convert_types=True):
            if True use set_types function to convert labels to binary
            default is True
 
+           dtype, numpy dtype
+           floating point type of the returned matrix
+           default is float
+
     output: data, array
             spectroscopic data matrix
 
@@ -803,26 +1001,15 @@ def read_matrix(data_matrix, Ia_codes, convert_types=True):
             if convert_types is False this is returned as None
     """
     from snclass.functions import set_types
+    from snclass.matrix import read_matrix_file
 
     import numpy as np
 
     # read data matrix and obj classes
-    op1 = open(data_matrix, 'r')
-    lin1 = op1.readlines()
-    op1.close()
-
-    data1 = [elem.split() for elem in lin1[1:]]
-
-    datam = []
-    sntype = []
-    for line in data1:
-        obj = []
-        sntype.append(line[1])
-        for item in line[3:]:
-            obj.append(float(item))
-        datam.append(obj)
+    matrix = read_matrix_file(data_matrix)
 
-    data = np.array(datam)
+    data = np.asarray(matrix['datam'], dtype=dtype)
+    sntype = list(matrix['sntype'])
 
     if convert_types:
         binary_types = set_types(sntype, Ia_flag=Ia_codes)
@@ -847,8 +1034,9 @@ def read_hyperpar(parameters):
 
     # determine types
     parameters['strings'] = ['eigen_solver', 'kernel']
-    parameters['floats'] = ['alpha', 'gamma', 'n_components']
-    parameters['ints'] = ['coef0', 'degree', 'ncomp', 'tol']
+    parameters['floats'] = ['alpha', 'gamma']
+    parameters['ints'] = ['coef0', 'degree', 'ncomp', 'tol', 'n_landmarks',
+                          'approx_seed', 'n_components']
     parameters['bools'] = ['fit_inverse_transform', 'remove_zero_eig']
     parameters['nones'] = ['kernel_params', 'max_iter']
 
@@ -864,7 +1052,7 @@ def read_hyperpar(parameters):
             if line[0] in parameters['floats']:
                 pars[line[0]] = float(line[1])
             elif line[0] in parameters['ints']:
-                pars[line[0]] = int(line[1])
+                pars[line[0]] = int(float(line[1]))
             elif line[0] in parameters['bools'] and line[1] == 'False':
                 pars[line[0]] = False
             elif line[0] in parameters['nones']:
@@ -915,23 +1103,30 @@ def set_kpca_obj(pars, data, sntype, type_number):
             classes as defined in raw data files
     """
     from sklearn.decomposition import KernelPCA
+    from snclass.functions import approx_kpca
     import numpy as np
 
-    # start kpca object
-    obj_kpca = KernelPCA()
-    obj_kpca.eigen_solver = pars['eigen_solver']
-    obj_kpca.kernel = pars['kernel']
-    obj_kpca.alpha = pars['alpha']
-    obj_kpca.gamma = pars['gamma']
-    obj_kpca.n_components = pars['n_components']
-    obj_kpca.coef0 = pars['coef0']
-    obj_kpca.degree = pars['degree']
-    obj_kpca.tol = pars['tol']
-    obj_kpca.fit_inverse_transform = pars['fit_inverse_transform']
-    obj_kpca.remove_zero_eig = pars['remove_zero_eig']
-    obj_kpca.kernel_params = pars['kernel_params']
-    obj_kpca.max_iter = pars['max_iter']
-    spec_matrix = obj_kpca.fit_transform(data)
+    if 'approx_method' in pars.keys():
+        # rebuild approximate kpca with the same landmarks
+        obj_kpca = approx_kpca(data, pars, transform=True)
+        spec_matrix = obj_kpca.transform(data)
+
+    else:
+        # start kpca object
+        obj_kpca = KernelPCA()
+        obj_kpca.eigen_solver = pars['eigen_solver']
+        obj_kpca.kernel = pars['kernel']
+        obj_kpca.alpha = pars['alpha']
+        obj_kpca.gamma = pars['gamma']
+        obj_kpca.n_components = pars['n_components']
+        obj_kpca.coef0 = pars['coef0']
+        obj_kpca.degree = pars['degree']
+        obj_kpca.tol = pars['tol']
+        obj_kpca.fit_inverse_transform = pars['fit_inverse_transform']
+        obj_kpca.remove_zero_eig = pars['remove_zero_eig']
+        obj_kpca.kernel_params = pars['kernel_params']
+        obj_kpca.max_iter = pars['max_iter']
+        spec_matrix = obj_kpca.fit_transform(data)
 
     # construct label vector
     labels = []
@@ -944,6 +1139,86 @@ def set_kpca_obj(pars, data, sntype, type_number):
 
     return obj_kpca, spec_matrix, labels
 
+def prepare_1obj(din):
+    """
+    Load and treat 1 supernova, building its realizations matrix.
+
+    input: din, dict
+           same keywords as classify_1obj
+
+    output: None if object does not satisfy epoch cuts or has no GP
+            realizations, otherwise
+            list -> [LC object, true_type, realizations matrix]
+    """
+    from snclass.util import translate_snid, read_snana_lc
+    from snclass.treat_lc import LC
+
+    # update supernova name    
+    din['user_input']['path_to_lc'] = \
+        [translate_snid(din['name'], din['user_input']['measurement'][0])[0]]
+
+    # read raw data
+    raw = read_snana_lc(din['user_input'])
+
+    # set true type
+    for names in din['type_number'].keys():
+        if raw[din['user_input']['type_flag'][0]][0] in din['type_number'][names]:
+            true_type = names
+
+    # load GP fit and test epoch cuts
+    new_lc = LC(raw, din['user_input'])
+    new_lc.user_choices['samples_dir'] = [din['p1']['photo_dir']]
+    new_lc.load_fit_GP(din['p1']['photo_dir'] + din['name'])
+
+    small_matrix = prepare_lc(new_lc, din['user_input'])
+
+    if small_matrix is not None:
+        return [new_lc, true_type, small_matrix]
+
+def prepare_lc(new_lc, user_input):
+    """
+    Treat a fitted light curve and build its realizations matrix.
+
+    input: new_lc, LC object
+           light curve with GP fit and realizations loaded
+
+           user_input, dict
+           output from read_user_input
+
+    output: None if object does not satisfy epoch cuts or has no GP
+            realizations, otherwise
+            array of normalized realizations on the data matrix grid
+    """
+    from snclass.functions import screen
+
+    l1 = [1  if len(new_lc.fitted['GP_fit'][fil]) > 0  else 0 
+          for fil in user_input['filters']]
+
+    fil_choice = user_input['ref_filter'][0]
+    if fil_choice == 'None':
+        fil_choice = None
+
+    if sum(l1) == len(user_input['filters']):
+        new_lc.normalize(samples=True, 
+                         ref_filter=fil_choice)
+        new_lc.mjd_shift()
+        new_lc.check_epoch()
+
+        if new_lc.epoch_cuts:
+
+            screen('%s', user_input, new_lc.raw['SNID:'][0],
+                   extra={'snid': new_lc.raw['SNID:'][0]})
+
+            # build matrix lines
+            new_lc.build_steps(samples=True)
+
+            # prob_Ia is a fraction of realizations, none gives no answer
+            if len(new_lc.samples_for_matrix) == 0:
+                return None
+
+            return new_lc.samples_for_matrix
+
+@timed('classify_1obj')
 def classify_1obj(din):
     """
     Perform classification of 1 supernova.
@@ -973,72 +1248,374 @@ def classify_1obj(din):
     output: class_results:
                list -> [snid, true_type, prob_Ia] 
     """
-    from snclass.functions import screen, nneighbor
-    from snclass.util import translate_snid, read_snana_lc
-    from snclass.treat_lc import LC
+    din = task_input(din)
 
-    # update supernova name    
-    din['user_input']['path_to_lc'] = [translate_snid(din['name'])[0]]
+    from snclass.functions import screen, nneighbor, blocked_transform
+    from snclass.functions import kernel_blocks
 
-    # read raw data
-    raw = read_snana_lc(din['user_input'])
+    obj = prepare_1obj(din)
 
-    # set true type
-    for names in din['type_number'].keys():
-        if raw[din['user_input']['type_flag'][0]][0] in din['type_number'][names]:
-            true_type = names
+    if obj is not None:
+        new_lc, true_type, small_matrix = obj
 
-    # load GP fit and test epoch cuts
-    new_lc = LC(raw, din['user_input'])
-    new_lc.user_choices['samples_dir'] = [din['p1']['photo_dir']]
-    new_lc.load_fit_GP(din['p1']['photo_dir'] + din['name'])
+        # transform samples
+        data_test = blocked_transform(din['p1']['obj_kpca'], small_matrix,
+                                      **kernel_blocks(din['user_input']))
 
-    l1 = [1  if len(new_lc.fitted['GP_fit'][fil]) > 0  else 0 
-          for fil in din['user_input']['filters']]
+        #classify samples
+        if 'nn_clf' in din['p1'].keys():
+            clf = din['p1']['nn_clf']
+        else:
+            clf = None
+        new_label = nneighbor(data_test, din['p1']['spec_matrix'],
+                              din['p1']['binary_types'], din['user_input'],
+                              clf=clf)
+
+        # fraction of Ia realizations, as in classify_prepared
+        ntypes = [1 for item in new_label if item == '0']
+        new_lc.prob_Ia = sum(ntypes) / float(len(new_label))
+        
+        if din['do_plot']:
+            plot_proj(din['p1']['spec_matrix'], data_test, din['p1']['labels'],
+                      new_lc, din['p1']['plot_dir'], [0,1], true_type)
+        
 
-    fil_choice = din['user_input']['ref_filter'][0]
-    if fil_choice == 'None':
-        fil_choice = None
+        # print result to screen
+        screen('SN%s,   True type: %s, prob_Ia = %s', din['user_input'],
+               new_lc.raw['SNID:'][0], true_type, new_lc.prob_Ia,
+               extra={'snid': new_lc.raw['SNID:'][0]})
 
-    if sum(l1) == len(din['user_input']['filters']):
-        new_lc.normalize(samples=True, 
-                         ref_filter=fil_choice)
-        new_lc.mjd_shift()
-        new_lc.check_epoch()
+        class_results = [new_lc.raw['SNID:'][0], true_type,
+                         new_lc.prob_Ia]
+        return class_results
 
-        if new_lc.epoch_cuts:
+@timed('classify_batch')
+def classify_batch(din):
+    """
+    Perform classification of a batch of supernovae.
 
-            screen(new_lc.raw['SNID:'][0], din['user_input'])
+    Realizations from all objects in the batch are stacked in one matrix,
+    projected in a single blocked kernel computation and classified with
+    one neighbor query. Probabilities are then recovered per object.
 
-            # build matrix lines
-            new_lc.build_steps(samples=True)
+    input: din, dict
+           same keywords as classify_1obj, with 'names' (list of str)
+           in place of 'name'
 
-            # transform samples
-            small_matrix = new_lc.samples_for_matrix
-            data_test = din['p1']['obj_kpca'].transform(small_matrix)
-
-            #classify samples
-            new_label = nneighbor(data_test, din['p1']['spec_matrix'],
-                                  din['p1']['binary_types'], din['user_input'])
-
-            # calculate final probability
-            ntypes = [1 for item in new_label if item == '0']
-            new_lc.prob_Ia = sum(ntypes) / \
-                             float(din['user_input']['n_samples'][0])
-            
-            if din['do_plot']:
-                plot_proj(din['p1']['spec_matrix'], data_test, din['p1']['labels'],
-                          new_lc, din['p1']['plot_dir'], [0,1], true_type)
-            
-
-            # print result to screen
-            screen('SN' + new_lc.raw['SNID:'][0] + \
-                   ',   True type: ' + true_type + ', prob_Ia = ' + \
-                    str(new_lc.prob_Ia), din['user_input'])
- 
-            class_results = [new_lc.raw['SNID:'][0], true_type,
-                             new_lc.prob_Ia]
-            return class_results
+    output: class_results, list
+            one [snid, true_type, prob_Ia] line for each object
+            satisfying epoch cuts
+    """
+    din = task_input(din)
+
+    objs = prepare_batch(din)
+
+    return classify_prepared(objs, din['p1'], din)
+
+@timed('classify_models')
+def classify_models(din):
+    """
+    Classify a batch of supernovae under all trained models.
+
+    Each object is loaded and treated only once and then projected and
+    classified for every number of PCs.
+
+    input: din, dict
+           same keywords as classify_batch, with p1['models'] as
+           output from load_model for each number of PCs
+
+    output: class_results, dict
+            keywords -> number of PCs
+            values -> output from classify_prepared
+    """
+    din = task_input(din)
+
+    objs = prepare_batch(din)
+
+    class_results = {}
+    for npcs in din['p1']['models'].keys():
+        class_results[npcs] = classify_prepared(objs,
+                                                din['p1']['models'][npcs],
+                                                din)
+
+    return class_results
+
+def prepare_batch(din):
+    """
+    Load and treat a batch of supernovae.
+
+    input: din, dict
+           same keywords as classify_batch
+
+    output: objs, list
+            output from prepare_1obj for objects satisfying epoch cuts
+    """
+    objs = []
+    for name in din['names']:
+        din['name'] = name
+        obj = prepare_1obj(din)
+        if obj is not None:
+            objs.append(obj)
+
+    return objs
+
+def classify_prepared(objs, model, din):
+    """
+    Classify a set of previously treated supernovae.
+
+    input: objs, list
+           output from prepare_batch
+
+           model, dict
+           keywords: obj_kpca, spec_matrix, binary_types, labels, plot_dir
+                     and optionally nn_clf
+
+           din, dict
+           same keywords as classify_batch
+
+    output: class_results, list
+            one [snid, true_type, prob_Ia] line for each object
+    """
+    from snclass.functions import screen, nneighbor, blocked_transform
+    from snclass.functions import kernel_blocks
+
+    import numpy as np
+
+    if len(objs) == 0:
+        return []
+
+    # stack realizations
+    nrows = np.array([len(obj[2]) for obj in objs])
+    big_matrix = np.vstack([obj[2] for obj in objs])
+
+    # project and classify all realizations at once, keeping the
+    # precision of the realizations
+    data_test = blocked_transform(model['obj_kpca'], big_matrix,
+                                  **kernel_blocks(din['user_input']))
+    data_test = np.asarray(data_test, dtype=big_matrix.dtype)
+    record_array('classify.realizations', big_matrix)
+    record_array('classify.projection', data_test)
+
+    if 'nn_clf' in model.keys():
+        clf = model['nn_clf']
+    else:
+        clf = None
+    new_label = nneighbor(data_test, model['spec_matrix'],
+                          model['binary_types'], din['user_input'],
+                          clf=clf)
+
+    # fraction of Ia realizations per object
+    first = np.concatenate([[0], np.cumsum(nrows)[:-1]])
+    nIa = np.add.reduceat((new_label == '0').astype(int), first)
+    prob_Ia = nIa / nrows.astype(float)
+
+    class_results = []
+    for k in xrange(len(objs)):
+        new_lc, true_type = objs[k][:2]
+        new_lc.prob_Ia = prob_Ia[k]
+
+        if din['do_plot']:
+            plot_proj(model['spec_matrix'],
+                      data_test[first[k]:first[k] + nrows[k]],
+                      model['labels'], new_lc, model['plot_dir'],
+                      [0,1], true_type)
+
+        screen('SN%s,   True type: %s, prob_Ia = %s', din['user_input'],
+               new_lc.raw['SNID:'][0], true_type, new_lc.prob_Ia,
+               extra={'snid': new_lc.raw['SNID:'][0]})
+
+        class_results.append([new_lc.raw['SNID:'][0], true_type,
+                              new_lc.prob_Ia])
+
+    return class_results
+
+def load_model(p1, npcs, type_number, user_input, matrix=None):
+    """
+    Set kpca object and spatial index for one number of PCs.
+
+    input: p1, dict
+           same keywords as classify
+
+           npcs, int
+           number of PCs
+
+           type_number, dict
+           dictionary to translate types between raw data and final
+           classification
+
+           user_input, dict
+           output from snclass.util.read_user_input
+
+           matrix, list, optional
+           output from read_matrix. If None, read from p1['data_matrix']
+           Default is None
+
+    output: model, dict
+            keywords: pars, alphas, data, sntype, binary_types,
+                      obj_kpca, spec_matrix, labels, nn_clf, plot_dir
+            if a model bundle written by build_spec_matrix exists and
+            is newer than cv_file and p1['data_matrix'] it is loaded
+            instead and alphas is not set
+    """
+    from snclass.functions import build_nneighbor
+    from snclass.model_io import has_model, load_model_bundle
+    from snclass.util import get_dtype
+
+    import os
+
+    model = {}
+    model['cv_file'] = p1['out_dir'] + str(npcs) + 'PC/hyperpar_values.dat'
+
+    if p1['plot_proj_dir'] is not None:
+        model['plot_dir'] = p1['plot_proj_dir'] + str(npcs) + 'PC/'
+        if not os.path.isdir(model['plot_dir']):
+            os.makedirs(model['plot_dir'])
+    else:
+        model['plot_dir'] = p1['plot_dir']
+
+    # use stored model bundle, if available and not older than its sources
+    bundle_dir = p1['out_dir'] + str(npcs) + 'PC/model/'
+    if has_model(bundle_dir, [model['cv_file'], p1.get('data_matrix')]):
+        model.update(load_model_bundle(bundle_dir, user_input))
+        record_array('model.spec_matrix', model['spec_matrix'])
+        record_array('model.data', model['data'])
+        return model
+
+    if matrix is None:
+        matrix = read_matrix(p1['data_matrix'], Ia_codes=type_number['Ia'],
+                             dtype=get_dtype(user_input))
+
+    model['pars'], model['alphas'] = read_hyperpar(model)
+    model['data'], model['sntype'], model['binary_types'] = matrix
+    model['obj_kpca'], model['spec_matrix'], model['labels'] = \
+        set_kpca_obj(model['pars'], model['data'], model['sntype'],
+                     type_number)
+
+    # build spatial index once for all photometric objects
+    model['nn_clf'] = build_nneighbor(model['spec_matrix'],
+                                      model['binary_types'], user_input)
+
+    record_array('model.spec_matrix', model['spec_matrix'])
+    record_array('model.data', model['data'])
+
+    return model
+
+def init_worker(shared):
+    """
+    Store trained artifacts once per pool worker.
+
+    input: shared, dict
+           keywords common to all tasks (e.g. p1, user_input, type_number,
+           do_plot)
+    """
+    WORKER_DATA.clear()
+    WORKER_DATA.update(shared)
+
+def task_input(din):
+    """
+    Complete task dictionary with artifacts stored by init_worker.
+
+    input: din, dict
+           task specific keywords (e.g. name)
+
+    output: din, dict
+            task keywords updated with shared artifacts
+    """
+    if len(WORKER_DATA) == 0:
+        return din
+
+    full = dict(WORKER_DATA)
+    full.update(din)
+
+    return full
+
+def run_tasks(func, pars, n_proc, shared=None):
+    """
+    Apply function to a list of tasks, in parallel if required.
+
+    input: func, function
+           function to be applied to each element of pars
+
+           pars, list
+           list of tasks
+
+           n_proc, int
+           number of processes. If <= 1 run in serial mode
+
+           shared, dict, optional
+           keywords common to all tasks. They are handed to each worker
+           only once, through init_worker, instead of with every task.
+           Default is None
+
+    output: results, list
+            output of func for each element of pars, in the same order
+    """
+    import sys
+    from multiprocessing import Pool
+
+    from snclass.instrument import STATE, Collect, gather
+    from snclass.resources import pool_args
+
+    if shared is None:
+        shared = {}
+
+    if n_proc > 1:
+        pool = Pool(processes=n_proc,
+                    **pool_args(n_proc, shared.get('user_input'),
+                                init_worker, (shared,)))
+        if STATE['on']:
+            my_pool = pool.map_async(Collect(func), pars)
+        else:
+            my_pool = pool.map_async(func, pars)
+        try:
+            results = my_pool.get(0xFFFF)
+        except KeyboardInterrupt:
+            print 'Interruputed by the user!'
+            sys.exit()
+
+        pool.close()
+        pool.join()
+
+        if STATE['on']:
+            results = gather(results)
+
+    else:
+        init_worker(shared)
+        results = []
+        for element in pars:
+            results.append(func(element))
+        WORKER_DATA.clear()
+
+    return results
+
+def write_class_res(out_dir, npcs, results):
+    """
+    Write classification results for one number of PCs.
+
+    input: out_dir, str
+           directory to store classification results
+
+           npcs, int
+           number of PCs
+
+           results, list
+           one [snid, true_type, prob_Ia] line for each object,
+           None for objects failing epoch cuts (skipped)
+    """
+    import os
+
+    if not os.path.isdir(out_dir + str(npcs) + 'PC/'):
+        os.makedirs(out_dir + str(npcs) + 'PC/')
+
+    op2 = open(out_dir + str(npcs) + 'PC/class_res_' + str(npcs) + 'PC.dat', 'w')
+    op2.write('SNID    true_type    prob_Ia\n')
+    for line in results:
+        if line is None:
+            continue
+        for item in line:
+            op2.write(str(item) + '    ')
+        op2.write('\n')
+    op2.close()
 
 
 def classify(p1, user_input, type_number, do_plot=False):
@@ -1055,6 +1632,12 @@ def classify(p1, user_input, type_number, do_plot=False):
                out_dir, str: directory to store classification results
                plot_proj_dir, str: directory to store projection plots
                data_matrix, str: file holding spec data matrix
+               batch_size, int, optional: if > 0, number of objects
+                                          classified together in
+                                          classify_batch
+               single_pass, bool, optional: if True, load all models
+                                            first and classify each object
+                                            under all of them at once
 
            user_input, dict
            output from snclass.util.read_user_input
@@ -1070,97 +1653,93 @@ def classify(p1, user_input, type_number, do_plot=False):
            default is False
     """
     from snclass.functions import screen
-    from snclass.util import translate_snid, read_snana_lc
+    from snclass.util import get_dtype, translate_snid, read_snana_lc
     from snclass.treat_lc import LC
+    from snclass.model_io import has_model
 
     import os
-    import sys
     import numpy as np
-    from multiprocessing import Pool
 
     # read photometric sample
+    meas = user_input['measurement'][0]
     photo_fname = read_file(p1['fname_photo_list'])
-    photo_list = [user_input['file_root'][0] + translate_snid(item[0]) + \
-                  '_mean.dat'
+    photo_list = [user_input['file_root'][0] + translate_snid(item[0], meas) + \
+                  '_' + meas + '_mean.dat'
                   for item in photo_fname 
                   if os.path.isfile(p1['photo_dir'] + 
-                                    user_input['file_root'][0] + translate_snid(item[0]) + 
-                                    '_samples.dat') and '~' not in item[0]]
+                                    user_input['file_root'][0] + translate_snid(item[0], meas) + 
+                                    '_' + meas + '_samples.dat') and '~' not in item[0]]
+
+    # keywords common to all classification tasks
+    shared = {}
+    shared['p1'] = p1
+    shared['type_number'] = type_number
+    shared['user_input'] = user_input
+    shared['do_plot'] = do_plot
+
+    # group objects in batches if required
+    if 'batch_size' in p1.keys() and int(p1['batch_size']) > 0:
+        nbatch = int(p1['batch_size'])
+    else:
+        nbatch = 0
+
+    if 'single_pass' in p1.keys() and p1['single_pass']:
+
+        # load models for all number of PCs
+        matrix = None
+        p1['models'] = {}
+        for npcs in xrange(p1['range_pcs'][0], p1['range_pcs'][1]):
+            if matrix is None and \
+               not has_model(p1['out_dir'] + str(npcs) + 'PC/model/',
+                             [p1['out_dir'] + str(npcs) +
+                              'PC/hyperpar_values.dat',
+                              p1.get('data_matrix')]):
+                matrix = read_matrix(p1['data_matrix'],
+                                     Ia_codes=type_number['Ia'],
+                                     dtype=get_dtype(user_input))
+            p1['models'][npcs] = load_model(p1, npcs, type_number,
+                                            user_input, matrix=matrix)
+
+        # scan photometric sample only once
+        nbatch = max(nbatch, 1)
+        pars = [{'names': photo_list[i:i + nbatch]}
+                for i in xrange(0, len(photo_list), nbatch)]
+
+        results = run_tasks(classify_models, pars,
+                            int(user_input['n_proc'][0]), shared=shared)
+
+        # write results for all number of PCs
+        for npcs in xrange(p1['range_pcs'][0], p1['range_pcs'][1]):
+            write_class_res(p1['out_dir'], npcs,
+                            [line for batch in results
+                             for line in batch[npcs]])
+
+        return
 
     for npcs in xrange(p1['range_pcs'][0], p1['range_pcs'][1]): 
 
-        if int(user_input['epoch_cut'][0]) < 0:
-            mjd_min = str(abs(int(user_input['epoch_cut'][0])))
-        else:
-            mjd_min = 'p' + str(abs(int(user_input['epoch_cut'][0])))
+        if not os.path.isdir(p1['out_dir'] + str(npcs) + 'PC/'):
+            os.makedirs(p1['out_dir'] + str(npcs) + 'PC/')
 
-        if int(user_input['epoch_cut'][1]) < 0:
-            mjd_max = 'm' + str(abs(int(user_input['epoch_cut'][1]) - 1))
+        p1.update(load_model(p1, npcs, type_number, user_input))
+
+        if nbatch > 0:
+            class_func = classify_batch
+            name_list = [photo_list[i:i + nbatch]
+                         for i in xrange(0, len(photo_list), nbatch)]
+            name_key = 'names'
         else:
-            mjd_max = str(int(user_input['epoch_cut'][1]) - 1)
-
-        fils = user_input['filters'][0]
-        for item in user_input['filters'][1:]:
-            fils = fils + item
-
-        out_dir = p1['out_dir']
-        plot_proj_dir = p1['plot_proj_dir']
-        p1['out_dir'] = p1['out_dir'] + str(npcs) + 'PC/'
-        p1['cv_file'] = p1['out_dir'] + 'hyperpar_values.dat'
-
-        if plot_proj_dir is not None:
-            p1['plot_proj_dir'] = p1['plot_proj_dir'] + str(npcs) + 'PC/'
-            if not os.path.isdir(p1['plot_proj_dir']):
-                os.makedirs(p1['plot_proj_dir'])
-
-        if not os.path.isdir(p1['out_dir']):
-            os.makedirs(p1['out_dir'])
-
-        p1['pars'], p1['alphas'] = read_hyperpar(p1)
-        p1['data'], p1['sntype'], p1['binary_types'] = \
-            read_matrix(p1['data_matrix'], Ia_codes=type_number['Ia'])
-        p1['obj_kpca'], p1['spec_matrix'], p1['labels'] = \
-            set_kpca_obj(p1['pars'], p1['data'], p1['sntype'], type_number)
-
-        pars = []
-        for name in photo_list:
-            ptemp = {}
-            ptemp['p1'] = p1
-            ptemp['name'] = name
-            ptemp['type_number'] = type_number
-            ptemp['user_input'] = user_input
-            ptemp['do_plot'] = do_plot
-
-            pars.append(ptemp)
-
-        if int(user_input['n_proc'][0]) > 1:
-            pool = Pool(processes=int(user_input['n_proc'][0]))
-            my_pool = pool.map_async(classify_1obj, pars)
-            try:
-                results = my_pool.get(0xFFFF)
-            except KeyboardInterrupt:
-                print 'Interruputed by the user!'
-                sys.exit()
+            class_func = classify_1obj
+            name_list = photo_list
+            name_key = 'name'
 
-            pool.close()
-            pool.join()
+        # tasks carry only object names, models are shared per worker
+        pars = [{name_key: name} for name in name_list]
 
-        else:
-            results = []
-            for element in pars:
-                results.append(classify_1obj(element))
-
-        p1['out_dir'] = out_dir
-        p1['plot_proj_dir'] = plot_proj_dir
-
-        if not os.path.isdir(p1['out_dir'] + str() + 'PC/'):
-            os.makedirs(p1['out_dir'] + str() + 'PC/')
-
-        op2 = open(p1['out_dir'] + str(npcs) + 'PC/class_res_' + str(npcs) + 'PC.dat', 'w')
-        op2.write('SNID    true_type    prob_Ia\n')
-        for line in results:
-            for item in line:
-                op2.write(str(item) + '    ')
-            op2.write('\n')
-        op2.close()
+        results = run_tasks(class_func, pars, int(user_input['n_proc'][0]),
+                            shared=shared)
+
+        if class_func == classify_batch:
+            results = [line for batch in results for line in batch]
 
+        write_class_res(p1['out_dir'], npcs, results)
@@ -0,0 +1,14 @@
+"""
+Throughput benchmarks for the classification pipeline.
+
+- synthetic:
+        Generate synthetic light curves in SNANA format.
+- pipeline:
+        Time the main pipeline stages on a synthetic sample.
+- startup:
+        Time the import of snclass modules in fresh interpreters.
+- precision:
+        Compare classification in single and double precision.
+- threads:
+        Find the best split of cores between processes and BLAS threads.
+"""
@@ -0,0 +1,286 @@
+"""
+Time the main pipeline stages on a synthetic sample.
+
+Stages are timed end to end: choose_sn, fit_objs, DataMatrix.build,
+train_model and classify, which builds the realizations matrix of each
+photometric object and projects it through the stored model. Results
+are written as JSON together with the code version and machine
+description, so runs can be compared across commits and machines.
+
+- write_user_input:
+        Write user input file for a benchmark run.
+- code_version:
+        Determine snclass version and git commit, if available.
+- machine_info:
+        Describe machine and library versions.
+- run_benchmark:
+        Generate a synthetic sample and time the pipeline stages.
+"""
+
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+import snclass
+from snclass import instrument
+from snclass.benchmark.synthetic import generate_sample, TYPE_CODES
+from snclass.benchmark.synthetic import PHOTO_SNTYPE
+
+# user choices different from the example user input file
+DEFAULT_CHOICES = {'measurement': ['flux'], 'ref_filter': ['None'],
+                   'epoch_predict': ['-3', '25'], 'screen': ['0'],
+                   'n_samples': ['0'], 'do_mcmc': ['0'],
+                   'n_cross_val_particles': ['2'],
+                   'gamma_nparticles': ['10']}
+
+
+def write_user_input(file_out, choices):
+    """
+    Write user input file for a benchmark run.
+
+    The example user input file is used as template.
+
+    input: file_out, str
+           output file
+
+           choices, dict
+           keywords -> user input keywords
+           values -> list of str, values replacing those in template
+    """
+    template = os.path.join(os.path.dirname(snclass.__file__), 'examples',
+                            'user.input')
+
+    op1 = open(template, 'r')
+    lin1 = op1.readlines()
+    op1.close()
+
+    done = []
+    op2 = open(file_out, 'w')
+    for line in lin1:
+        key = line.split()[0] if len(line.split()) > 0 else None
+        if key in choices.keys():
+            op2.write(key + ' = ' + ' '.join(choices[key]) + '  # benchmark\n')
+            done.append(key)
+        else:
+            op2.write(line)
+
+    for key in sorted(choices.keys()):
+        if key not in done:
+            op2.write(key + ' = ' + ' '.join(choices[key]) + '  # benchmark\n')
+    op2.close()
+
+
+def code_version():
+    """
+    Determine snclass version and git commit, if available.
+
+    output: dict
+            keywords: version, commit
+    """
+    version = {'version': snclass.__version__, 'commit': None}
+
+    try:
+        devnull = open(os.devnull, 'w')
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         cwd=os.path.dirname(snclass.__file__),
+                                         stderr=devnull)
+        devnull.close()
+        version['commit'] = commit.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+
+    return version
+
+
+def machine_info():
+    """
+    Describe machine and library versions.
+
+    output: dict
+    """
+    import sklearn
+
+    info = {}
+    info['host'] = platform.node()
+    info['platform'] = platform.platform()
+    info['processor'] = platform.processor()
+    info['n_cpu'] = multiprocessing.cpu_count()
+    info['python'] = platform.python_version()
+    info['numpy'] = np.__version__
+    info['sklearn'] = sklearn.__version__
+
+    return info
+
+
+def run_benchmark(work_dir, nobjs, filters=('g', 'r', 'i', 'z'),
+                  cadence=4.0, snr=20.0, type_mix=None, spec_frac=0.2,
+                  seed=0, n_proc=0, n_samples=100, npcs=2, choices=None,
+                  file_out=None):
+    """
+    Generate a synthetic sample and time the pipeline stages.
+
+    input: work_dir, str
+           directory for light curves, fits and matrices
+
+           nobjs, int
+           number of light curves
+
+           filters, cadence, snr, type_mix, spec_frac, seed
+           see snclass.benchmark.synthetic.generate_sample
+
+           n_proc, int - optional
+           number of processes. Default is 0 (serial)
+
+           n_samples, int - optional
+           number of GP realizations drawn for each photometric object.
+           Default is 100
+
+           npcs, int - optional
+           number of PCs of the trained model. Default is 2
+
+           choices, dict - optional
+           user choices replacing those in DEFAULT_CHOICES.
+           Default is None
+
+           file_out, str - optional
+           JSON file to store results. Default is None
+
+    output: results, dict
+            keywords, value type:
+                code, dict: output from code_version
+                machine, dict: output from machine_info
+                config, dict: benchmark configuration
+                stages, dict: time, number of objects and rate per stage,
+                              peak RSS in MB with memory accounting
+                accuracy, float: fraction of classified photometric
+                                 objects with correct binary classification
+                profile, dict: output from snclass.instrument.report
+    """
+    from snclass.util import read_user_input, choose_sn
+    from snclass.treat_lc import fit_objs
+    from snclass.matrix import DataMatrix
+    from snclass.algorithm import train_model, classify
+    from snclass.benchmark.precision import read_class_res
+
+    work_dir = os.path.abspath(work_dir) + '/'
+
+    results = {}
+    results['code'] = code_version()
+    results['machine'] = machine_info()
+    results['config'] = {'nobjs': nobjs, 'filters': list(filters),
+                         'cadence': cadence, 'snr': snr,
+                         'type_mix': type_mix, 'spec_frac': spec_frac,
+                         'seed': seed, 'n_proc': n_proc,
+                         'n_samples': n_samples, 'npcs': npcs}
+    results['stages'] = {}
+
+    def add_stage(name, start, nstage):
+        elapsed = time.time() - start
+        results['stages'][name] = {'time': elapsed, 'objects': nstage,
+                                   'rate': nstage / elapsed
+                                           if elapsed > 0 else None}
+        if instrument.STATE['memory']:
+            results['stages'][name]['peak_rss'] = \
+                instrument.peak_rss() / 1024.0 ** 2
+
+    profiling = instrument.STATE['on']
+    instrument.reset()
+    instrument.enable()
+
+    # generate raw data
+    start = time.time()
+    generate_sample(work_dir + 'raw/', nobjs, filters=filters,
+                    cadence=cadence, snr=snr, type_mix=type_mix,
+                    spec_frac=spec_frac, seed=seed)
+    add_stage('generate', start, nobjs)
+
+    user_choices = dict(DEFAULT_CHOICES)
+    user_choices['path_to_obs'] = [work_dir + 'raw/']
+    user_choices['filters'] = list(filters)
+    user_choices['n_proc'] = [str(n_proc)]
+    user_choices['path_output_plot'] = [work_dir]
+    if choices is not None:
+        user_choices.update(choices)
+
+    input_file = work_dir + 'user.input'
+    write_user_input(input_file, user_choices)
+
+    spec_codes = [TYPE_CODES[name][1] for name in TYPE_CODES.keys()]
+    samples = {'spec': spec_codes, 'photo': [PHOTO_SNTYPE]}
+
+    # select spectroscopic and photometric samples
+    start = time.time()
+    for name in samples.keys():
+        params = read_user_input(input_file)
+        params['sample_cut'] = samples[name]
+        choose_sn(params, output_file=work_dir + name + '.list')
+    add_stage('choose_sn', start, nobjs)
+
+    # fit all light curves, photometric objects also need realizations
+    start = time.time()
+    for name in samples.keys():
+        params = read_user_input(input_file)
+        params['snlist'] = [work_dir + name + '.list']
+        params['samples_dir'] = [work_dir + name + '_fits/']
+        if name == 'photo':
+            params['n_samples'] = [str(n_samples)]
+            fit_objs(params, calc_samp=True, save_samp=True)
+        else:
+            fit_objs(params)
+    add_stage('fit_objs', start, nobjs)
+
+    # build spectroscopic data matrix
+    start = time.time()
+    spec = DataMatrix(input_file)
+    spec.user_choices['samples_dir'] = [work_dir + 'spec_fits/']
+    spec.build(file_out=work_dir + 'spec_matrix.npz')
+    add_stage('DataMatrix.build', start, len(spec.snid))
+
+    # optimize hyperparameters and store trained model
+    type_number = dict([[name, [TYPE_CODES[name][0]]]
+                        for name in TYPE_CODES.keys()])
+    p1 = {'fname_photo_list': work_dir + 'photo.list',
+          'photo_dir': work_dir + 'photo_fits/',
+          'range_pcs': [npcs, npcs + 1], 'out_dir': work_dir + 'out/',
+          'plot_dir': None, 'plot_proj_dir': None,
+          'data_matrix': work_dir + 'spec_matrix.npz'}
+
+    start = time.time()
+    train_model(spec, npcs, p1, type_number, np.array(spec.sntype))
+    add_stage('train', start, len(spec.snid))
+
+    # classify photometric sample
+    start = time.time()
+    photo_choices = read_user_input(input_file)
+    photo_choices['n_samples'] = [str(n_samples)]
+    classify(p1, photo_choices, type_number)
+    class_res = read_class_res(p1['out_dir'] + str(npcs) + 'PC/class_res_' +
+                               str(npcs) + 'PC.dat')
+    add_stage('classify', start, len(class_res))
+
+    results['accuracy'] = float(np.mean([(class_res[snid][0] == 'Ia') ==
+                                         (class_res[snid][1] >= 0.5)
+                                         for snid in class_res.keys()]))
+
+    results['profile'] = instrument.report()
+    instrument.enable(profiling)
+
+    if file_out is not None:
+        op1 = open(file_out, 'w')
+        json.dump(results, op1, indent=2, sort_keys=True)
+        op1.close()
+
+    return results
+
+
+def main():
+    """Print documentation."""
+    print __doc__
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""
+Compare classification in single and double precision.
+
+With ``precision = float32`` in the user input file GP realizations,
+data matrices and kernel projections are stored in single precision,
+halving their memory and disk size. This module checks the effect of
+this choice on the classification of a given sample before adopting it.
+
+- read_class_res:
+        Read classification results written by algorithm.classify.
+- compare_results:
+        Compare two classification results files.
+- classify_matrix:
+        Reduce dimensionality and classify a test matrix in one precision.
+- run_precision:
+        Classify a test matrix in float64 and float32 and compare results.
+"""
+
+import json
+import time
+
+import numpy as np
+
+from snclass.algorithm import read_matrix
+from snclass.functions import blocked_transform, nneighbor
+from snclass.matrix import read_matrix_file
+
+
+def read_class_res(file_name):
+    """
+    Read classification results written by algorithm.classify.
+
+    input: file_name, str
+           class_res file, one 'SNID    true_type    prob_Ia' line per
+           object
+
+    output: dict
+            keys are SNID, values are [true_type, prob_Ia]
+    """
+    op1 = open(file_name, 'r')
+    lin1 = op1.readlines()
+    op1.close()
+
+    results = {}
+    for line in lin1[1:]:
+        data = line.split()
+        if len(data) == 3:
+            results[data[0]] = [data[1], float(data[2])]
+
+    return results
+
+
+def compare_results(file_ref, file_test, threshold=0.5):
+    """
+    Compare two classification results files.
+
+    input: file_ref, str
+           class_res file obtained in float64
+
+           file_test, str
+           class_res file obtained in float32
+
+           threshold, float - optional
+           objects with prob_Ia >= threshold are labelled Ia.
+           Default is 0.5
+
+    output: dict
+            keywords: nobjs -> number of objects in both files
+                      missing -> SNIDs present in only one file
+                      max_diff, mean_diff -> absolute difference in prob_Ia
+                      agreement -> fraction of objects with same label
+    """
+    ref = read_class_res(file_ref)
+    test = read_class_res(file_test)
+
+    common = sorted(set(ref.keys()) & set(test.keys()))
+    missing = sorted(set(ref.keys()) ^ set(test.keys()))
+
+    comp = {'nobjs': len(common), 'missing': missing}
+    if len(common) == 0:
+        comp.update({'max_diff': None, 'mean_diff': None, 'agreement': None})
+        return comp
+
+    prob_ref = np.array([ref[snid][1] for snid in common])
+    prob_test = np.array([test[snid][1] for snid in common])
+    diff = abs(prob_ref - prob_test)
+
+    comp['max_diff'] = float(diff.max())
+    comp['mean_diff'] = float(diff.mean())
+    comp['agreement'] = float(np.mean((prob_ref >= threshold) ==
+                                      (prob_test >= threshold)))
+
+    return comp
+
+
+def classify_matrix(train, binary_types, test, user_choices, dtype):
+    """
+    Reduce dimensionality and classify a test matrix in one precision.
+
+    input: train, array
+           training data matrix
+
+           binary_types, array
+           binary types of training objects, output from read_matrix
+
+           test, array
+           lines to be classified (means or GP realizations)
+
+           user_choices, dict
+           output from snclass.util.read_user_input
+
+           dtype, str or numpy dtype
+           precision used end to end
+
+    output: dict
+            keywords: labels, proj -> labels and projections of test lines
+                      time -> seconds spent
+                      nbytes -> memory held by matrices and projections
+    """
+    start = time.time()
+
+    train = np.asarray(train, dtype=dtype)
+    test = np.asarray(test, dtype=dtype)
+
+    func = user_choices['dim_reduction_func']
+    obj_kpca = func(train, user_choices, transform=True)
+    spec_matrix = np.asarray(obj_kpca.transform(train), dtype=dtype)
+    proj = np.asarray(blocked_transform(obj_kpca, test), dtype=dtype)
+
+    labels = nneighbor(proj, spec_matrix, binary_types, user_choices)
+
+    return {'labels': labels, 'proj': proj, 'time': time.time() - start,
+            'nbytes': train.nbytes + test.nbytes + spec_matrix.nbytes +
+                      proj.nbytes}
+
+
+def run_precision(data_matrix, test_matrix, user_choices, Ia_codes,
+                  file_out=None):
+    """
+    Classify a test matrix in float64 and float32 and compare results.
+
+    Kernel PCs are defined up to a sign, so projections are compared
+    after matching the sign of each component.
+
+    input: data_matrix, str
+           training matrix file written by DataMatrix.store_training
+
+           test_matrix, str
+           matrix file with lines to be classified, same format
+
+           user_choices, dict
+           output from snclass.util.read_user_input
+
+           Ia_codes, list
+           list of all codes corresponding to SNIa
+
+           file_out, str - optional
+           JSON file to store results. Default is None
+
+    output: results, dict
+            keywords: float64, float32 -> time and nbytes of each run
+                      agreement -> fraction of test lines with same label
+                      max_proj_diff -> maximum projection difference,
+                                       relative to the largest projection
+    """
+    train, sntype, binary_types = read_matrix(data_matrix, Ia_codes)
+    test = read_matrix_file(test_matrix)['datam']
+
+    runs = {}
+    for dtype in ['float64', 'float32']:
+        runs[dtype] = classify_matrix(train, binary_types, test,
+                                      user_choices, dtype)
+
+    proj_ref = np.asarray(runs['float64']['proj'], dtype=float)
+    proj_test = np.asarray(runs['float32']['proj'], dtype=float)
+    signs = np.sign((proj_ref * proj_test).sum(axis=0))
+    signs[signs == 0] = 1
+    scale = max(abs(proj_ref).max(), np.finfo(float).tiny)
+
+    results = {}
+    for dtype in runs.keys():
+        results[dtype] = {'time': runs[dtype]['time'],
+                          'nbytes': int(runs[dtype]['nbytes'])}
+    results['agreement'] = float(np.mean(runs['float64']['labels'] ==
+                                         runs['float32']['labels']))
+    results['max_proj_diff'] = float(abs(proj_ref - signs * proj_test).max() /
+                                     scale)
+
+    if file_out is not None:
+        op1 = open(file_out, 'w')
+        json.dump(results, op1, indent=2, sort_keys=True)
+        op1.close()
+
+    return results
+
+
+def main():
+    """Print documentation."""
+    print __doc__
+
+if __name__ == '__main__':
+    main()
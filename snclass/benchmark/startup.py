@@ -0,0 +1,120 @@
+"""
+Time the import of snclass modules in fresh interpreters.
+
+Plotting, scikit-learn and gptools are imported only when first needed,
+so pool workers and short command line calls do not pay for them. This
+benchmark measures import time of the main modules and reports any
+heavy package loaded by a plain import.
+
+- import_time:
+        Time the import of one module in a fresh interpreter.
+- run_startup:
+        Time the import of snclass modules and check for heavy imports.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+# modules timed by default
+MODULES = ['snclass.instrument', 'snclass.util', 'snclass.functions',
+           'snclass.fit_lc_gptools', 'snclass.treat_lc', 'snclass.matrix',
+           'snclass.algorithm', 'snclass.model_io', 'snclass.metrics',
+           'snclass.service', 'snclass.resources']
+
+# packages which must not be loaded by importing MODULES
+HEAVY = ['matplotlib', 'sklearn', 'gptools']
+
+# executed in the child interpreter, prints import time and loaded modules
+SNIPPET = 'import time; start = time.time(); import %s; ' \
+          'elapsed = time.time() - start; import sys, json; ' \
+          'print json.dumps([elapsed, sorted(sys.modules.keys())])'
+
+
+def import_time(module, repeat=5, python=None):
+    """
+    Time the import of one module in a fresh interpreter.
+
+    input: module, str
+           module name
+
+           repeat, int - optional
+           number of interpreters started. Default is 5
+
+           python, str - optional
+           python executable. If None use the current one. Default is None
+
+    output: dict
+            keywords: import_time, best import time in seconds
+                      loaded, list of modules loaded after the import
+    """
+    if python is None:
+        python = sys.executable
+
+    env = dict(os.environ)
+    env['MPLBACKEND'] = 'Agg'
+
+    best = None
+    loaded = []
+    for i in xrange(repeat):
+        out = subprocess.check_output([python, '-c', SNIPPET % module],
+                                      env=env)
+        elapsed, loaded = json.loads(out.strip().split('\n')[-1])
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return {'import_time': best, 'loaded': loaded}
+
+
+def run_startup(modules=None, heavy=None, repeat=5, file_out=None):
+    """
+    Time the import of snclass modules and check for heavy imports.
+
+    input: modules, list of str - optional
+           modules to time. If None use MODULES. Default is None
+
+           heavy, list of str - optional
+           packages which must not be loaded. If None use HEAVY.
+           Default is None
+
+           repeat, int - optional
+           number of interpreters started per module. Default is 5
+
+           file_out, str - optional
+           JSON file to store results. Default is None
+
+    output: results, dict
+            keywords: modules -> import time and heavy packages loaded
+                                 for each module
+                      violations -> modules loading heavy packages
+    """
+    if modules is None:
+        modules = MODULES
+    if heavy is None:
+        heavy = HEAVY
+
+    results = {'modules': {}, 'violations': {}}
+    for module in modules:
+        timing = import_time(module, repeat=repeat)
+        found = [name for name in heavy if name in timing['loaded']]
+
+        results['modules'][module] = {'import_time': timing['import_time'],
+                                      'heavy': found}
+        if len(found) > 0:
+            results['violations'][module] = found
+
+    if file_out is not None:
+        op1 = open(file_out, 'w')
+        json.dump(results, op1, indent=2, sort_keys=True)
+        op1.close()
+
+    return results
+
+
+def main():
+    """Print documentation."""
+    print __doc__
+
+if __name__ == '__main__':
+    main()
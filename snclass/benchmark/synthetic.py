@@ -0,0 +1,240 @@
+"""
+Generate synthetic light curves in SNANA format.
+
+Fluxes follow the phenomenological model of Bazin et al., 2009, with
+rise and fall times drawn around typical values for each class. Files
+carry the header keywords and observation lines read by
+snclass.util.read_snana_lc with the example user input file.
+
+- bazin:
+        Calculate flux from Bazin et al., 2009 parametrization.
+- draw_lc:
+        Draw observations for one synthetic supernova.
+- write_snana_lc:
+        Write one light curve in SNANA format.
+- generate_sample:
+        Generate a synthetic sample of light curves.
+"""
+
+import os
+
+import numpy as np
+
+# SIM_NON1a codes (post-SNPCC) and spectroscopic SNTYPE codes per class
+TYPE_CODES = {'Ia': ['0', '1'], 'Ibc': ['1', '32'], 'II': ['2', '21']}
+
+# photometric objects have no spectroscopic type
+PHOTO_SNTYPE = '-9'
+
+# median rise and fall times, in days, for each class
+TIME_SCALES = {'Ia': [2.0, 15.0], 'Ibc': [1.5, 10.0], 'II': [3.0, 50.0]}
+
+# zero point for conversion between FLUXCAL and magnitudes
+ZERO_POINT = 27.5
+
+
+def bazin(time, amplitude, t0, trise, tfall):
+    """
+    Calculate flux from Bazin et al., 2009 parametrization.
+
+    input: time, array
+           epochs of observations
+
+           amplitude, float
+           flux normalization
+
+           t0, float
+           reference epoch
+
+           trise, float
+           rise time
+
+           tfall, float
+           fall time
+
+    output: array
+            flux at each epoch
+    """
+    dt = time - t0
+
+    return amplitude * np.exp(-dt / tfall) / (1.0 + np.exp(-dt / trise))
+
+
+def draw_lc(sntype, filters, cadence, snr, rng, duration=(-30, 90)):
+    """
+    Draw observations for one synthetic supernova.
+
+    input: sntype, str
+           class, one of the keys of TYPE_CODES
+
+           filters, list of str
+           filters to be observed
+
+           cadence, float
+           mean number of days between observations in one filter
+
+           snr, float
+           signal to noise ratio at maximum
+
+           rng, numpy.random.RandomState
+           random number generator
+
+           duration, tuple - optional
+           first and last observing epoch, relative to t0.
+           Default is (-30, 90)
+
+    output: obs, list
+            one line per observation: [mjd, filter, flux, flux error]
+    """
+    t0 = rng.uniform(56200, 56400)
+    trise = TIME_SCALES[sntype][0] * rng.uniform(0.7, 1.3)
+    tfall = TIME_SCALES[sntype][1] * rng.uniform(0.7, 1.3)
+
+    # epochs shared by all filters, each filter observed with a small offset
+    nepochs = int((duration[1] - duration[0]) / cadence)
+    epochs = t0 + duration[0] + cadence * np.arange(nepochs) + \
+             rng.uniform(-0.3 * cadence, 0.3 * cadence, nepochs)
+
+    # flux normalization in each filter
+    amplitude = 1000.0 * rng.uniform(0.5, 1.5, len(filters))
+
+    obs = []
+    for epoch in epochs:
+        for k in xrange(len(filters)):
+            mjd = epoch + 0.02 * k
+            flux = bazin(mjd, amplitude[k], t0, trise, tfall)
+            fluxerr = amplitude[k] / snr
+            obs.append([mjd, filters[k], flux + rng.normal(0, fluxerr),
+                        fluxerr])
+
+    return obs
+
+
+def write_snana_lc(file_name, snid, header, obs):
+    """
+    Write one light curve in SNANA format.
+
+    input: file_name, str
+           output file
+
+           snid, int
+           object identifier
+
+           header, dict
+           keywords: SNTYPE, SIM_NON1a, REDSHIFT, FILTERS
+
+           obs, list
+           output from draw_lc
+    """
+    op1 = open(file_name, 'w')
+    op1.write('SURVEY: DES\n')
+    op1.write('SNID:   ' + str(snid) + '\n')
+    op1.write('SNTYPE:  ' + header['SNTYPE'] + '\n')
+    op1.write('FILTERS: ' + header['FILTERS'] + '\n')
+    op1.write('FAKE:    2   (=> simulated LC with snclass.benchmark)\n')
+    op1.write('REDSHIFT_FINAL:   %.5f +- 0.00500  (CMB)\n' %
+              header['REDSHIFT'])
+    op1.write('SIM_NON1a:      ' + header['SIM_NON1a'] + '\n\n')
+    op1.write('NOBS: ' + str(len(obs)) + '\n')
+    op1.write('NVAR: 9\n')
+    op1.write('VARLIST:  MJD  FLT FIELD   FLUXCAL   FLUXCALERR   SNR    ' +
+              'MAG     MAGERR  SIM_MAG\n')
+
+    for mjd, fil, flux, fluxerr in obs:
+        if flux > 0:
+            mag = ZERO_POINT - 2.5 * np.log10(flux)
+            magerr = 1.0857 * fluxerr / flux
+        else:
+            mag = 99.0
+            magerr = 5.0
+
+        op1.write('OBS:  %.3f  %s NULL  %.3e   %.3e  %.2f   %.3f    %.3f' \
+                  '   %.3f\n' % (mjd, fil, flux, fluxerr, flux / fluxerr,
+                                 mag, magerr, mag))
+
+    op1.write('END:\n')
+    op1.close()
+
+
+def generate_sample(out_dir, nobjs, filters=('g', 'r', 'i', 'z'),
+                    cadence=4.0, snr=20.0, type_mix=None, spec_frac=0.2,
+                    seed=0, file_root='DES_SN', first_snid=10001):
+    """
+    Generate a synthetic sample of light curves.
+
+    input: out_dir, str
+           directory to store light curves
+
+           nobjs, int
+           number of light curves
+
+           filters, list of str - optional
+           Default is ('g', 'r', 'i', 'z')
+
+           cadence, float - optional
+           mean number of days between observations. Default is 4.0
+
+           snr, float - optional
+           signal to noise ratio at maximum. Default is 20.0
+
+           type_mix, dict - optional
+           fraction of each class, keywords as in TYPE_CODES.
+           If None use {'Ia': 0.25, 'Ibc': 0.15, 'II': 0.6}.
+           Default is None
+
+           spec_frac, float - optional
+           fraction of objects with spectroscopic type. Default is 0.2
+
+           seed, int - optional
+           random seed. Default is 0
+
+           file_root, str - optional
+           root of light curve file names. Default is 'DES_SN'
+
+           first_snid, int - optional
+           identifier of first object. Default is 10001
+
+    output: names, list of str
+            light curve file names
+    """
+    if type_mix is None:
+        type_mix = {'Ia': 0.25, 'Ibc': 0.15, 'II': 0.6}
+
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    rng = np.random.RandomState(seed)
+
+    classes = sorted(type_mix.keys())
+    frac = np.array([type_mix[name] for name in classes], dtype=float)
+    draws = rng.choice(len(classes), size=nobjs, p=frac / frac.sum())
+
+    names = []
+    for i in xrange(nobjs):
+        snid = first_snid + i
+        sntype = classes[draws[i]]
+
+        header = {}
+        header['SIM_NON1a'] = TYPE_CODES[sntype][0]
+        header['REDSHIFT'] = rng.uniform(0.05, 1.2)
+        header['FILTERS'] = ''.join(filters)
+        if rng.uniform() < spec_frac:
+            header['SNTYPE'] = TYPE_CODES[sntype][1]
+        else:
+            header['SNTYPE'] = PHOTO_SNTYPE
+
+        obs = draw_lc(sntype, list(filters), cadence, snr, rng)
+
+        name = file_root + '%06d' % snid + '.DAT'
+        write_snana_lc(os.path.join(out_dir, name), snid, header, obs)
+        names.append(name)
+
+    return names
+
+
+def main():
+    """Print documentation."""
+    print __doc__
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Find the best split of cores between worker processes and BLAS threads.
+
+The same number of dense linear algebra tasks (kernel matrix,
+eigendecomposition and Cholesky factorization, as in kernel PCA and
+GP fits) is run with every split of the cores into n_proc processes of
+cores // n_proc BLAS threads each. The fastest split can then be set
+with the user choices 'n_proc' and 'blas_threads'.
+
+- linalg_task:
+        Run one dense linear algebra task.
+- time_split:
+        Time a set of tasks with a given split of cores.
+- run_threads:
+        Time all splits of the cores and pick the fastest.
+"""
+
+import json
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from snclass.resources import blas_libraries, cpu_count, limit_blas
+from snclass.resources import pool_args
+
+
+def linalg_task(pars):
+    """
+    Run one dense linear algebra task.
+
+    input: pars, list
+           [matrix size, random seed]
+
+    output: float
+            time spent, in seconds
+    """
+    size, seed = pars
+    start = time.time()
+
+    rng = np.random.RandomState(seed)
+    data = rng.normal(size=(size, 20))
+    sqdist = (data ** 2).sum(axis=1)
+    kernel = np.exp(-0.1 * (sqdist[:, None] + sqdist[None, :] -
+                            2 * np.dot(data, data.T)))
+
+    np.linalg.eigh(kernel)
+    np.linalg.cholesky(kernel + size * np.eye(size))
+
+    return time.time() - start
+
+
+def time_split(n_proc, nthreads, ntasks, size):
+    """
+    Time a set of tasks with a given split of cores.
+
+    input: n_proc, int
+           number of worker processes. If 1 run in this process
+
+           nthreads, int
+           number of BLAS threads in each process
+
+           ntasks, int
+           number of tasks
+
+           size, int
+           matrix size of each task
+
+    output: float
+            wall time, in seconds
+    """
+    pars = [[size, seed] for seed in xrange(ntasks)]
+    user_choices = {'blas_threads': [str(nthreads)]}
+
+    start = time.time()
+    if n_proc > 1:
+        pool = Pool(processes=n_proc, **pool_args(n_proc, user_choices))
+        pool.map(linalg_task, pars)
+        pool.close()
+        pool.join()
+    else:
+        with limit_blas(nthreads):
+            for item in pars:
+                linalg_task(item)
+
+    return time.time() - start
+
+
+def run_threads(ncores=None, ntasks=None, size=800, file_out=None):
+    """
+    Time all splits of the cores and pick the fastest.
+
+    input: ncores, int - optional
+           number of cores to use. If None use all. Default is None
+
+           ntasks, int - optional
+           number of tasks. If None use ncores. Default is None
+
+           size, int - optional
+           matrix size of each task. Default is 800
+
+           file_out, str - optional
+           JSON file to store results. Default is None
+
+    output: results, dict
+            keywords: ncores -> number of cores
+                      splits -> [n_proc, blas_threads, time] for each split
+                      best -> fastest [n_proc, blas_threads]
+                      libraries -> BLAS libraries found
+    """
+    if ncores is None:
+        ncores = cpu_count()
+    if ntasks is None:
+        ntasks = ncores
+
+    results = {'ncores': ncores, 'splits': [],
+               'libraries': [lib[0] for lib in blas_libraries()]}
+
+    # powers of 2 and all cores as processes
+    nprocs = [2 ** k for k in xrange(ncores) if 2 ** k < ncores] + [ncores]
+    for n_proc in nprocs:
+        nthreads = ncores // n_proc
+        elapsed = time_split(n_proc, nthreads, ntasks, size)
+        results['splits'].append([n_proc, nthreads, elapsed])
+
+    best = min(results['splits'], key=lambda line: line[2])
+    results['best'] = best[:2]
+
+    if file_out is not None:
+        op1 = open(file_out, 'w')
+        json.dump(results, op1, indent=2, sort_keys=True)
+        op1.close()
+
+    return results
+
+
+def main():
+    """Print documentation."""
+    print __doc__
+
+if __name__ == '__main__':
+    main()
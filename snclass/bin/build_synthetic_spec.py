@@ -23,6 +23,9 @@ Usage:
 
 $ build_synthetic_spec.py -i <user_input_file> -d <synthetic_sample_directory>
 
+Optional arguments --gp-cache-size and --gp-cache-mb bound the number and
+estimated memory of fitted GP objects kept for reuse (default 100, 1024).
+
 Functions:
 - check_pop:
     Check the number of objects from each time in a given sample.
@@ -35,7 +38,7 @@ Functions:
 - test_epoch:
     Check if previously calculated GP fit survives selection cuts.
 - setup_gp:
-    Set up necessary GP object.    
+    Set up necessary GP object, using a bounded cache.
 """
 
 import os
@@ -49,7 +52,8 @@ from snclass.functions import screen
 from snclass.util import translate_snid, read_user_input, choose_sn
 from snclass.util import read_snana_lc
 from snclass.treat_lc import LC
-from snclass.fit_lc_gptools import imp_gptools, save_result
+from snclass.fit_lc_gptools import imp_gptools, rebuild_gp, save_result
+from snclass.gp_cache import GPCache
 
 
 def check_pop(sample_list, user_choices):
@@ -173,9 +177,9 @@ def check_mean_GP(key, surv, draw, user_choices, synthetic_dir):
                             'X' + obj_id + '_mean.dat'
                 if os.path.isfile(mean_file) and mean_file not in ready:
                     ready.append(mean_file)
-                    screen('Found ready SN ' + str(len(ready)) + 'X' + obj_id, user_choices)
+                    screen('Found ready SN %sX%s', user_choices, len(ready), obj_id)
     else:
-        screen('type ' + str(key) + ' not present in surviving sample.')
+        screen('type %s not present in surviving sample.', user_choices, key)
     
     return ready
 
@@ -219,7 +223,7 @@ def test_epoch(key, surv, user_choices):
     # initiate light curve object
     my_lc = LC(raw, user_choices)
 
-    screen('Fitting SN' + raw['SNID:'][0], user_choices)
+    screen('Fitting SN%s', user_choices, raw['SNID:'][0])
 
     # load GP fit
     my_lc.load_fit_GP(user_choices['samples_dir'][0] + '/DES_SN' + raw['SNID:'][0] + '_mean.dat')
@@ -236,53 +240,63 @@ def test_epoch(key, surv, user_choices):
     return my_lc, raw
 
 
-def setup_gp(raw, user_choices, gp_objs):
+def setup_gp(raw, user_choices, gp_cache):
     """
     Set up necessary GP object. 
 
+    Objects are fitted once, cached GP objects are reused and evicted
+    objects are rebuilt from their stored hyperparameters.
+
     input: raw, dict
            second output from test_epoch.
 
            user_choices, dict
            output from snclass.util.read_user_input
 
-           gp_objs, dict
+           gp_cache, snclass.gp_cache.GPCache
            already calculated GP objects
 
     output: raw, dict
             update light curve data
 
-            gp_objs, dict
+            gp_cache, snclass.gp_cache.GPCache
             update set of GP objects
     """
     # list of necessary keywords
-    key_list = ['realizations', 'xarr', 'GP_std', 'GP_obj']
+    key_list = ['realizations', 'xarr', 'GP_std', 'GP_obj', 'GP_fit']
     fit_method = bool(int(user_choices['do_mcmc'][0]))
 
     for name in key_list:
         if name not in raw.keys():
             raw[name] = {}
 
-    for fil in user_choices['filters']:
-        screen('... ... filter ' + fil, user_choices)
+    snid = raw['SNID:'][0]
+    entry = gp_cache.get(snid)
 
-        if raw['SNID:'][0] not in gp_objs.keys():
-            raw = imp_gptools(raw, fil, mcmc=fit_method)
-            new_obj = raw['GP_obj'][fil]
-            draws = new_obj.draw_sample(raw['xarr'][fil],
-                                        num_samp=1)
-            raw['GP_fit'][fil] = [line[0] for line in draws]
+    if entry is None:
+        hyperpars = gp_cache.hyperpars(snid)
 
-        else:
-            new_obj = gp_objs[raw['SNID:'][0]][fil]
-            draws = new_obj.draw_sample(raw['xarr'][fil],
-                                                num_samp=1)
-            raw['GP_fit'][fil] = [line[0] for line in draws]
+        for fil in user_choices['filters']:
+            screen('... ... filter %s', user_choices, fil)
+
+            if hyperpars is None:
+                raw = imp_gptools(raw, fil, mcmc=fit_method)
+            else:
+                raw = rebuild_gp(raw, fil, hyperpars[fil])
 
-    if raw['SNID:'][0] not in gp_objs.keys():
-        gp_objs[raw['SNID:'][0]] = raw['GP_obj']
-        
-    return raw, gp_objs
+        gp_cache.put(snid, raw, user_choices['filters'])
+
+    else:
+        for name in entry.keys():
+            raw[name].update(entry[name])
+
+    # draw one realization per filter
+    for fil in user_choices['filters']:
+        draws = raw['GP_obj'][fil].draw_sample(raw['xarr'][fil],
+                                               num_samp=1)
+        raw['GP_fit'][fil] = [line[0] for line in draws]
+
+    return raw, gp_cache
 
 
 def main(args):
@@ -301,12 +315,12 @@ def main(args):
     # build complete spec list
     screen('Building spectroscopic sample.', user_choices)
     user_choices['sample_cut'] = ['1', '3', '21', '22', '23', '32', '33']
-    spec_list = choose_sn(user_choices, output_file='spec_' + \
-                          user_choices['epoch_cut'][0] + '_' + \
-                          user_choices['epoch_cut'][1] '.list')
+    name_slist = 'spec_' + user_choices['epoch_cut'][0] + '_' + \
+                 user_choices['epoch_cut'][1] + '.list'
+    spec_list = choose_sn(user_choices, output_file=name_slist)
 
     # check population according to type
-    spec_pop = check_pop('spec.list', user_choices)
+    spec_pop = check_pop(name_slist, user_choices)
 
     # count spec classes surviving selection cuts
     surv_spec = check_fitted(user_choices['samples_dir'][0], user_choices)
@@ -318,7 +332,7 @@ def main(args):
     screen('Build photometric samples.', user_choices)
     user_choices['sample_cut'] = ['-9']
     name_plist = 'photo_' + user_choices['epoch_cut'][0] + '_' + \
-                 user_choices['epoch_cut'][1] '.list'
+                 user_choices['epoch_cut'][1] + '.list'
     photo_list = choose_sn(user_choices, output_file=name_plist)
 
     # check population according to type
@@ -341,7 +355,8 @@ def main(args):
         os.makedirs(synthetic_dir)
 
     # collect gp objects
-    gp_objs = {}
+    gp_objs = GPCache(max_entries=args.gp_cache_size,
+                      max_bytes=args.gp_cache_mb * 1024 ** 2)
 
     #run through all types
     for key in spec_num.keys():
@@ -364,9 +379,8 @@ def main(args):
                             user_choices['file_root'][0] + my_lc[1]['SNID:'][0] + \
                            '_mean.dat'
 
-                screen('... This is SN type ' +  my_lc[1]['SIM_NON1a:'][0] + \
-                       ' number ' + str(len(ready) + 1) + ' of ' + 
-                       str(spec_num[key]), user_choices) 
+                screen('... This is SN type %s number %s of %s', user_choices,
+                       my_lc[1]['SIM_NON1a:'][0], len(ready) + 1, spec_num[key])
 
                 if my_lc[0].epoch_cuts and mean_name not in ready:
                     ready.append(mean_name)
@@ -410,11 +424,16 @@ def main(args):
                                   user_choices['file_root'][0] + str(cont) + \
                                   'X' + raw['SNID:'][0] + '_mean.dat')
                         fail = fail + 1
-                        screen(str(fail) + ' samples failed to pass epoch cuts!\n', user_choices)
+                        screen('%s samples failed to pass epoch cuts!', user_choices, fail)
 
                         if fail > 10 * spec_num[key]:
                             cont = 100000
 
+    stats = gp_objs.stats()
+    screen('GP cache: %s hits, %s misses, %s rebuilt from hyperparameters, '
+           '%s evictions.', user_choices, stats['hits'], stats['misses'],
+           stats['rebuilds'], stats['evictions'])
+
 
 if __name__=='__main__':
   
@@ -424,6 +443,12 @@ if __name__=='__main__':
                         required = True)
     parser.add_argument('-d', '--dir', dest='dir', 
                         help='Directory with fitted light curves.', required=True) 
+    parser.add_argument('--gp-cache-size', dest='gp_cache_size', type=int,
+                        default=100,
+                        help='Maximum number of cached GP objects.')
+    parser.add_argument('--gp-cache-mb', dest='gp_cache_mb', type=float,
+                        default=1024,
+                        help='Maximum memory of cached GP objects, in MB.')
 
     args = parser.parse_args()
    
@@ -0,0 +1,64 @@
+# Copyright 2015 Emille Ishida
+# This program is distributed under the terms of the GNU General Purpose License (GPL).
+# Refer to http://www.gnu.org/licenses/gpl.txt
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Serve classification requests from a trained model held in memory.
+
+Usage:
+
+$ classify_server.py -i <user_input_file> -m <model_bundle_directory>
+
+Optional arguments set host (--host, default 127.0.0.1), port (-p, default
+8765), maximum number of objects per batch (-b, default 32) and maximum
+time to fill a batch in seconds (-w, default 0.01).
+
+Classify a light curve with:
+
+$ curl -d '{"lc_file": "DES_SN000051.DAT"}' http://127.0.0.1:8765/classify
+"""
+
+#!/usr/bin/env python
+
+import argparse
+
+from snclass.service import serve
+
+
+def main(args):
+    """Start classification service."""
+    serve(args.input, args.model, host=args.host, port=args.port,
+          batch_size=args.batch_size, max_wait=args.max_wait)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve supernova '
+                                     'classification from a trained model.')
+    parser.add_argument('-i', '--input', dest='input', required=True,
+                        help='User input file used for training.')
+    parser.add_argument('-m', '--model', dest='model', required=True,
+                        help='Model bundle directory.')
+    parser.add_argument('--host', dest='host', default='127.0.0.1',
+                        help='Host address.')
+    parser.add_argument('-p', '--port', dest='port', type=int, default=8765,
+                        help='Port.')
+    parser.add_argument('-b', '--batch-size', dest='batch_size', type=int,
+                        default=32, help='Maximum objects per batch.')
+    parser.add_argument('-w', '--max-wait', dest='max_wait', type=float,
+                        default=0.01, help='Maximum time to fill a batch.')
+    from_user = parser.parse_args()
+
+    main(from_user)
@@ -67,7 +67,7 @@ def main(args):
 
     if bool(int(args.calculate)):
        
-        screen('Fitting SN' + lc_data['SNID:'][0], user_input)
+        screen('Fitting SN%s', user_input, lc_data['SNID:'][0])
 
         if user_input['measurement'][0] == 'flux':
             p1 = [int(user_input['epoch_predict'][0]), 
@@ -0,0 +1,149 @@
+# Copyright 2015 Emille Ishida
+# This program is distributed under the terms of the GNU General Purpose License (GPL).
+# Refer to http://www.gnu.org/licenses/gpl.txt
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Time the classification pipeline on synthetic light curves.
+
+Usage:
+
+$ run_benchmark.py -d <work_directory> -n <number_of_objects>
+                   -o <output_json_file>
+
+Optional arguments set filters (-f g r i z), cadence in days (-c),
+signal to noise ratio at maximum (-s), fraction of each type
+(-m Ia 0.25 Ibc 0.15 II 0.6), fraction of spectroscopic objects (-p),
+random seed (-r), number of processes (-j), number of GP realizations
+per photometric object (--samples) and number of PCs of the trained
+model (--npcs).
+
+$ run_benchmark.py --startup
+
+times the import of the main snclass modules instead, and exits with
+status 1 if any of them loads matplotlib, scikit-learn or gptools.
+
+$ run_benchmark.py --threads -o threads.json
+
+times dense linear algebra tasks with each split of the cores between
+processes and BLAS threads (-j cores, default all) and prints the
+fastest.
+"""
+
+#!/usr/bin/env python
+
+import argparse
+import sys
+
+from snclass.benchmark.pipeline import run_benchmark
+from snclass.benchmark.startup import run_startup
+from snclass.benchmark.threads import run_threads
+
+
+def startup(args):
+    """Run startup benchmark and print import times."""
+    results = run_startup(file_out=args.output)
+
+    for name in sorted(results['modules'].keys()):
+        module = results['modules'][name]
+        print name + ': ' + str(round(module['import_time'], 3)) + ' s' + \
+              (', loads ' + ' '.join(module['heavy'])
+               if len(module['heavy']) > 0 else '')
+
+    if len(results['violations']) > 0:
+        sys.exit(1)
+
+
+def threads(args):
+    """Run BLAS threads benchmark and print time of each split."""
+    ncores = None
+    if args.nproc > 0:
+        ncores = args.nproc
+
+    results = run_threads(ncores=ncores, file_out=args.output)
+
+    for n_proc, nthreads, elapsed in results['splits']:
+        print 'n_proc ' + str(n_proc) + ' x blas_threads ' + \
+              str(nthreads) + ': ' + str(round(elapsed, 3)) + ' s'
+
+    print 'best: n_proc = ' + str(results['best'][0]) + \
+          ', blas_threads = ' + str(results['best'][1])
+
+
+def main(args):
+    """Run benchmark and print time spent in each stage."""
+    type_mix = None
+    if args.mix is not None:
+        type_mix = dict([[args.mix[2 * i], float(args.mix[2 * i + 1])]
+                         for i in xrange(len(args.mix) // 2)])
+
+    results = run_benchmark(args.dir, args.nobjs, filters=args.filters,
+                            cadence=args.cadence, snr=args.snr,
+                            type_mix=type_mix, spec_frac=args.spec_frac,
+                            seed=args.seed, n_proc=args.nproc,
+                            n_samples=args.samples, npcs=args.npcs,
+                            file_out=args.output)
+
+    for name in ['generate', 'choose_sn', 'fit_objs', 'DataMatrix.build',
+                 'train', 'classify']:
+        stage = results['stages'][name]
+        print name + ': ' + str(round(stage['time'], 3)) + ' s, ' + \
+              str(stage['objects']) + ' objects'
+
+    print 'accuracy: ' + str(round(results['accuracy'], 3))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark snclass '
+                                     'pipeline on synthetic light curves.')
+    parser.add_argument('-d', '--dir', dest='dir', default=None,
+                        help='Working directory.')
+    parser.add_argument('-n', '--nobjs', dest='nobjs', type=int,
+                        default=200, help='Number of light curves.')
+    parser.add_argument('-o', '--output', dest='output',
+                        default='benchmark.json', help='Output JSON file.')
+    parser.add_argument('-f', '--filters', dest='filters', nargs='+',
+                        default=['g', 'r', 'i', 'z'], help='Filters.')
+    parser.add_argument('-c', '--cadence', dest='cadence', type=float,
+                        default=4.0, help='Days between observations.')
+    parser.add_argument('-s', '--snr', dest='snr', type=float,
+                        default=20.0, help='SNR at maximum.')
+    parser.add_argument('-m', '--mix', dest='mix', nargs='+', default=None,
+                        help='Type fractions, ex: Ia 0.25 Ibc 0.15 II 0.6')
+    parser.add_argument('-p', '--spec-frac', dest='spec_frac', type=float,
+                        default=0.2, help='Fraction of spectroscopic objects.')
+    parser.add_argument('-r', '--seed', dest='seed', type=int, default=0,
+                        help='Random seed.')
+    parser.add_argument('-j', '--nproc', dest='nproc', type=int, default=0,
+                        help='Number of processes.')
+    parser.add_argument('--samples', dest='samples', type=int, default=100,
+                        help='GP realizations per photometric object.')
+    parser.add_argument('--npcs', dest='npcs', type=int, default=2,
+                        help='Number of PCs of the trained model.')
+    parser.add_argument('--startup', dest='startup', action='store_true',
+                        help='Time module imports only.')
+    parser.add_argument('--threads', dest='threads', action='store_true',
+                        help='Find best split of cores between processes '
+                        'and BLAS threads.')
+    from_user = parser.parse_args()
+
+    if from_user.startup:
+        startup(from_user)
+    elif from_user.threads:
+        threads(from_user)
+    elif from_user.dir is None:
+        parser.error('argument -d/--dir is required')
+    else:
+        main(from_user)
@@ -0,0 +1,61 @@
+# Copyright 2015 Emille Ishida
+# This program is distributed under the terms of the GNU General Purpose License (GPL).
+# Refer to http://www.gnu.org/licenses/gpl.txt
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Train and classify a grid of configurations, reading each GP fit once.
+
+Usage:
+
+$ run_sweep.py -c <sweep_config.json> -j <number_of_processes>
+
+The JSON configuration holds the keywords described in
+snclass.sweep.read_grid: base user input file, fitted sample
+directories, output directory, range of PCs, type_number and the list
+of configurations. Results of each configuration are written to
+<out_dir>/<name>/.
+"""
+
+#!/usr/bin/env python
+
+import argparse
+
+from snclass.sweep import Sweep, read_grid
+
+
+def main(args):
+    """Run all configurations and print number of objects in each."""
+    params = read_grid(args.config)
+    type_number = params.pop('type_number')
+
+    summary = Sweep(params, type_number, n_proc=args.nproc).run()
+
+    for name in sorted(summary.keys()):
+        print name + ': ' + str(summary[name]['train']) + ' training, ' + \
+              str(summary[name]['classified']) + ' classified'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train and classify a '
+                                     'grid of configurations sharing the '
+                                     'loaded GP fits.')
+    parser.add_argument('-c', '--config', dest='config', required=True,
+                        help='Sweep configuration, JSON.')
+    parser.add_argument('-j', '--nproc', dest='nproc', type=int, default=1,
+                        help='Number of worker processes.')
+    from_user = parser.parse_args()
+
+    main(from_user)
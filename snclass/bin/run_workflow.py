@@ -0,0 +1,78 @@
+# Copyright 2015 Emille Ishida
+# This program is distributed under the terms of the GNU General Purpose License (GPL).
+# Refer to http://www.gnu.org/licenses/gpl.txt
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Run the classification pipeline, redoing only stages which are out of date.
+
+Usage:
+
+$ run_workflow.py -c <workflow_config.json>
+
+The JSON configuration holds the keywords described in
+snclass.workflow.build_workflow and type_number, the translation between
+raw data types and final classes. Independent stages run in parallel
+(-j, default 1). Use -t to run only some stages (and those they depend
+on), -f to run stages even if up to date and --status to list which
+stages are up to date without running anything.
+"""
+
+#!/usr/bin/env python
+
+import argparse
+import json
+
+from snclass.workflow import build_workflow
+
+
+def main(args):
+    """Run out of date pipeline stages."""
+    op1 = open(args.config, 'r')
+    p = json.load(op1)
+    op1.close()
+
+    type_number = p.pop('type_number')
+    flow = build_workflow(p, type_number, state_file=args.state,
+                          n_proc=args.nproc)
+
+    if args.status:
+        status = flow.status(targets=args.targets)
+        for name in status.keys():
+            print name + '    ' + ('up to date' if status[name] else 'to run')
+    else:
+        flow.run(targets=args.targets, force=args.force)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the classification '
+                                     'pipeline, skipping stages which are '
+                                     'up to date.')
+    parser.add_argument('-c', '--config', dest='config', required=True,
+                        help='Workflow configuration, JSON.')
+    parser.add_argument('-j', '--nproc', dest='nproc', type=int, default=1,
+                        help='Maximum number of stages running at once.')
+    parser.add_argument('-t', '--targets', dest='targets', nargs='+',
+                        default=None, help='Stages to run.')
+    parser.add_argument('-f', '--force', dest='force', nargs='+',
+                        default=None, help='Stages run even if up to date.')
+    parser.add_argument('-s', '--state', dest='state', default=None,
+                        help='State file. Default is '
+                        '<out_dir>/workflow_state.json.')
+    parser.add_argument('--status', dest='status', action='store_true',
+                        help='List stages which are up to date and exit.')
+    from_user = parser.parse_args()
+
+    main(from_user)
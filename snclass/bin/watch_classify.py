@@ -0,0 +1,72 @@
+# Copyright 2015 Emille Ishida
+# This program is distributed under the terms of the GNU General Purpose License (GPL).
+# Refer to http://www.gnu.org/licenses/gpl.txt
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Watch the raw data directory and classify new light curves as they arrive.
+
+Usage:
+
+$ watch_classify.py -i <user_input_file> -m <model_bundle_directory>
+                    -o <results_file>
+
+New or changed files in path_to_obs are fitted in a pool of processes
+(-j, default 1) and classified in batches (-b, default 32). The directory
+is scanned every -t seconds (default 10) and at most -q files wait in each
+stage (default 64). Results are appended to the output file as soon as
+they are available. Stop with Ctrl-C.
+"""
+
+#!/usr/bin/env python
+
+import argparse
+
+from snclass.ingest import Ingestor
+from snclass.util import read_user_input
+
+
+def main(args):
+    """Start watching raw data directory."""
+    user_choices = read_user_input(args.input)
+
+    ingestor = Ingestor(user_choices, args.model, args.output,
+                        n_proc=args.nproc, poll=args.poll,
+                        max_queue=args.max_queue,
+                        batch_size=args.batch_size)
+    ingestor.run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Classify new light '
+                                     'curves as they arrive.')
+    parser.add_argument('-i', '--input', dest='input', required=True,
+                        help='User input file used for training.')
+    parser.add_argument('-m', '--model', dest='model', required=True,
+                        help='Model bundle directory.')
+    parser.add_argument('-o', '--output', dest='output',
+                        default='class_res_stream.dat',
+                        help='Results file.')
+    parser.add_argument('-j', '--nproc', dest='nproc', type=int, default=1,
+                        help='Number of GP fitting processes.')
+    parser.add_argument('-t', '--poll', dest='poll', type=float,
+                        default=10.0, help='Seconds between scans.')
+    parser.add_argument('-q', '--max-queue', dest='max_queue', type=int,
+                        default=64, help='Maximum files waiting per stage.')
+    parser.add_argument('-b', '--batch-size', dest='batch_size', type=int,
+                        default=32, help='Maximum objects per batch.')
+    from_user = parser.parse_args()
+
+    main(from_user)
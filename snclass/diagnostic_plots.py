@@ -12,6 +12,10 @@ supernova classification.
     Calculate efficiency, purity and figure of merit per redshift bin.
 - calc_global_diag:
     Calculate global efficiency, purity and figure of merit.
+- calc_threshold_diag:
+    Calculate global diagnostics for all thresholds and number of PCs.
+- calc_bootstrap:
+    Calculate bootstrap confidence bands for all number of PCs.
 - count_pop:
     Count original population from spec and photo samples.
 - read_literature_results:
@@ -134,14 +138,13 @@ def det_threshold(params):
     import numpy as np
 
     # calculate distance for best auc curve
-    dist = [np.sqrt((params['tpr_set'][params['final_npcs'] - 2][i] - 1.0) ** 2 + \
-                    (params['fpr_set'][params['final_npcs'] - 2][i]) ** 2)
-            for i in xrange(len(params['tpr_set'][params['final_npcs'] - 2]))]
+    tpr = np.asarray(params['tpr_set'][params['final_npcs'] - 2])
+    fpr = np.asarray(params['fpr_set'][params['final_npcs'] - 2])
+    dist = np.sqrt((tpr - 1.0) ** 2 + fpr ** 2)
 
-    params['dist_set'] = dist
+    params['dist_set'] = list(dist)
 
-    min_dist = min(dist)
-    threshold_indx = dist.index(min_dist)
+    threshold_indx = np.argmin(dist)
 
     #threshold_result = params['threshold_set'][params['final_npcs'] - 2][threshold_indx]
     threshold_result = 1.0
@@ -155,9 +158,9 @@ def det_threshold(params):
             gamma = float(line[1])
             break
 
-    screen('Number of PCs: ' + str(params['final_npcs']), params)
-    screen('gamma: ' + str(gamma), params)
-    screen('threshold: ' + str(threshold_result), params)
+    screen('Number of PCs: %s', params, params['final_npcs'])
+    screen('gamma: %s', params, gamma)
+    screen('threshold: %s', params, threshold_result)
 
     op3 = open(params['class_res_dir'] + 'ROC_results.dat', 'w')
     op3.write('ncomp: ' + str(params['final_npcs']) + '\n')
@@ -186,68 +189,20 @@ def calc_binned_diag(params):
                 effB, list: global efficiency before cuts per redshift bin
                 fomb, list: global figure of merit before cuts per z bin
     """
+    from snclass.metrics import class_arrays, binned_diag
+
     prob_limit =  params['config']['threshold:']
 
     # calculate diagnostic per redshift bin
-    cc_Ia_bins = [sum([1 for key in params['class_res'].keys() 
-                        if params['class_res'][key][1] >=  prob_limit and \
-                        params['class_res'][key][0] == 'Ia' and \
-                        (i * params['dz']) <= params['orig_pop'][key][2] and \
-                        params['orig_pop'][key][2] < (i + 1) * params['dz']])
-                        for i in xrange(params['nbins'])]
-
-    tot_Ia_bins = [sum([1 for key in params['class_res'].keys() 
-                        if params['class_res'][key][0] == 'Ia' and \
-                        (i * params['dz']) <= params['orig_pop'][key][2] and \
-                        params['orig_pop'][key][2]  < (i + 1) * params['dz']])  
-                        for i in xrange(params['nbins'])]
-
-    tot_nonIa_bins = [sum([1 for key in params['class_res'].keys() 
-                      if params['class_res'][key][0] in ['Ibc','II'] and \
-                      (i * params['dz']) <= params['orig_pop'][key][2] and \
-                      params['orig_pop'][key][2] < (i + 1) * params['dz']])
-                      for i in xrange(params['nbins'])]
-
-    wc_Ia_bins = [sum([1 for key in params['class_res'].keys() 
-                  if params['class_res'][key][1] >= prob_limit and \
-                  params['class_res'][key][0] in ['Ibc', 'II'] and \
-                  (i * params['dz']) <= params['orig_pop'][key][2] and \
-                  params['orig_pop'][key][2] < (i + 1) * params['dz']])
-                  for i in xrange(params['nbins'])]
-
-    eff_bin = []
-    pur_bin = []
-    fom_bin = []
-    effb_bin = []
-    fomb_bin = []
-
-    for i in xrange(params['nbins']):
-        if tot_Ia_bins[i] > 0 and (cc_Ia_bins[i] + wc_Ia_bins[i]) > 0 and \
-        params['orig_Ia_bins'][i] > 0:
-
-            eff_temp = cc_Ia_bins[i] / float(tot_Ia_bins[i])
-            pur_temp = float(cc_Ia_bins[i]) / (cc_Ia_bins[i] + wc_Ia_bins[i])
-            effb_temp = cc_Ia_bins[i] / float(params['orig_Ia_bins'][i])
-
-            eff_bin.append(eff_temp)
-            pur_bin.append(pur_temp)
-            fom_bin.append(eff_temp * pur_temp)
-            effb_bin.append(effb_temp)
-            fomb_bin.append(effb_temp * pur_temp)
-
-        else:
-            eff_bin.append(0)
-            pur_bin.append(0)
-            fom_bin.append(0)
-            effb_bin.append(0)
-            fomb_bin.append(0)
-
+    res = class_arrays(params['class_res'], params['orig_pop'])
+    diag = binned_diag(res, [prob_limit], params['dz'], params['nbins'],
+                       params['orig_Ia_bins'])
 
-    params['eff_bin'] = eff_bin
-    params['pur_bin'] = pur_bin
-    params['fom_bin'] = fom_bin
-    params['effb_bin'] = effb_bin
-    params['fomb_bin'] = fomb_bin
+    params['eff_bin'] = list(diag['eff'][0])
+    params['pur_bin'] = list(diag['pur'][0])
+    params['fom_bin'] = list(diag['fom'][0])
+    params['effb_bin'] = list(diag['effb'][0])
+    params['fomb_bin'] = list(diag['fomb'][0])
 
     return params
 
@@ -270,29 +225,129 @@ def calc_global_diag(params):
                 fomb, float: global figure of merit before cuts
                
     """
+    from snclass.metrics import class_arrays, global_diag
+
     prob_limit = params['config']['threshold:']
 
     # calculate global diagnostic
-    cc_Ia = sum([1 for key in params['class_res'].keys() 
-                 if params['class_res'][key][1] >= prob_limit and \
-                 params['class_res'][key][0] == 'Ia'])
+    res = class_arrays(params['class_res'])
+    diag = global_diag(res, [prob_limit], params['orig_photo_Ia'])
+
+    for key in ['eff', 'pur', 'fom', 'effb', 'fomb']:
+        params[key] = diag[key][0]
+
+    return params
+
+def calc_threshold_diag(params, thresholds):
+    """
+    Calculate global diagnostics for all thresholds and number of PCs.
+
+    input: params, dict
+           keywords, value type:
+               range_pcs, list: [min_number_pcs, max_number_pcs]
+               class_res_dir, str: directory holding classification results
+               orig_photo_Ia, int: number of SN Ia in original sample
+
+           thresholds, array
+           probability thresholds to be scanned
+
+    output: params, dict
+            additional keywords, value type:
+                threshold_diag, dict: keywords -> number of PCs
+                                      values -> output from
+                                                snclass.metrics.global_diag
+    """
+    from snclass.algorithm import read_file
+    from snclass.metrics import class_arrays, global_diag
+
+    params['threshold_diag'] = {}
+
+    for npcs in xrange(params['range_pcs'][0], params['range_pcs'][1]):
+
+        # read classification results
+        data1 = read_file(params['class_res_dir'] + str(npcs) + \
+                          'PC/class_res_' + str(npcs) + 'PC.dat')
+
+        class_res = dict([[line[0], [line[1], float(line[2])]]
+                          for line in data1[1:]])
 
-    tot_Ia = sum([1 for key in params['class_res'].keys() 
-                  if params['class_res'][key][0] == 'Ia'])
+        res = class_arrays(class_res)
+        params['threshold_diag'][npcs] = global_diag(res, thresholds,
+                                                     params['orig_photo_Ia'])
 
-    tot_nonIa = sum([1 for key in params['class_res'].keys() 
-                     if params['class_res'][key][0] in ['Ibc','II']])
+    return params
 
-    wc_Ia = sum([1 for key in params['class_res'].keys() 
-                 if params['class_res'][key][1] >= prob_limit and \
-                 params['class_res'][key][0] in ['Ibc', 'II']])
+def calc_bootstrap(params, thresholds, nboot=1000, n_proc=1, seed=0):
+    """
+    Calculate bootstrap confidence bands for all number of PCs.
 
-    params['eff'] = cc_Ia/float(tot_Ia)
-    params['pur'] = float(cc_Ia) / (cc_Ia + wc_Ia)
-    params['fom'] =  params['eff'] * params['pur']
+    input: params, dict
+           keywords, value type:
+               range_pcs, list: [min_number_pcs, max_number_pcs]
+               class_res_dir, str: directory holding classification results
+               orig_photo_Ia, int: number of SN Ia in original sample
+               orig_pop, dict: snid: [sample, type, redshift]
+               orig_Ia_bins, list: number of SN Ia per redshift bin in
+                                   original sample
+               dz, float: width of redshift bin
+               nbins, int: number of redshift bins
+
+           thresholds, array
+           probability thresholds
 
-    params['effb'] = cc_Ia / float(params['orig_photo_Ia'])
-    params['fomb'] = params['effb'] * params['pur']
+           nboot, int - optional
+           number of bootstrap resamples. Default is 1000
+
+           n_proc, int - optional
+           number of processes, one configuration per process.
+           Default is 1
+
+           seed, int - optional
+           random seed, configuration with npcs PCs uses seed + npcs.
+           Default is 0
+
+    output: params, dict
+            additional keywords, value type:
+                bootstrap, dict: keywords -> number of PCs
+                                 values -> output from
+                                           snclass.metrics.bootstrap_config
+    """
+    from snclass.algorithm import read_file
+    from snclass.metrics import bootstrap_config
+    from snclass.resources import pool_args
+    from multiprocessing import Pool
+
+    npcs_list = range(params['range_pcs'][0], params['range_pcs'][1])
+
+    pars = []
+    for npcs in npcs_list:
+
+        # read classification results
+        data1 = read_file(params['class_res_dir'] + str(npcs) + \
+                          'PC/class_res_' + str(npcs) + 'PC.dat')
+
+        ptemp = {}
+        ptemp['class_res'] = dict([[line[0], [line[1], float(line[2])]]
+                                   for line in data1[1:]])
+        ptemp['thresholds'] = thresholds
+        ptemp['nboot'] = nboot
+        ptemp['seed'] = seed + npcs
+        ptemp['orig_Ia'] = params['orig_photo_Ia']
+        ptemp['orig_pop'] = params['orig_pop']
+        ptemp['dz'] = params['dz']
+        ptemp['nbins'] = params['nbins']
+        ptemp['orig_Ia_bins'] = params['orig_Ia_bins']
+        pars.append(ptemp)
+
+    if n_proc > 1:
+        pool = Pool(processes=n_proc, **pool_args(n_proc))
+        results = pool.map(bootstrap_config, pars)
+        pool.close()
+        pool.join()
+    else:
+        results = [bootstrap_config(ptemp) for ptemp in pars]
+
+    params['bootstrap'] = dict(zip(npcs_list, results))
 
     return params
 
@@ -351,25 +406,18 @@ def count_pop(params, type_number):
 
     params['orig_pop'] = orig_pop
 
-    all_sn = np.array(orig_pop.values())
-    orig_photo_Ia = sum([1 for key in orig_pop.keys() 
+    photo_Ia = np.array([orig_pop[key][2] for key in orig_pop.keys()
                          if orig_pop[key][0] == 'photo' and \
-                         orig_pop[key][1] == 'Ia'])
-
-    params['orig_photo_Ia'] = orig_photo_Ia
+                         orig_pop[key][1] == 'Ia'], dtype=float)
 
-    orig_Ia_bins = []
-    for i in xrange(params['nbins']):
-        cont = 0
-        for key in orig_pop.keys():
-            if orig_pop[key][0] == 'photo' and orig_pop[key][1] == 'Ia':
-                if  (orig_pop[key][2] >= i * params['dz']) and  \
-                (orig_pop[key][2] < (i + 1) * params['dz']):
-                    cont = cont + 1
+    params['orig_photo_Ia'] = len(photo_Ia)
 
-        orig_Ia_bins.append(cont)
+    edges = np.array([i * params['dz'] for i in xrange(params['nbins'] + 1)])
+    bins = np.digitize(photo_Ia, edges) - 1
+    orig_Ia_bins = np.bincount(bins[(bins >= 0) & (bins < params['nbins'])],
+                               minlength=params['nbins'])
 
-    params['orig_Ia_bins'] = orig_Ia_bins
+    params['orig_Ia_bins'] = list(orig_Ia_bins)
 
     return params
 
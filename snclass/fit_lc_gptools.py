@@ -3,6 +3,15 @@ Created by Emille Ishida in May, 2015.
 
 Function for performing Gaussian Process fit using gptools.
 
+- init_gp:
+         Set up Gaussian Process object and prediction grid for one filter.
+
+- get_hyperpars:
+         Return free hyperparameters of a fitted Gaussian Process object.
+
+- rebuild_gp:
+         Rebuild Gaussian Process from known hyperparameters, without fitting.
+
 - imp_gptools:
          Perform Gaussian Process with gptools through MCMC.
 
@@ -11,12 +20,14 @@ Function for performing Gaussian Process fit using gptools.
 """
 
 import numpy as np
-import gptools
 import os
 
-def imp_gptools(data, fil, mcmc=True, p=None):
+from snclass.instrument import timed
+from snclass.log import LOGGER
+
+def init_gp(data, fil, p=None):
     """
-    Perform Gaussian Process with gptools through MCMC.
+    Set up Gaussian Process object and prediction grid for one filter.
 
     input: data, dict
            dictionary of raw data
@@ -25,10 +36,6 @@ def imp_gptools(data, fil, mcmc=True, p=None):
 
            fil, str
            filter
-        
-           mcmc, bool, optional
-           if True, optimize kernel parameters using mcmc
-           Default is True
 
            p, list of integers
            lower and upper bound where the GP fit is required
@@ -36,8 +43,10 @@ def imp_gptools(data, fil, mcmc=True, p=None):
            default is None
 
     output: data, dict
-            updated dictionary with GP results
+            updated dictionary with GP object and grid
     """
+    import gptools
+
     # format data
     mjd = data[fil][:, 0]
     flux = data[fil][:, 1]
@@ -56,15 +65,95 @@ def imp_gptools(data, fil, mcmc=True, p=None):
     else:
         data['xarr'][fil] = np.arange(min(mjd)-100, max(mjd)+100, 0.2)
 
+    return data
+
+
+def get_hyperpars(gp_obj):
+    """
+    Return free hyperparameters of a fitted Gaussian Process object.
+
+    input: gp_obj, gptools.GaussianProcess
+
+    output: numpy.array
+    """
+    return np.array(gp_obj.free_params[:], dtype=float)
+
+
+@timed('rebuild_gp')
+def rebuild_gp(data, fil, hyperpars, p=None):
+    """
+    Rebuild Gaussian Process from known hyperparameters, without fitting.
+
+    input: data, dict
+           dictionary of raw data
+           output from read_snana_lc
+           keys: filters
+
+           fil, str
+           filter
+
+           hyperpars, array
+           output from get_hyperpars
+
+           p, list of integers
+           see imp_gptools. Default is None
+
+    output: data, dict
+            updated dictionary with GP results
+    """
+    data = init_gp(data, fil, p=p)
+    data['GP_obj'][fil].update_hyperparameters(np.array(hyperpars))
+
+    out = data['GP_obj'][fil].predict(data['xarr'][fil], use_MCMC=False)
+    data['GP_fit'][fil] = out[0]
+    data['GP_std'][fil] = out[1]
+
+    return data
+
+
+@timed('imp_gptools')
+def imp_gptools(data, fil, mcmc=True, p=None):
+    """
+    Perform Gaussian Process with gptools through MCMC.
+
+    input: data, dict
+           dictionary of raw data
+           output from read_snana_lc
+           keys: filters
+
+           fil, str
+           filter
+        
+           mcmc, bool, optional
+           if True, optimize kernel parameters using mcmc
+           Default is True
+
+           p, list of integers
+           lower and upper bound where the GP fit is required
+           if None use min and max values from mjd data
+           default is None
+
+    output: data, dict
+            updated dictionary with GP results
+    """
+    data = init_gp(data, fil, p=p)
+
     if mcmc:
-        out = data['GP_obj'][fil].predict(data['xarr'][fil], use_MCMC=True, full_MCMC=True,
-                                          return_std=False,
-                                          num_proc=int(data['n_proc'][0]),
-                                          nsamp=int(data['nsamp_mcmc'][0]),
-                                          plot_posterior=False,
-                                          plot_chains=False,
-                                          burn=int(data['burn'][0]),
-                                          thin=int(data['thin'][0]))
+        from snclass.resources import blas_threads, limit_blas
+
+        num_proc = int(data['n_proc'][0])
+        pars = {'use_MCMC': True, 'full_MCMC': True, 'return_std': False,
+                'num_proc': num_proc, 'nsamp': int(data['nsamp_mcmc'][0]),
+                'plot_posterior': False, 'plot_chains': False,
+                'burn': int(data['burn'][0]), 'thin': int(data['thin'][0])}
+
+        if num_proc > 1:
+            # MCMC workers are forked by gptools and inherit the BLAS setting
+            with limit_blas(blas_threads(num_proc, data)):
+                out = data['GP_obj'][fil].predict(data['xarr'][fil], **pars)
+        else:
+            # serial MCMC keeps the setting of the calling process
+            out = data['GP_obj'][fil].predict(data['xarr'][fil], **pars)
 
     else:
         data['GP_obj'][fil].optimize_hyperparameters()
@@ -74,11 +163,11 @@ def imp_gptools(data, fil, mcmc=True, p=None):
     data['GP_std'][fil] = out[1]
 
     del out
-    del k_obj
 
     return data
 
 
+@timed('save_result')
 def save_result(data, mean=True, samples=False):
     """
     Save results of GP fit to file.
@@ -149,10 +238,11 @@ def save_result(data, mean=True, samples=False):
         op2.close()
 
 
+@timed('samp_mcmc')
 def samp_mcmc(fil, data, screen=False):
 
     if screen:
-        print '... ... calculate samples'
+        LOGGER.info('... ... calculate samples')
 
     # update hyperparameters values
     sampler = data['GP_obj'][fil].sample_hyperparameter_posterior()
@@ -180,7 +270,7 @@ def samp_mcmc(fil, data, screen=False):
         if flag == 0:
             draws.append(new_out)
         elif screen:
-            print 'Discharged!'
+            LOGGER.info('Discharged!')
 
         del new_out
 
@@ -194,7 +284,7 @@ def run_filters(data, fil, do_mcmc, screen=False, mean=True, samples=False, pred
 
 
     if screen:
-        print '... filter: ' + fil
+        LOGGER.info('... filter: %s', fil)
 
     if mean:
         data = imp_gptools(data, fil, mcmc=do_mcmc, p=predict)
@@ -262,9 +352,6 @@ def fit_lc(data, mean=True, samples=False, screen=False, do_mcmc=True,
 
     save_result(data, mean=save_mean, samples=save_samples)
 
-    if screen:
-        print '\n'
-
     return data
 
 
@@ -9,6 +9,21 @@ Stand alone functions for supernova classification.
 - kpca:
         Perform dimensionality reduction using kernel PCA.
 
+- approx_kpca:
+        Perform approximate kernel PCA for large training samples.
+
+- kernel_blocks:
+        Read kernel tile sizes and memory budget from user choices.
+
+- tiled_kernel_transform:
+        Project data matrix into kernel PCA space one kernel tile at a time.
+
+- blocked_transform:
+        Project data matrix into a fitted reduction space in blocks of rows.
+
+- build_nneighbor:
+        Build a nearest neighbour classifier with a reusable spatial index.
+
 - nneighbor:
         Classify a given data matrix according to its n nearst neighbours.
 
@@ -18,39 +33,71 @@ Stand alone functions for supernova classification.
 - calc_scores:
         Calculate classification results for 1 data matrix.
 
+- split_sample:
+        Separate data matrix in training and validation samples.
+
 - core_cross_val:
         Perform 1/3 validation.
+
+- subsample_score:
+        Calculate classification results for a subsample of the training set.
+
+- core_cross_val_halving:
+        Perform 1/3 validation with successive halving of configurations.
 """
 
 from __future__ import division
 
+import hashlib
+from collections import OrderedDict
+from logging import DEBUG, INFO
+
 import numpy as np
-from scipy.stats import uniform
 
-from sklearn.decomposition import KernelPCA
-from sklearn import neighbors
+import snclass
+from snclass.instrument import timed
+from snclass.log import LOGGER
 
-from scipy.sparse.linalg.eigen.arpack import ArpackNoConvergence
+# fitted nearest neighbour classifiers, keyed on training sample content
+NN_CACHE = OrderedDict()
+NN_CACHE_SIZE = 4
 
-import snclass
+# bytes per kernel tile element, counting temporaries of pairwise_kernels
+KERNEL_BYTES = 32
 
 #########################################
 
 
-def screen(message, choices):
+def screen(message, choices, *args, **kwargs):
     """
     Print message on screen according to users choice.
 
+    Messages go through the snclass logger (see snclass.log), at level
+    INFO if the user chose screen = 1 and DEBUG otherwise. They are only
+    formatted if they are going to be shown.
+
     input:   message, str
-             message to be printed
+             message to be printed, may hold % formatting placeholders
 
              choices, dict
              dictionary of users choices
+
+             args - optional
+             values for the placeholders in message
+
+             extra, dict - optional
+             fields attached to the message (e.g. snid, stage)
     """
-    if bool(int(choices['screen'][0])):
-        print message
+    if choices['screen'][0] != '0':
+        level = INFO
+    else:
+        level = DEBUG
 
+    if LOGGER.isEnabledFor(level):
+        LOGGER.log(level, message, *args, **kwargs)
 
+
+@timed('kpca')
 def kpca(data_matrix, pars, transform=False):
     """
     Perform dimensionality reduction using kernel PCA.
@@ -69,8 +116,68 @@ def kpca(data_matrix, pars, transform=False):
             lines are objects.
             collumns are projections over different kPCs.
     """
+    from sklearn.decomposition import KernelPCA
+
     obj_kpca = KernelPCA(kernel=pars['kernel'], gamma=pars['gamma'],
-                         n_components=pars['ncomp'])
+                         n_components=int(pars['ncomp']))
+    x_kpca = obj_kpca.fit_transform(data_matrix)
+
+    if transform:
+        return obj_kpca
+    else:
+        return x_kpca
+
+
+def approx_kpca(data_matrix, pars, transform=False):
+    """
+    Perform approximate kernel PCA for large training samples.
+
+    The kernel feature map is approximated using a set of Nystroem
+    landmarks or random Fourier features and followed by linear PCA.
+    Memory and time scale linearly with the number of objects.
+
+    input: data_matrix, array
+
+           pars, dict
+           dictionary of parameters.
+           keywords: 'kernel', 'gamma', 'ncomp',
+                     'approx_method' -> 'nystroem' or 'fourier'
+                     'n_landmarks' -> number of landmarks or features
+                     'approx_seed' -> optional, default is 0
+
+           transform, bool
+           if True return the fitted object for further projections.
+           Default is False.
+
+    output: X_kpca, array
+            lines are objects.
+            collumns are projections over different approximate kPCs.
+    """
+    from sklearn.decomposition import PCA
+    from sklearn.kernel_approximation import Nystroem, RBFSampler
+    from sklearn.pipeline import Pipeline
+
+    if 'approx_seed' in pars.keys():
+        seed = int(pars['approx_seed'])
+    else:
+        seed = 0
+
+    if pars['approx_method'] == 'nystroem':
+        feature_map = Nystroem(kernel=pars['kernel'], gamma=pars['gamma'],
+                               n_components=int(pars['n_landmarks']),
+                               random_state=seed)
+    elif pars['approx_method'] == 'fourier':
+        if pars['kernel'] != 'rbf':
+            raise ValueError('Random Fourier features require rbf kernel!')
+        feature_map = RBFSampler(gamma=pars['gamma'],
+                                 n_components=int(pars['n_landmarks']),
+                                 random_state=seed)
+    else:
+        raise ValueError('Unknown approx_method: ' +
+                         str(pars['approx_method']))
+
+    obj_kpca = Pipeline([('feature_map', feature_map),
+                         ('pca', PCA(n_components=int(pars['ncomp'])))])
     x_kpca = obj_kpca.fit_transform(data_matrix)
 
     if transform:
@@ -79,7 +186,241 @@ def kpca(data_matrix, pars, transform=False):
         return x_kpca
 
 
-def nneighbor(test, data_matrix, types, pars):
+def kernel_blocks(params):
+    """
+    Read kernel tile sizes and memory budget from user choices.
+
+    input: params, dict
+           dictionary of input parameters
+           optional keywords: 'kernel_block' -> [rows, columns] of each
+                                                kernel tile, 0 columns
+                                                means the whole training
+                                                sample
+                              'kernel_memory' -> [MB] for each tile
+
+    output: dict
+            keywords: block_size, tile_size, max_memory
+            arguments of blocked_transform
+    """
+    blocks = {'block_size': 1000, 'tile_size': None, 'max_memory': None}
+
+    if 'kernel_block' in params.keys():
+        blocks['block_size'] = int(params['kernel_block'][0])
+        if len(params['kernel_block']) > 1 and \
+           int(params['kernel_block'][1]) > 0:
+            blocks['tile_size'] = int(params['kernel_block'][1])
+
+    if 'kernel_memory' in params.keys() and \
+       float(params['kernel_memory'][0]) > 0:
+        blocks['max_memory'] = float(params['kernel_memory'][0])
+
+    return blocks
+
+
+def tiled_kernel_transform(obj_kpca, data, block_size, tile_size):
+    """
+    Project data matrix into kernel PCA space one kernel tile at a time.
+
+    Gives the same result as KernelPCA.transform, but never holds more
+    than block_size x tile_size kernel elements. Kernel centering is
+    applied to the accumulated products, so the training sample is read
+    one tile of tile_size rows at a time and may be memory mapped.
+
+    input: obj_kpca, sklearn.decomposition.KernelPCA
+           fitted kernel PCA object
+
+           data, array
+           lines are objects to be projected
+
+           block_size, int
+           number of lines of data in each tile
+
+           tile_size, int
+           number of training objects in each tile
+
+    output: proj, array
+            projections of all lines in data
+    """
+    train = obj_kpca.X_fit_
+    ntrain = train.shape[0]
+
+    # eigenvectors scaled as in KernelPCA.transform
+    alphas = getattr(obj_kpca, 'alphas_', None)
+    if alphas is None:
+        alphas = obj_kpca.eigenvectors_
+        lambdas = obj_kpca.eigenvalues_
+    else:
+        lambdas = obj_kpca.lambdas_
+    scaled = np.zeros(alphas.shape)
+    nonzero = np.flatnonzero(lambdas)
+    scaled[:, nonzero] = alphas[:, nonzero] / np.sqrt(lambdas[nonzero])
+
+    # centering terms which do not depend on the projected data
+    centerer = obj_kpca._centerer
+    colsum = scaled.sum(axis=0)
+    offset = np.dot(centerer.K_fit_rows_, scaled) - \
+             centerer.K_fit_all_ * colsum
+
+    dtype = np.result_type(data.dtype, train.dtype, np.float32)
+    proj = np.empty((len(data), scaled.shape[1]), dtype=dtype)
+
+    for i in xrange(0, len(data), block_size):
+        rows = data[i:i + block_size]
+        prod = np.zeros((len(rows), scaled.shape[1]))
+        ksum = np.zeros(len(rows))
+
+        for j in xrange(0, ntrain, tile_size):
+            kern = obj_kpca._get_kernel(rows,
+                                        np.asarray(train[j:j + tile_size]))
+            prod += np.dot(kern, scaled[j:j + tile_size])
+            ksum += kern.sum(axis=1)
+
+        proj[i:i + len(rows)] = prod - np.outer(ksum / ntrain, colsum) - \
+                                offset
+
+    return proj
+
+
+def blocked_transform(obj_kpca, data, block_size=1000, tile_size=None,
+                      max_memory=None):
+    """
+    Project data matrix into a fitted reduction space in blocks of rows.
+
+    Each block is projected through one matrix-matrix kernel evaluation
+    against the training sample, keeping the kernel matrix in memory
+    limited to block_size rows. For kernel PCA the training sample may
+    also be split in tiles of tile_size objects (see
+    tiled_kernel_transform), and tile sizes may be derived from a
+    memory budget.
+
+    input: obj_kpca, fitted object with transform method
+           output from kpca or approx_kpca with transform=True
+
+           data, array
+           lines are objects to be projected
+
+           block_size, int, optional
+           maximum number of lines projected at once
+           Default is 1000
+
+           tile_size, int, optional
+           maximum number of training objects in one kernel tile.
+           If None use the whole training sample. Default is None
+
+           max_memory, float, optional
+           memory budget of one kernel tile, in MB. If given, block_size
+           and tile_size are reduced to fit. Default is None
+
+    output: proj, array
+            projections of all lines in data
+    """
+    data = np.asarray(data)
+
+    train = getattr(obj_kpca, 'X_fit_', None)
+    tiled = train is not None and hasattr(obj_kpca, '_centerer') and \
+            obj_kpca.kernel != 'precomputed'
+
+    if tiled:
+        ntrain = train.shape[0]
+        if tile_size is None:
+            tile_size = ntrain
+
+        if max_memory is not None:
+            nelem = max(int(max_memory * 2 ** 20 / KERNEL_BYTES), 1)
+            tile_size = min(tile_size, nelem)
+            block_size = max(min(block_size, nelem // tile_size), 1)
+
+        if tile_size < ntrain:
+            return tiled_kernel_transform(obj_kpca, data, block_size,
+                                          tile_size)
+
+    if len(data) <= block_size:
+        return obj_kpca.transform(data)
+
+    proj = [obj_kpca.transform(data[i:i + block_size])
+            for i in xrange(0, len(data), block_size)]
+
+    return np.vstack(proj)
+
+
+def build_nneighbor(data_matrix, types, pars, cache=True):
+    """
+    Build a nearest neighbour classifier with a reusable spatial index.
+
+    The KD-tree (or ball tree) is built once per training matrix and
+    kept in NN_CACHE, so subsequent calls with the same projected
+    training sample return the already fitted classifier. Pool workers
+    forked after the first call inherit the cache. Cross-validation
+    scorers fit a new matrix on every call and skip the cache.
+
+    input: data_matrix, array
+           full data matrix for training
+
+           types, vector of str
+           types for each element on data_matrix
+
+           pars - dict
+           Dictionary of parameters
+           keywords: 'n', 'weights'
+                     optional: 'nn_algorithm' (default 'kd_tree'),
+                               'leaf_size' (default 30)
+
+           cache - bool, optional
+           if True, store and reuse the classifier in NN_CACHE.
+           Default is True
+
+    output: clf, sklearn.neighbors.KNeighborsClassifier
+            fitted classifier
+    """
+    from sklearn import neighbors
+
+    if 'nn_algorithm' in pars.keys():
+        algorithm = pars['nn_algorithm']
+    else:
+        algorithm = 'kd_tree'
+
+    if 'leaf_size' in pars.keys():
+        leaf_size = int(pars['leaf_size'])
+    else:
+        leaf_size = 30
+
+    # identify training sample and classifier configuration
+    key = None
+    if cache:
+        data_matrix = np.ascontiguousarray(data_matrix)
+        types = np.asarray(types)
+        key = hashlib.sha1(data_matrix.view(np.uint8))
+        key.update(str(data_matrix.shape) + str(data_matrix.dtype))
+        key.update(' '.join([str(item) for item in types]))
+        key.update(str([pars['n'], pars['weights'], algorithm, leaf_size]))
+        key = key.hexdigest()
+
+    if key in NN_CACHE:
+        clf = NN_CACHE.pop(key)
+
+    else:
+        # initia NN object
+        clf = neighbors.KNeighborsClassifier(pars['n'],
+                                             weights=pars['weights'],
+                                             algorithm=algorithm,
+                                             leaf_size=leaf_size)
+        # fit model
+        clf.fit(data_matrix, types)
+
+        if key is None:
+            return clf
+
+        # discard least recently used classifier
+        if len(NN_CACHE) >= NN_CACHE_SIZE:
+            NN_CACHE.popitem(last=False)
+
+    NN_CACHE[key] = clf
+
+    return clf
+
+
+@timed('nneighbor')
+def nneighbor(test, data_matrix, types, pars, clf=None, cache=True):
     """
     Classify a given data matrix according to its first nearst neighbour.
 
@@ -96,14 +437,20 @@ def nneighbor(test, data_matrix, types, pars):
            Dictionary of parameters
            keywords: 'n', 'weights'
 
+           clf - KNeighborsClassifier, optional
+           output from build_nneighbor. If given, data_matrix and types
+           are ignored and the existing spatial index is queried.
+           Default is None
+
+           cache - bool, optional
+           if True, a classifier built here is kept in NN_CACHE.
+           Default is True
+
     output: type, list of str
             classification of point
     """
-    # initia NN object
-    clf = neighbors.KNeighborsClassifier(pars['n'], weights=pars['weights'])
-
-    # fit model
-    clf.fit(data_matrix, types)
+    if clf is None:
+        clf = build_nneighbor(data_matrix, types, pars, cache=cache)
 
     # predict type
     new_label = clf.predict(test)
@@ -111,7 +458,7 @@ def nneighbor(test, data_matrix, types, pars):
     return new_label
 
 
-def set_types(types, snIa_flag):
+def set_types(types, Ia_flag):
     """
     Transform the original vector of types.
 
@@ -121,7 +468,7 @@ def set_types(types, snIa_flag):
     input: type - vector of str
            type of each object in the data matrix
 
-           snIa_flag - list
+           Ia_flag - list
            list of all codes correspondng to SNIa
 
     output: new_type - vector of str
@@ -129,7 +476,7 @@ def set_types(types, snIa_flag):
     """
     new_type = []
     for item in types:
-        if item in snIa_flag:
+        if item in Ia_flag:
             new_type.append('0')
         else:
             new_type.append('1')
@@ -163,7 +510,7 @@ def calc_scores(matrix2, ncomp, dist):
 
     # classify
     new_label = nneighbor(test_proj, matrix2.low_dim_matrix,
-                          matrix2.sntype, matrix2.user_choices)
+                          matrix2.sntype, matrix2.user_choices, cache=False)
 
     # calculate score
     score = sum(new_label == matrix2.test_type)
@@ -171,25 +518,17 @@ def calc_scores(matrix2, ncomp, dist):
     return int(ncomp), matrix2.user_choices['gamma'], score
 
 
-def core_cross_val(pars):
+def split_sample(pars):
     """
-    Perform 1/3 validation.
+    Separate data matrix in training (2/3) and validation (1/3) samples.
 
     input: pars, dict
            dictionary of input parameters
-           keywords:
-                   data, array
-                   data matrix
+           keywords: data, types, user_choices (see core_cross_val)
 
-                   types, vector
-                   vector of types
-
-                   user_choices, dict
-                   output from read_user_input()
-
-    output: vector of floats
-            parameters with higher classification success
-            [n_components, gamma, n_successes]
+    output: matrix2, DataMatrix object
+            training sample stored in datam and sntype,
+            validation sample stored in data_test and test_type
     """
     # split sample in 3
     indx_list1 = np.random.randint(0, len(pars['data']), 
@@ -207,6 +546,34 @@ def core_cross_val(pars):
     matrix2.data_test = np.array([pars['data'][indx] for indx in indx_list2])
     matrix2.test_type = np.array([pars['types'][indx] for indx in indx_list2])
 
+    return matrix2
+
+
+def core_cross_val(pars):
+    """
+    Perform 1/3 validation.
+
+    input: pars, dict
+           dictionary of input parameters
+           keywords:
+                   data, array
+                   data matrix
+
+                   types, vector
+                   vector of types
+
+                   user_choices, dict
+                   output from read_user_input()
+
+    output: vector of floats
+            parameters with higher classification success
+            [n_components, gamma, n_successes]
+    """
+    from scipy.sparse.linalg.eigen.arpack import ArpackNoConvergence
+    from scipy.stats import uniform
+
+    matrix2 = split_sample(pars)
+
     ploc = matrix2.user_choices['gamma_lim'][0]
     pscale = matrix2.user_choices['gamma_lim'][1] - ploc
     dist = uniform(loc=ploc, scale=pscale)
@@ -215,7 +582,7 @@ def core_cross_val(pars):
     for ncomp in xrange(int(matrix2.user_choices['ncomp_lim'][0]),
                         int(matrix2.user_choices['ncomp_lim'][1])):
 
-        screen('... ncomp = ' + str(ncomp), pars['user_choices'])
+        screen('... ncomp = %s', pars['user_choices'], ncomp)
 
         k = 0
         while k < pars['user_choices']['gamma_nparticles']:
@@ -233,3 +600,124 @@ def core_cross_val(pars):
 
     return results[indx_max]
 
+
+def subsample_score(matrix2, ncomp, gamma, indx):
+    """
+    Calculate classification results for a subsample of the training set.
+
+    input: matrix2, DataMatrix object
+           output from split_sample
+
+           ncomp, int
+           number of PCs to calculate
+
+           gamma, float
+           kernel hyperparameter
+
+           indx, array of int
+           indexes of training objects used to fit the reduction,
+           shared by all configurations in one round
+
+    output: score, int
+            number of correctly classified objects in validation sample
+    """
+    # set reduced training matrix
+    matrix3 = snclass.matrix.DataMatrix()
+    matrix3.user_choices = dict(matrix2.user_choices)
+    matrix3.user_choices['gamma'] = gamma
+    matrix3.user_choices['ncomp'] = ncomp
+    matrix3.datam = matrix2.datam[indx]
+    matrix3.sntype = matrix2.sntype[indx]
+
+    matrix3.reduce_dimension()
+
+    # project and classify the complete validation sample
+    test_proj = matrix3.transf_test.transform(matrix2.data_test)
+    new_label = nneighbor(test_proj, matrix3.low_dim_matrix,
+                          matrix3.sntype, matrix3.user_choices, cache=False)
+
+    return sum(new_label == matrix2.test_type)
+
+
+def core_cross_val_halving(pars):
+    """
+    Perform 1/3 validation with successive halving of configurations.
+
+    A set of random (ncomp, gamma) configurations is evaluated using a
+    small subsample of the training set. Only the best 1/halving_eta of
+    them survive to the next round, where the training subsample is
+    halving_eta times larger. The last round uses the complete training
+    set, so scores are comparable with those from core_cross_val.
+
+    input: pars, dict
+           dictionary of input parameters
+           keywords:
+                   data, array
+                   data matrix
+
+                   types, vector
+                   vector of types
+
+                   user_choices, dict
+                   output from read_user_input()
+                   uses keywords cv_budget and halving_eta
+
+    output: vector of floats
+            parameters with higher classification success
+            [n_components, gamma, n_successes]
+    """
+    from scipy.sparse.linalg.eigen.arpack import ArpackNoConvergence
+    from scipy.stats import uniform
+
+    matrix2 = split_sample(pars)
+    choices = matrix2.user_choices
+
+    eta = choices['halving_eta']
+    budget = choices['cv_budget']
+
+    # number of initial configurations which fits in the budget
+    nconfig = max(eta, int(budget * (eta - 1) / eta))
+
+    # number of rounds until only one configuration survives
+    nrounds = int(np.ceil(np.log(nconfig) / np.log(eta))) + 1
+
+    # draw initial configurations
+    ncomp_list = np.random.randint(int(choices['ncomp_lim'][0]),
+                                   int(choices['ncomp_lim'][1]),
+                                   size=nconfig)
+    ploc = choices['gamma_lim'][0]
+    pscale = choices['gamma_lim'][1] - ploc
+    gamma_list = uniform(loc=ploc, scale=pscale).rvs(size=nconfig)
+
+    config = zip(ncomp_list, gamma_list)
+    ntrain = len(matrix2.datam)
+    for rnd in xrange(nrounds):
+
+        # training subsample grows by eta in each round
+        nrows = int(ntrain * eta ** (rnd - nrounds + 1))
+        nrows = max(nrows, int(choices['ncomp_lim'][1]) + 1,
+                    int(choices['n']) + 1)
+        nrows = min(nrows, ntrain)
+
+        screen('... round %s: %s configurations, %s objects', choices,
+               rnd, len(config), nrows)
+
+        # same subsample for all configurations, so scores are comparable
+        indx = np.random.permutation(ntrain)[:nrows]
+
+        results = []
+        for ncomp, gamma in config:
+            try:
+                score = subsample_score(matrix2, ncomp, gamma, indx)
+            except ArpackNoConvergence:
+                screen('Arparck fail to converge!', choices)
+                score = -1
+
+            results.append([int(ncomp), gamma, score])
+
+        # keep the best configurations
+        results.sort(key=lambda line: line[-1], reverse=True)
+        nkeep = max(1, int(len(config) / eta))
+        config = [(line[0], line[1]) for line in results[:nkeep]]
+
+    return np.array(results[0])
@@ -0,0 +1,187 @@
+"""
+Bounded cache of fitted Gaussian Process objects.
+
+Fitted GP objects keep their training data and covariance factorizations,
+so keeping all of them alive during a long synthetic sample build makes
+memory grow without bound. GPCache keeps the most recently used objects
+within a maximum number of entries and an estimated memory budget. The
+hyperparameters of every object are kept after eviction, so an evicted
+object can be rebuilt without refitting.
+
+- gp_nbytes:
+        Estimate memory held by one Gaussian Process object.
+- GPCache:
+        Least recently used cache of per-filter Gaussian Process objects.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+from snclass.fit_lc_gptools import get_hyperpars
+
+
+def gp_nbytes(gp_obj):
+    """
+    Estimate memory held by one Gaussian Process object.
+
+    Arrays attached to the object are summed. Covariance matrix and its
+    Cholesky factor are computed lazily, so at least two square matrices
+    of the training set size are accounted for.
+
+    input: gp_obj, gptools.GaussianProcess
+
+    output: int
+            estimated size in bytes
+    """
+    nbytes = 0
+    for value in vars(gp_obj).values():
+        if isinstance(value, np.ndarray):
+            nbytes = nbytes + value.nbytes
+
+    ntrain = len(getattr(gp_obj, 'y', []))
+
+    return max(nbytes, 2 * 8 * ntrain ** 2)
+
+
+class GPCache(object):
+
+    """
+    Least recently used cache of per-filter Gaussian Process objects.
+
+    Entries are keyed by SNID and hold, for each filter, the GP object,
+    prediction grid and GP standard deviation.
+
+    Methods:
+        - get: Return cached entry for one object.
+        - put: Store fitted GP objects for one object.
+        - hyperpars: Return stored hyperparameters for one object.
+        - stats: Return cache statistics.
+    """
+
+    def __init__(self, max_entries=100, max_bytes=1024 ** 3):
+        """
+        Set cache bounds.
+
+        input: max_entries, int - optional
+               maximum number of cached objects. Default is 100
+
+               max_bytes, int - optional
+               maximum estimated memory of cached objects, in bytes.
+               Default is 1 GB
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hyper = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.evictions = 0
+
+    def __contains__(self, snid):
+        return snid in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, snid):
+        """
+        Return cached entry for one object.
+
+        input: snid, str
+               object identifier
+
+        output: dict or None
+                keywords: GP_obj, xarr, GP_std, each a dict per filter.
+                None if object is not cached.
+        """
+        if snid not in self.entries:
+            self.misses = self.misses + 1
+            return None
+
+        self.hits = self.hits + 1
+        entry = self.entries.pop(snid)
+        self.entries[snid] = entry
+
+        return entry[0]
+
+    def put(self, snid, data, filters):
+        """
+        Store fitted GP objects for one object.
+
+        Least recently used objects are evicted until the cache is within
+        its bounds. The newest object is always kept.
+
+        input: snid, str
+               object identifier
+
+               data, dict
+               light curve data with keywords GP_obj, xarr, GP_std
+
+               filters, list of str
+        """
+        entry = {}
+        for name in ['GP_obj', 'xarr', 'GP_std']:
+            entry[name] = dict([[fil, data[name][fil]] for fil in filters])
+
+        self.hyper[snid] = dict([[fil, get_hyperpars(entry['GP_obj'][fil])]
+                                 for fil in filters])
+
+        size = sum([gp_nbytes(entry['GP_obj'][fil]) for fil in filters])
+
+        if snid in self.entries:
+            self.nbytes = self.nbytes - self.entries.pop(snid)[1]
+
+        self.entries[snid] = [entry, size]
+        self.nbytes = self.nbytes + size
+
+        while len(self.entries) > 1 and \
+              (len(self.entries) > self.max_entries or
+               self.nbytes > self.max_bytes):
+            old = self.entries.popitem(last=False)
+            self.nbytes = self.nbytes - old[1][1]
+            self.evictions = self.evictions + 1
+
+    def hyperpars(self, snid):
+        """
+        Return stored hyperparameters for one object.
+
+        input: snid, str
+               object identifier
+
+        output: dict or None
+                keys are filters, values are output from get_hyperpars.
+                None if object was never fitted.
+        """
+        if snid in self.hyper:
+            self.rebuilds = self.rebuilds + 1
+            return self.hyper[snid]
+        else:
+            return None
+
+    def stats(self):
+        """
+        Return cache statistics.
+
+        output: dict
+                keywords: entries, nbytes, hits, misses, rebuilds,
+                          evictions, hit_rate
+        """
+        total = self.hits + self.misses
+
+        return {'entries': len(self.entries), 'nbytes': self.nbytes,
+                'hits': self.hits, 'misses': self.misses,
+                'rebuilds': self.rebuilds, 'evictions': self.evictions,
+                'hit_rate': self.hits / float(total) if total > 0 else None}
+
+
+def main():
+    """Print documentation."""
+    print __doc__
+
+if __name__ == '__main__':
+    main()
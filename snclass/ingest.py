@@ -0,0 +1,336 @@
+"""
+Watch a directory of raw light curves and classify new objects.
+
+New or changed SNANA files in path_to_obs are fitted in a process pool
+and classified with a model bundle held in memory, as soon as they
+arrive. Results are appended to the output file one line at a time.
+
+Work flows through threads connected by bounded queues, so that a slow
+stage blocks the stages before it instead of accumulating work:
+
+    watcher    -> scan path_to_obs every poll seconds
+    dispatcher -> send files to the GP fitting pool
+    collector  -> wait for fits, queue objects for classification
+    writer     -> wait for classification, write results
+
+Classification is done in batches by snclass.service.ClassificationService.
+
+- scan_dir:
+        List new or changed light curve files in a directory.
+- read_done:
+        Read files already classified from a results file.
+- ingest_1obj:
+        Fit and treat one light curve in a pool worker.
+- Ingestor:
+        Watch a directory and classify new light curves.
+"""
+
+import os
+import Queue
+import threading
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from snclass.functions import screen
+from snclass.log import LOGGER
+from snclass.resources import pool_args
+from snclass.service import ClassificationService, prepare_request
+from snclass.treat_lc import LC
+
+
+def scan_dir(path, seen, suffix='.DAT'):
+    """
+    List new or changed light curve files in a directory.
+
+    input: path, str
+           directory to scan
+
+           seen, dict
+           keys are file names, values are modification times of files
+           already found. Updated in place.
+
+           suffix, str - optional
+           light curve files extension. Default is '.DAT'
+
+    output: list of str
+            names of new or changed files, oldest first
+    """
+    found = []
+    for name in os.listdir(path):
+        if not name.endswith(suffix):
+            continue
+
+        try:
+            mtime = os.path.getmtime(os.path.join(path, name))
+        except OSError:
+            continue
+
+        if seen.get(name) != mtime:
+            seen[name] = mtime
+            found.append([mtime, name])
+
+    return [name for mtime, name in sorted(found)]
+
+
+def read_done(file_name):
+    """
+    Read files already classified from a results file.
+
+    input: file_name, str
+           output file written by Ingestor
+
+    output: dict
+            keys are file names, values are modification times
+    """
+    done = {}
+    if os.path.isfile(file_name):
+        op1 = open(file_name, 'r')
+        for line in op1.readlines()[1:]:
+            data = line.split()
+            if len(data) == 5:
+                done[data[3]] = float(data[4])
+        op1.close()
+
+    return done
+
+
+def ingest_1obj(pars):
+    """
+    Fit and treat one light curve in a pool worker.
+
+    input: pars, list
+           [user_choices, file name]
+
+    output: list
+            ['ok', snid, true_type, realizations matrix] or
+            ['error', message]
+    """
+    try:
+        new_lc, true_type, small_matrix = prepare_request(pars[0],
+                                                          {'lc_file': pars[1]})
+    except (ValueError, IOError, OSError, IndexError, KeyError,
+            np.linalg.LinAlgError) as err:
+        # unreadable file, failed cuts or failed fit
+        return ['error', str(err)]
+    except Exception as err:
+        LOGGER.exception('Unexpected error treating %s', pars[1])
+        return ['error', repr(err)]
+
+    return ['ok', new_lc.raw['SNID:'][0], true_type, small_matrix]
+
+
+class Ingestor(object):
+
+    """
+    Watch a directory and classify new light curves.
+
+    Methods:
+        - start: Start pool and threads.
+        - stop: Stop threads and pool once queued work is done.
+        - run: Start, wait until interrupted (or idle) and stop.
+        - watch: Queue new or changed files.
+        - dispatch: Send queued files to the fitting pool.
+        - collect: Queue fitted objects for classification.
+        - write: Write classification results.
+
+    Attributes:
+        - user_choices: dict, user input choices
+        - fit_choices: dict, user input choices of GP fitting workers
+        - service: ClassificationService, trained model and batching
+        - file_out: str, results file
+        - counts: dict, number of files found, fitted, rejected and
+                  classified
+    """
+
+    def __init__(self, user_choices, bundle_dir, file_out, n_proc=1,
+                 poll=10.0, max_queue=64, batch_size=32, max_wait=0.5):
+        """
+        Load trained model and set queues.
+
+        input: user_choices, dict
+               output from snclass.util.read_user_input
+
+               bundle_dir, str
+               directory holding the model bundle
+
+               file_out, str
+               results file. Files listed there are not classified again
+               unless they change.
+
+               n_proc, int - optional
+               number of GP fitting processes. Default is 1
+
+               poll, float - optional
+               time between directory scans, in seconds. Default is 10
+
+               max_queue, int - optional
+               maximum number of files waiting in each stage. Default is 64
+
+               batch_size, max_wait
+               see snclass.service.ClassificationService.
+               Default is 32, 0.5
+        """
+        self.user_choices = user_choices
+
+        # fits run in daemonic pool workers, which can not start the
+        # MCMC processes of gptools
+        self.fit_choices = dict(user_choices)
+        self.fit_choices['n_proc'] = ['0']
+
+        self.service = ClassificationService(user_choices, bundle_dir,
+                                             batch_size=batch_size,
+                                             max_wait=max_wait)
+        self.file_out = file_out
+        self.n_proc = max(int(n_proc), 1)
+        self.poll = poll
+
+        self.files = Queue.Queue(maxsize=max_queue)
+        self.fits = Queue.Queue(maxsize=max_queue)
+        self.results = Queue.Queue(maxsize=max_queue)
+
+        self.seen = read_done(file_out)
+        self.pool = None
+        self.threads = []
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.counts = {'found': 0, 'fitted': 0, 'rejected': 0,
+                       'classified': 0}
+        self.last_activity = time.time()
+
+    def add_count(self, name):
+        """Increase one of the counts, thread safe."""
+        with self.lock:
+            self.counts[name] = self.counts[name] + 1
+            self.last_activity = time.time()
+
+    def start(self):
+        """Start pool and threads."""
+        # pool is created before any thread is started
+        self.pool = Pool(processes=self.n_proc,
+                         **pool_args(self.n_proc, self.user_choices))
+        self.service.start()
+
+        if not os.path.isfile(self.file_out):
+            op1 = open(self.file_out, 'w')
+            op1.write('SNID    true_type    prob_Ia    file    mtime\n')
+            op1.close()
+
+        for target in [self.watch, self.dispatch, self.collect, self.write]:
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        """Stop threads and pool once queued work is done."""
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+        self.pool.close()
+        self.pool.join()
+        self.service.stop()
+
+    def run(self, max_idle=None):
+        """
+        Start, wait until interrupted (or idle) and stop.
+
+        input: max_idle, float - optional
+               if given, stop after this many seconds without new files
+               or results. Default is None (run until interrupted)
+        """
+        self.start()
+        try:
+            while True:
+                time.sleep(min(self.poll, 1.0))
+                with self.lock:
+                    idle = time.time() - self.last_activity
+                if max_idle is not None and idle > max_idle and \
+                   self.files.empty() and self.fits.empty() and \
+                   self.results.empty():
+                    break
+        except KeyboardInterrupt:
+            screen('Interrupted by the user!', self.user_choices)
+        finally:
+            self.stop()
+
+    def watch(self):
+        """Queue new or changed files, blocking while the queue is full."""
+        path = self.user_choices['path_to_obs'][0]
+
+        while not self.stopping.is_set():
+            for name in scan_dir(path, self.seen):
+                self.files.put([name, self.seen[name]])
+                self.add_count('found')
+                screen('New light curve %s', self.user_choices, name)
+
+            self.stopping.wait(self.poll)
+
+        self.files.put(None)
+
+    def dispatch(self):
+        """Send queued files to the fitting pool."""
+        while True:
+            item = self.files.get()
+            if item is None:
+                self.fits.put(None)
+                break
+
+            task = self.pool.apply_async(ingest_1obj,
+                                         ([self.fit_choices, item[0]],))
+            self.fits.put(item + [task])
+
+    def collect(self):
+        """Queue fitted objects for classification."""
+        while True:
+            item = self.fits.get()
+            if item is None:
+                self.results.put(None)
+                break
+
+            name, mtime, task = item
+            out = task.get()
+            self.add_count('fitted')
+
+            if out[0] == 'ok':
+                snid, true_type, small_matrix = out[1:]
+                new_lc = LC({'SNID:': [snid]}, self.user_choices)
+                job = self.service.submit([new_lc, true_type, small_matrix])
+                self.results.put([name, mtime, job])
+            else:
+                self.add_count('rejected')
+                screen('%s: %s', self.user_choices, name, out[1])
+
+    def write(self):
+        """Write classification results, one line per object."""
+        while True:
+            item = self.results.get()
+            if item is None:
+                break
+
+            name, mtime, job = item
+            job['event'].wait()
+            res = job['result']
+
+            if 'error' in res.keys():
+                self.add_count('rejected')
+                screen('%s: %s', self.user_choices, name, res['error'])
+                continue
+
+            op1 = open(self.file_out, 'a')
+            op1.write(res['snid'] + '    ' + res['true_type'] + '    ' +
+                      str(res['prob_Ia']) + '    ' + name + '    ' +
+                      repr(mtime) + '\n')
+            op1.close()
+            self.add_count('classified')
+
+
+def main():
+    """Print documentation."""
+    print __doc__
+
+if __name__ == '__main__':
+    main()
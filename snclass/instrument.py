@@ -0,0 +1,403 @@
+"""
+Timers and counters for pipeline stages.
+
+Instrumentation is disabled by default and then costs one flag check per
+call. It is enabled by setting the environment variable SNCLASS_PROFILE
+to the name of a JSON file, which receives the per-stage report when the
+run ends, or by calling enable().
+
+Memory accounting is switched on with SNCLASS_MEMORY=1 or
+enable(memory=True). Each timed stage then records the resident set
+size (RSS) around its calls and the peak RSS of the process, large
+arrays are registered with record_array and each pool worker reports
+its own peak RSS. SNCLASS_MEMORY=1 also enables the timers; without
+SNCLASS_PROFILE the report is written to snclass_profile.json.
+
+- enable:
+        Switch instrumentation on or off.
+- reset:
+        Discard all timers and counters.
+- timed:
+        Decorator measuring the time spent in a function.
+- Timer:
+        Context manager measuring the time spent in a block.
+- count:
+        Increase a counter.
+- current_rss:
+        Return resident set size of this process, in bytes.
+- peak_rss:
+        Return peak resident set size of this process, in bytes.
+- add_memory:
+        Register memory use of one call of a stage.
+- record_array:
+        Register the size of a large array.
+- snapshot:
+        Return current timers and counters.
+- merge:
+        Add timers and counters from another process.
+- Collect:
+        Wrap a pool task so that its timers and counters are returned.
+- gather:
+        Merge timers and counters returned by Collect tasks.
+- report:
+        Write timers and counters as JSON.
+"""
+
+import atexit
+import json
+import os
+import resource
+import sys
+import time
+from functools import wraps
+from logging import DEBUG
+
+from snclass.log import LOGGER
+
+# report file used when only SNCLASS_MEMORY is set
+PROFILE_FILE = 'snclass_profile.json'
+
+# instrumentation state, timers map stage -> [calls, total, max]
+STATE = {'on': False, 'memory': False, 'start': time.time()}
+TIMERS = {}
+COUNTERS = {}
+
+# memory maps stage -> [calls, max RSS growth, max RSS at exit, peak RSS],
+# arrays maps name -> max size and workers maps pid -> peak RSS, in bytes
+MEMORY = {}
+ARRAYS = {}
+WORKERS = {}
+
+
+def enable(flag=True, memory=None):
+    """
+    Switch instrumentation on or off.
+
+    input: flag, bool - optional
+           Default is True
+
+           memory, bool - optional
+           switch memory accounting on or off.
+           If None keep current choice. Default is None
+    """
+    STATE['on'] = bool(flag)
+    if memory is not None:
+        STATE['memory'] = bool(memory)
+
+
+def reset():
+    """Discard all timers and counters."""
+    TIMERS.clear()
+    COUNTERS.clear()
+    MEMORY.clear()
+    ARRAYS.clear()
+    WORKERS.clear()
+    STATE['start'] = time.time()
+
+
+def add_time(name, elapsed):
+    """
+    Register one call of a stage.
+
+    input: name, str
+           stage name
+
+           elapsed, float
+           time spent in the call, in seconds
+    """
+    stage = TIMERS.setdefault(name, [0, 0.0, 0.0])
+    stage[0] = stage[0] + 1
+    stage[1] = stage[1] + elapsed
+    stage[2] = max(stage[2], elapsed)
+
+    if LOGGER.isEnabledFor(DEBUG):
+        LOGGER.debug('... %s: %.4f s', name, elapsed,
+                     extra={'stage': name, 'elapsed': elapsed})
+
+
+def timed(name):
+    """
+    Decorator measuring the time spent in a function.
+
+    input: name, str
+           stage name
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not STATE['on']:
+                return func(*args, **kwargs)
+
+            rss = current_rss() if STATE['memory'] else None
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                add_time(name, time.time() - start)
+                if rss is not None:
+                    add_memory(name, rss)
+
+        return wrapper
+
+    return decorator
+
+
+class Timer(object):
+
+    """
+    Context manager measuring the time spent in a block.
+
+    Usage:
+        with Timer('stage'):
+            ...
+    """
+
+    def __init__(self, name):
+        """
+        Set stage name.
+
+        input: name, str
+               stage name
+        """
+        self.name = name
+        self.start = None
+        self.rss = None
+
+    def __enter__(self):
+        if STATE['on']:
+            if STATE['memory']:
+                self.rss = current_rss()
+            self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            add_time(self.name, time.time() - self.start)
+            self.start = None
+        if self.rss is not None:
+            add_memory(self.name, self.rss)
+            self.rss = None
+        return False
+
+
+def count(name, value=1):
+    """
+    Increase a counter.
+
+    input: name, str
+           counter name
+
+           value, int - optional
+           increment. Default is 1
+    """
+    if STATE['on']:
+        COUNTERS[name] = COUNTERS.get(name, 0) + value
+
+
+def current_rss():
+    """
+    Return resident set size of this process, in bytes.
+
+    Where /proc is not available, return the peak resident set size.
+    """
+    try:
+        op1 = open('/proc/self/statm', 'r')
+        pages = int(op1.read().split()[1])
+        op1.close()
+        return pages * resource.getpagesize()
+    except (IOError, OSError, IndexError, ValueError):
+        return peak_rss()
+
+
+def peak_rss():
+    """Return peak resident set size of this process, in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # reported in bytes on OS X and in kilobytes on Linux
+    if sys.platform == 'darwin':
+        return peak
+    else:
+        return peak * 1024
+
+
+def add_memory(name, rss_before):
+    """
+    Register memory use of one call of a stage.
+
+    input: name, str
+           stage name
+
+           rss_before, int
+           resident set size when the call started, in bytes
+    """
+    rss = current_rss()
+    stage = MEMORY.setdefault(name, [0, 0, 0, 0])
+    stage[0] = stage[0] + 1
+    stage[1] = max(stage[1], rss - rss_before)
+    stage[2] = max(stage[2], rss)
+    stage[3] = max(stage[3], peak_rss())
+
+
+def record_array(name, array):
+    """
+    Register the size of a large array.
+
+    input: name, str
+           array description
+
+           array, numpy.ndarray or None
+    """
+    if STATE['memory'] and array is not None:
+        ARRAYS[name] = max(ARRAYS.get(name, 0), getattr(array, 'nbytes', 0))
+
+
+def snapshot():
+    """
+    Return current timers and counters.
+
+    output: dict
+            keywords: timers, counters, memory, arrays, workers
+    """
+    workers = dict(WORKERS)
+    if STATE['memory']:
+        workers[os.getpid()] = max(workers.get(os.getpid(), 0), peak_rss())
+
+    return {'timers': dict([[name, list(TIMERS[name])] for name in TIMERS]),
+            'counters': dict(COUNTERS),
+            'memory': dict([[name, list(MEMORY[name])] for name in MEMORY]),
+            'arrays': dict(ARRAYS), 'workers': workers}
+
+
+def merge(stats):
+    """
+    Add timers and counters from another process.
+
+    input: stats, dict
+           output from snapshot
+    """
+    for name, other in stats['timers'].items():
+        stage = TIMERS.setdefault(name, [0, 0.0, 0.0])
+        stage[0] = stage[0] + other[0]
+        stage[1] = stage[1] + other[1]
+        stage[2] = max(stage[2], other[2])
+
+    for name, value in stats['counters'].items():
+        COUNTERS[name] = COUNTERS.get(name, 0) + value
+
+    for name, other in stats['memory'].items():
+        stage = MEMORY.setdefault(name, [0, 0, 0, 0])
+        stage[0] = stage[0] + other[0]
+        for k in xrange(1, 4):
+            stage[k] = max(stage[k], other[k])
+
+    for name, value in stats['arrays'].items():
+        ARRAYS[name] = max(ARRAYS.get(name, 0), value)
+
+    for pid, value in stats['workers'].items():
+        WORKERS[pid] = max(WORKERS.get(pid, 0), value)
+
+
+class Collect(object):
+
+    """
+    Wrap a pool task so that its timers and counters are returned.
+
+    Calling the wrapped task returns [result, snapshot], with timers
+    restricted to this task. Use gather on the list of outputs.
+    """
+
+    def __init__(self, func):
+        """
+        Set task.
+
+        input: func, function
+               module level function executed by pool workers
+        """
+        self.func = func
+
+    def __call__(self, pars):
+        reset()
+        result = self.func(pars)
+        return [result, snapshot()]
+
+
+def gather(outputs):
+    """
+    Merge timers and counters returned by Collect tasks.
+
+    input: outputs, list
+           results from pool.map over a Collect object
+
+    output: list
+            task results
+    """
+    for item in outputs:
+        merge(item[1])
+
+    return [item[0] for item in outputs]
+
+
+def report(file_out=None):
+    """
+    Write timers and counters as JSON.
+
+    input: file_out, str - optional
+           output file. If None, return the report only. Default is None
+
+    output: dict
+            keywords: wall_time, stages, counters
+            with memory accounting also: memory, arrays, workers,
+            peak_rss (sizes in MB)
+    """
+    stages = {}
+    for name in sorted(TIMERS.keys()):
+        calls, total, longest = TIMERS[name]
+        stages[name] = {'calls': calls, 'total': total,
+                        'mean': total / calls, 'max': longest}
+
+    rep = {'wall_time': time.time() - STATE['start'], 'stages': stages,
+           'counters': dict(COUNTERS)}
+
+    if STATE['memory']:
+        mbyte = 1024.0 ** 2
+
+        rep['memory'] = {}
+        for name in MEMORY.keys():
+            calls, growth, rss, peak = MEMORY[name]
+            rep['memory'][name] = {'calls': calls,
+                                   'max_growth': growth / mbyte,
+                                   'max_rss': rss / mbyte,
+                                   'peak_rss': peak / mbyte}
+
+        rep['arrays'] = dict([[name, ARRAYS[name] / mbyte]
+                              for name in ARRAYS])
+        rep['workers'] = dict([[str(pid), WORKERS[pid] / mbyte]
+                               for pid in WORKERS])
+        rep['peak_rss'] = peak_rss() / mbyte
+
+    if file_out is not None:
+        op1 = open(file_out, 'w')
+        json.dump(rep, op1, indent=2, sort_keys=True)
+        op1.close()
+
+    return rep
+
+
+if os.environ.get('SNCLASS_MEMORY', '0') != '0':
+    enable(memory=True)
+
+    # memory accounting alone still writes its report
+    if not os.environ.get('SNCLASS_PROFILE'):
+        atexit.register(report, PROFILE_FILE)
+
+if os.environ.get('SNCLASS_PROFILE'):
+    enable()
+    atexit.register(report, os.environ['SNCLASS_PROFILE'])
+
+
+def main():
+    """Print documentation."""
+    print __doc__
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,10 @@ snclass README file.
 
 IMPORTANT: run this sequence in a dedicated directory, since it will
 generate a large number of intermediate files. 
+
+To compare several filter sets, epoch cuts or reference filters with
+the original representation, run_sweep.py (snclass.sweep) reads each
+fitted light curve only once for all of them.
 """
 from snclass.algorithm import build_sample, set_lclist, set_parameters
 from snclass.algorithm import sample_pop, photo_frac, get_names, select_GP
@@ -63,6 +67,14 @@ plot_dir = None
 # range of number of PCs to be tested
 range_pcs = [2,36]
 
+# number of photometric objects projected and classified together
+# if 0, classify one object at a time
+batch_size = 100
+
+# if True, load each photometric object only once and classify it
+# with all number of PCs in range_pcs
+single_pass = True
+
 
 ### File names and directories
 
@@ -101,7 +113,7 @@ mat_dir = SNR_dir + 'matrices/'
 
 # spec data matrix file
 data_matrix = mat_dir + representation + '_' + filters + '_' + epoch_min + \
-              '_' + epoch_max + '_ref_' + ref_filter_name + '_data_matrix.dat'
+              '_' + epoch_max + '_ref_' + ref_filter_name + '_data_matrix.npz'
 
 # directory to store projections plot
 plot_proj_dir = SNR_dir + 'plots/proj/' + representation + '_' + filters + \
@@ -145,6 +157,8 @@ p['plot_proj_dir'] = plot_proj_dir
 p['synthetic_dir'] = synthetic_dir
 
 p['range_pcs'] = range_pcs
+p['batch_size'] = batch_size
+p['single_pass'] = single_pass
 
 p['sample'] = sample1
 p['fitted_data_dir'] = fitted_spec_data_dir
@@ -0,0 +1,254 @@
+"""
+Leveled logging for the classification pipeline.
+
+All messages go through the 'snclass' logger. By default they are written
+to standard output as plain text, as functions.screen always did, at
+level INFO. The environment variables
+
+    SNCLASS_LOG_LEVEL -> DEBUG, INFO, WARNING, ...
+    SNCLASS_LOG_JSON  -> file receiving one JSON object per message
+
+change the level and add a JSON-lines sink. Messages carrying object
+identifiers (snid) or stage timings (stage, elapsed) keep them as
+separate JSON fields. The same is available from Python through setup().
+
+Pool workers do not write themselves: pool_args() sets up a queue handler
+in each worker and a single listener thread in the parent process, so
+messages from all workers arrive whole and in one stream.
+
+- JsonFormatter:
+        Format log records as JSON objects.
+- setup:
+        Configure level, text output and JSON-lines sink.
+- QueueHandler:
+        Send log records to a multiprocessing queue.
+- QueueListener:
+        Dispatch records from worker processes to the parent handlers.
+- init_worker:
+        Route logging of a pool worker to the parent process.
+- stop_listener:
+        Stop the listener of this process, if any.
+- after_fork:
+        Forget the listener inherited from the parent process.
+- pool_args:
+        Return Pool keyword arguments setting up worker logging.
+"""
+
+import atexit
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+
+LOGGER = logging.getLogger('snclass')
+
+# extra fields copied to JSON output when present in a record
+FIELDS = ['snid', 'stage', 'elapsed', 'npcs']
+
+# queue and listener shared by all pools of this process
+STATE = {'queue': None, 'listener': None}
+
+
+class JsonFormatter(logging.Formatter):
+
+    """Format log records as JSON objects."""
+
+    def format(self, record):
+        line = {'time': record.created, 'level': record.levelname,
+                'process': record.processName, 'pid': record.process,
+                'message': record.getMessage()}
+        for name in FIELDS:
+            if hasattr(record, name):
+                line[name] = getattr(record, name)
+
+        return json.dumps(line, default=str)
+
+
+def setup(level=None, json_file=None, stream=None):
+    """
+    Configure level, text output and JSON-lines sink.
+
+    Existing snclass handlers are replaced.
+
+    input: level, str or int - optional
+           logging level. If None use INFO. Default is None
+
+           json_file, str - optional
+           file receiving one JSON object per message. Default is None
+
+           stream, file - optional
+           text output. If None use sys.stdout. Default is None
+    """
+    if level is None:
+        level = logging.INFO
+    elif not isinstance(level, int):
+        level = getattr(logging, str(level).upper())
+
+    for handler in list(LOGGER.handlers):
+        LOGGER.removeHandler(handler)
+        if getattr(handler, 'stream', None) not in [sys.stdout, sys.stderr]:
+            handler.close()
+
+    text = logging.StreamHandler(sys.stdout if stream is None else stream)
+    text.setFormatter(logging.Formatter('%(message)s'))
+    LOGGER.addHandler(text)
+
+    if json_file is not None:
+        sink = logging.FileHandler(json_file)
+        sink.setFormatter(JsonFormatter())
+        LOGGER.addHandler(sink)
+
+    LOGGER.setLevel(level)
+    LOGGER.propagate = False
+
+
+class QueueHandler(logging.Handler):
+
+    """Send log records to a multiprocessing queue."""
+
+    def __init__(self, queue):
+        """
+        Set queue.
+
+        input: queue, multiprocessing.Queue
+        """
+        logging.Handler.__init__(self)
+        self.queue = queue
+
+    def emit(self, record):
+        try:
+            # format now, arguments and tracebacks may not be picklable
+            record.msg = record.getMessage()
+            if record.exc_info:
+                record.msg = record.msg + '\n' + \
+                             logging.Formatter().formatException(
+                                 record.exc_info)
+            record.args = None
+            record.exc_info = None
+            self.queue.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+
+
+class QueueListener(object):
+
+    """
+    Dispatch records from worker processes to the parent handlers.
+
+    Methods:
+        - start: Start listener thread.
+        - stop: Dispatch remaining records and stop listener thread.
+    """
+
+    def __init__(self, queue):
+        """
+        Set queue.
+
+        input: queue, multiprocessing.Queue
+        """
+        self.queue = queue
+        self.thread = None
+
+    def start(self):
+        """Start listener thread."""
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            for handler in LOGGER.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+    def stop(self):
+        """Dispatch remaining records and stop listener thread."""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+
+def init_worker(queue, level, initializer=None, initargs=()):
+    """
+    Route logging of a pool worker to the parent process.
+
+    input: queue, multiprocessing.Queue
+           queue read by the parent QueueListener
+
+           level, int
+           logging level of the parent
+
+           initializer, function - optional
+           further worker initializer. Default is None
+
+           initargs, tuple - optional
+           arguments of initializer. Default is ()
+    """
+    for handler in list(LOGGER.handlers):
+        LOGGER.removeHandler(handler)
+    LOGGER.addHandler(QueueHandler(queue))
+    LOGGER.setLevel(level)
+
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def stop_listener():
+    """Stop the listener of this process, if any."""
+    if STATE['listener'] is not None:
+        STATE['listener'].stop()
+        STATE['listener'] = None
+        STATE['queue'] = None
+
+
+def after_fork():
+    """Forget the listener inherited from the parent process."""
+    STATE['queue'] = None
+    STATE['listener'] = None
+
+
+def pool_args(initializer=None, initargs=()):
+    """
+    Return Pool keyword arguments setting up worker logging.
+
+    Usage:
+        pool = Pool(processes=n_proc, **pool_args(init_worker, (shared,)))
+
+    input: initializer, function - optional
+           worker initializer. Default is None
+
+           initargs, tuple - optional
+           arguments of initializer. Default is ()
+
+    output: dict
+            keywords: initializer, initargs
+    """
+    if STATE['listener'] is None:
+        STATE['queue'] = multiprocessing.Queue()
+        STATE['listener'] = QueueListener(STATE['queue'])
+        STATE['listener'].start()
+
+    return {'initializer': init_worker,
+            'initargs': (STATE['queue'], LOGGER.getEffectiveLevel(),
+                         initializer, initargs)}
+
+
+atexit.register(stop_listener)
+
+if not LOGGER.handlers:
+    setup(level=os.environ.get('SNCLASS_LOG_LEVEL'),
+          json_file=os.environ.get('SNCLASS_LOG_JSON'))
+
+
+def main():
+    """Print documentation."""
+    print __doc__
+
+if __name__ == '__main__':
+    main()
@@ -2,18 +2,36 @@
 Created by Emille Ishida in May, 2015.
 
 Class to implement calculations on data matrix.
+
+- DataMatrix:
+        Data matrix class.
+- build_line:
+        Construct one line of the data matrix.
+- read_matrix_file:
+        Read data matrix file written by DataMatrix.store_training.
+- fit_hash:
+        Calculate hash of one GP fit file.
+- raw_stamp:
+        Identify the version of the raw data file behind one GP fit.
+- build_config:
+        Identify the choices which determine data matrix lines.
 """
 
+import cPickle
+import hashlib
 import os
 import sys
 
-import matplotlib.pylab as plt
 import numpy as np
 from multiprocessing import Pool
 
 from snclass.treat_lc import LC
-from snclass.util import read_user_input, read_snana_lc, translate_snid
-from snclass.functions import core_cross_val, screen
+from snclass.util import get_dtype, read_user_input, read_snana_lc
+from snclass.util import translate_snid
+from snclass.instrument import STATE, Collect, count, gather, timed
+from snclass.instrument import record_array
+from snclass.functions import screen
+from snclass.resources import pool_args
 
 ##############################################
 
@@ -25,6 +43,8 @@ class DataMatrix(object):
 
     Methods:
         - build: Build data matrix according to user input file specifications.
+        - store_training: Store complete training matrix.
+        - read: Read complete training matrix.
         - reduce_dimension: Perform dimensionality reduction.
         - cross_val: Perform cross-validation.
 
@@ -54,6 +74,7 @@ class DataMatrix(object):
         self.transf_test = None
         self.final = None
         self.test_projection = []
+        self.user_choices = {}
 
         if input_file is not None:
             self.user_choices = read_user_input(input_file)
@@ -73,7 +94,7 @@ class DataMatrix(object):
                  Reference filter for peak MJD calculation
                  Default is None
         """
-        screen('Fitting ' + filename, self.user_choices)
+        screen('Fitting %s', self.user_choices, filename)
 
         # translate identifier
         self.user_choices['path_to_lc'] = [translate_snid(filename, self.user_choices['measurement'][0])[0]]
@@ -119,30 +140,70 @@ class DataMatrix(object):
             return obj_line, redshift, obj_class
 
         else:
-            screen('... Failed to pass epoch cuts!', self.user_choices)
-            screen('\n', self.user_choices)
+            screen('... Failed to pass epoch cuts!\n', self.user_choices)
             return None
 
-    def store_training(self, file_out):
+    def store_training(self, file_out, dtype=None):
         """
         Store complete training matrix.
 
         input: file_out, str
-               output file name
+               output file name. If it ends with '.npz' the matrix is
+               stored in binary format, otherwise as a text table.
+
+               dtype, str - optional
+               data type of binary matrix, ex: 'float32'.
+               If None use user choice 'matrix_dtype', if given,
+               or 'precision'. Default is None
         """
-        # write to file
-        if file_out is not None:
+        if file_out is None:
+            return
+
+        if file_out.endswith('.npz'):
+            if dtype is None and 'matrix_dtype' in self.user_choices.keys():
+                dtype = self.user_choices['matrix_dtype'][0]
+            elif dtype is None:
+                dtype = get_dtype(self.user_choices).name
+
+            np.savez(file_out, datam=np.asarray(self.datam, dtype=dtype),
+                     snid=np.array(self.snid, dtype=str),
+                     sntype=np.array(self.sntype, dtype=str),
+                     redshift=np.asarray(self.redshift, dtype=float))
+
+        else:
+            # text export, values written with full precision
             op1 = open(file_out, 'w')
             op1.write('SNID    type    z   LC...\n')
             for i in xrange(len(self.datam)):
                 op1.write(str(self.snid[i]) + '    ' + str(self.sntype[i]) +
-                          '    ' + str(self.redshift[i]) + '    ')
-                for j in xrange(len(self.datam[i])):
-                    op1.write(str(self.datam[i][j]) + '    ')
-                op1.write('\n')
+                          '    ' + str(self.redshift[i]) + '    ' +
+                          '    '.join([repr(item) for item in
+                                       np.asarray(self.datam[i]).tolist()]) +
+                          '    \n')
             op1.close()
 
-    def build(self, file_out=None, check_epoch=True, ref_filter=None):
+    def read(self, file_in):
+        """
+        Read complete training matrix.
+
+        input: file_in, str
+               file written by store_training, binary ('.npz')
+               or text format
+        """
+        matrix = read_matrix_file(file_in)
+
+        self.datam = matrix['datam']
+        if 'precision' in self.user_choices.keys():
+            self.datam = np.asarray(self.datam,
+                                    dtype=get_dtype(self.user_choices))
+        self.snid = list(matrix['snid'])
+        self.sntype = matrix['sntype']
+        self.redshift = matrix['redshift']
+        record_array('DataMatrix.datam', self.datam)
+
+    @timed('DataMatrix.build')
+    def build(self, file_out=None, check_epoch=True, ref_filter=None,
+              n_proc=None, cache_file=None):
         """
         Build data matrix according to user input file specifications.
 
@@ -156,26 +217,115 @@ class DataMatrix(object):
                  ref_filter -> str, optional
                  Reference filter for MJD calculation
                  Default is None
+
+                 n_proc -> int, optional
+                 Number of processes used to treat light curves.
+                 If None use user choice 'n_proc'. Default is None
+
+                 cache_file -> str, optional
+                 File holding matrix lines from previous builds.
+                 Only objects whose GP fit or raw file changed are treated again.
+                 If None, all objects are treated. Default is None
         """
+        if n_proc is None:
+            n_proc = int(self.user_choices['n_proc'][0])
+
         # list all files in sample directory
-        file_list = os.listdir(self.user_choices['samples_dir'][0])
+        file_list = [obj for obj in
+                     os.listdir(self.user_choices['samples_dir'][0])
+                     if 'mean' in obj]
+
+        # read lines from previous builds
+        config = build_config(self.user_choices, check_epoch, ref_filter)
+        cache = {}
+        if cache_file is not None and os.path.isfile(cache_file):
+            op1 = open(cache_file, 'rb')
+            stored = cPickle.load(op1)
+            op1.close()
+            if stored['config'] == config:
+                cache = stored['rows']
 
+        rows = {}
+        todo = []
+        for obj in file_list:
+            if cache_file is not None:
+                fhash = [fit_hash(self.user_choices['samples_dir'][0] + obj),
+                         raw_stamp(self.user_choices, obj)]
+            else:
+                fhash = None
+
+            if obj in cache.keys() and cache[obj][0] == fhash:
+                rows[obj] = cache[obj]
+            else:
+                rows[obj] = [fhash, None]
+                todo.append(obj)
+
+        if cache_file is not None:
+            screen('%s lines found in cache, %s objects to treat.',
+                   self.user_choices, len(file_list) - len(todo), len(todo))
+
+        count('matrix_lines_cached', len(file_list) - len(todo))
+        count('matrix_lines_treated', len(todo))
+
+        # treat new or modified objects
+        pars = []
+        for obj in todo:
+            ptemp = {}
+            ptemp['user_choices'] = self.user_choices
+            ptemp['filename'] = obj
+            ptemp['epoch'] = check_epoch
+            ptemp['ref_filter'] = ref_filter
+            pars.append(ptemp)
+
+        if n_proc > 1 and len(pars) > 1:
+            pool = Pool(processes=n_proc,
+                        **pool_args(n_proc, self.user_choices))
+            if STATE['on']:
+                my_pool = pool.map_async(Collect(build_line), pars)
+            else:
+                my_pool = pool.map_async(build_line, pars)
+            try:
+                results = my_pool.get(0xFFFF)
+            except KeyboardInterrupt:
+                print 'Interruputed by the user!'
+                sys.exit()
+
+            pool.close()
+            pool.join()
+
+            if STATE['on']:
+                results = gather(results)
+        else:
+            results = [build_line(ptemp) for ptemp in pars]
+
+        for k in xrange(len(todo)):
+            rows[todo[k]][1] = results[k]
+
+        # assemble matrix in directory order
         datam = []
         redshift = []
         sntype = []
+        self.snid = []
 
         for obj in file_list:
-            if 'mean' in obj:
-                sn_char = self.check_file(obj, epoch=check_epoch,
-                                          ref_filter=ref_filter)
-                if sn_char is not None:
-                    datam.append(sn_char[0])
-                    redshift.append(sn_char[1])
-                    sntype.append(sn_char[2])
-
-        self.datam = np.array(datam)
+            sn_char = rows[obj][1]
+            if sn_char is not None:
+                self.snid.append(sn_char[0])
+                datam.append(sn_char[1])
+                redshift.append(sn_char[2])
+                sntype.append(sn_char[3])
+
+        self.datam = np.array(datam, dtype=get_dtype(self.user_choices))
         self.redshift = np.array(redshift)
         self.sntype = np.array(sntype)
+        record_array('DataMatrix.datam', self.datam)
+
+        # update cache
+        if cache_file is not None:
+            op2 = open(cache_file, 'wb')
+            cPickle.dump({'config': config, 'rows': rows}, op2,
+                         cPickle.HIGHEST_PROTOCOL)
+            op2.close()
 
         # store results
         self.store_training(file_out)
@@ -185,12 +335,14 @@ class DataMatrix(object):
         # define dimensionality reduction function
         func = self.user_choices['dim_reduction_func']
 
-        # reduce dimensionality
-        self.low_dim_matrix = func(self.datam, self.user_choices)
-
         # define transformation function
         self.transf_test = func(self.datam, self.user_choices, transform=True)
 
+        # reduce dimensionality, keeping the precision of the data matrix
+        self.low_dim_matrix = np.asarray(self.transf_test.transform(self.datam),
+                                         dtype=self.datam.dtype)
+
+    @timed('DataMatrix.cross_val')
     def cross_val(self):
         """Optimize the hyperparameters for RBF kernel and ncomp."""
         # correct type parameters if necessary
@@ -215,8 +367,13 @@ class DataMatrix(object):
 
         if int(self.user_choices['n_proc'][0]) > 0:
             cv_func = self.user_choices['cross_validation_func']
-            pool = Pool(processes=int(self.user_choices['n_proc'][0]))
-            my_pool = pool.map_async(cv_func, parameters)
+            n_proc = int(self.user_choices['n_proc'][0])
+            pool = Pool(processes=n_proc,
+                        **pool_args(n_proc, self.user_choices))
+            if STATE['on']:
+                my_pool = pool.map_async(Collect(cv_func), parameters)
+            else:
+                my_pool = pool.map_async(cv_func, parameters)
             try:
                 results = my_pool.get(0xFFFF)
             except KeyboardInterrupt:
@@ -226,12 +383,14 @@ class DataMatrix(object):
             pool.close()
             pool.join()
 
+            if STATE['on']:
+                results = gather(results)
+
             results = np.array(results)
 
         else:
-            number = self.user_choices['n_cross_val_particles']
-            results = np.array([core_cross_val(pars) 
-                                for pars in parameters])
+            cv_func = self.user_choices['cross_validation_func']
+            results = np.array([cv_func(pars) for pars in parameters])
 
         flist = list(results[:,len(results[0])-1])
         max_success = max(flist)
@@ -271,6 +430,8 @@ class DataMatrix(object):
                if not None plot the projection of 1 photometric object
                Default is None
         """
+        import matplotlib.pylab as plt
+
         #define vectors to plot
         xdata = self.low_dim_matrix[:,pcs[0]]
         ydata = self.low_dim_matrix[:,pcs[1]]
@@ -311,6 +472,139 @@ class DataMatrix(object):
             plt.savefig(file_out)
         plt.close()
 
+def build_line(pars):
+    """
+    Construct one line of the data matrix.
+
+    input: pars, dict
+           keywords:
+               user_choices, dict: output from read_user_input
+               filename, str: GP fit file
+               epoch, bool: if True check epoch cuts
+               ref_filter, str: reference filter for normalization
+
+    output: None if object does not satisfy epoch cuts, otherwise
+            list -> [snid, matrix line, redshift, type]
+    """
+    matrix = DataMatrix()
+    matrix.user_choices = dict(pars['user_choices'])
+
+    sn_char = matrix.check_file(pars['filename'], epoch=pars['epoch'],
+                                ref_filter=pars['ref_filter'])
+
+    if sn_char is not None:
+        return [matrix.snid[0]] + list(sn_char)
+
+
+def read_matrix_file(file_in):
+    """
+    Read data matrix file written by DataMatrix.store_training.
+
+    input: file_in, str
+           matrix file, binary ('.npz') or text format
+
+    output: dict
+            keywords: datam, array -> data matrix
+                      snid, array -> objects identifiers
+                      sntype, array -> objects types
+                      redshift, array -> objects redshifts
+    """
+    matrix = {}
+
+    if file_in.endswith('.npz'):
+        stored = np.load(file_in)
+        for key in ['datam', 'snid', 'sntype', 'redshift']:
+            matrix[key] = stored[key]
+        stored.close()
+
+    else:
+        op1 = open(file_in, 'r')
+        lin1 = op1.readlines()
+        op1.close()
+
+        data1 = [elem.split() for elem in lin1[1:]]
+
+        matrix['snid'] = np.array([line[0] for line in data1])
+        matrix['sntype'] = np.array([line[1] for line in data1])
+        matrix['redshift'] = np.array([line[2] for line in data1],
+                                      dtype=float)
+        matrix['datam'] = np.array([line[3:] for line in data1], dtype=float)
+
+    return matrix
+
+
+def fit_hash(filename):
+    """
+    Calculate hash of one GP fit file.
+
+    input: filename, str
+           GP fit file
+
+    output: str
+            hexadecimal digest
+    """
+    op1 = open(filename, 'rb')
+    fhash = hashlib.sha1(op1.read()).hexdigest()
+    op1.close()
+
+    return fhash
+
+
+def raw_stamp(user_choices, filename):
+    """
+    Identify the version of the raw data file behind one GP fit.
+
+    Redshift and type in the data matrix are read from the raw file,
+    so a line must be rebuilt if it changes even when the fit does not.
+
+    input: user_choices, dict
+           output from read_user_input
+
+           filename, str
+           GP fit file
+
+    output: list
+            [size in bytes, modification time] of the raw file,
+            None if it is not found
+    """
+    raw_file = user_choices['path_to_obs'][0] + \
+               translate_snid(filename, user_choices['measurement'][0])[0]
+
+    if not os.path.isfile(raw_file):
+        return None
+
+    stat = os.stat(raw_file)
+
+    return [stat.st_size, stat.st_mtime]
+
+
+def build_config(user_choices, check_epoch, ref_filter):
+    """
+    Identify the choices which determine data matrix lines.
+
+    input: user_choices, dict
+           output from read_user_input
+
+           check_epoch, bool
+           same as in DataMatrix.build
+
+           ref_filter, str
+           same as in DataMatrix.build
+
+    output: str
+            hexadecimal digest
+    """
+    keys = ['filters', 'epoch_cut', 'epoch_bin', 'epoch_predict',
+            'measurement', 'redshift_flag', 'type_flag', 'samples_dir']
+
+    config = [str(check_epoch), str(ref_filter)]
+    for key in keys:
+        if key in user_choices.keys():
+            config.append(key + ': ' + str(user_choices[key]))
+
+    return hashlib.sha1('\n'.join(config)).hexdigest()
+
+
 def main():
     """Print documentation."""
     print __doc__
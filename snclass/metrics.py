@@ -0,0 +1,556 @@
+"""
+Classification diagnostics computed on arrays.
+
+Results are held as arrays of probabilities, classes and redshifts, so
+that efficiency, purity and figure of merit are obtained for all
+thresholds and all redshift bins at once. Bootstrap resamples are drawn
+as index matrices and counted with a single bincount per block.
+
+- class_arrays:
+        Convert classification results to arrays.
+- pass_keys:
+        Label each object by its bin and number of thresholds passed.
+- resample_hist:
+        Count objects per key in a set of resamples.
+- passed_counts:
+        Convert histogram of keys in counts per threshold.
+- count_passed:
+        Count objects with probability above each threshold, per bin.
+- calc_diag:
+        Calculate efficiency, purity and figure of merit.
+- global_diag:
+        Calculate global diagnostics for a set of thresholds.
+- binned_diag:
+        Calculate diagnostics per redshift bin for a set of thresholds.
+- z_bins:
+        Determine redshift bin of each object.
+- resample_blocks:
+        Generate bootstrap index matrices in blocks of resamples.
+- bootstrap_diag:
+        Calculate bootstrap samples of efficiency, purity and figure of merit.
+- bootstrap_roc:
+        Calculate bootstrap samples of ROC curve and area under it.
+- confidence_band:
+        Calculate central confidence interval from resampled values.
+- bootstrap_config:
+        Calculate bootstrap samples for one classification configuration.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+# classes counted as contaminants
+NONIA_TYPES = ['Ibc', 'II']
+
+
+def class_arrays(class_res, orig_pop=None):
+    """
+    Convert classification results to arrays.
+
+    input: class_res, dict
+           keywords -> snid
+           values -> [type, probability of being Ia]
+
+           orig_pop, dict - optional
+           keywords -> snid
+           values -> [sample, type, redshift]
+           If None, redshifts are not returned. Default is None
+
+    output: res, dict
+            keywords, value type:
+                snid, array: object identifiers
+                prob, array: probability of being Ia
+                is_Ia, array of bool: true type is Ia
+                is_nonIa, array of bool: true type is Ibc or II
+                redshift, array: object redshifts (only if orig_pop given)
+    """
+    res = {}
+    res['snid'] = np.array(sorted(class_res.keys()))
+    res['prob'] = np.array([class_res[key][1] for key in res['snid']],
+                           dtype=float)
+
+    types = np.array([class_res[key][0] for key in res['snid']])
+    res['is_Ia'] = types == 'Ia'
+    res['is_nonIa'] = np.in1d(types, NONIA_TYPES)
+
+    if orig_pop is not None:
+        res['redshift'] = np.array([orig_pop[key][2]
+                                    for key in res['snid']], dtype=float)
+
+    return res
+
+
+def pass_keys(prob, mask, thresholds, bins=None, nbins=1):
+    """
+    Label each object by its bin and number of thresholds passed.
+
+    input: same as count_passed
+
+    output: keys, array of int
+            bin * (len(thresholds) + 1) + number of thresholds passed.
+            Objects outside mask or bins get nbins * (len(thresholds) + 1)
+
+            order, array of int
+            indexes sorting thresholds
+    """
+    thresholds = np.atleast_1d(np.asarray(thresholds, dtype=float))
+    order = np.argsort(thresholds)
+    nthr = len(thresholds)
+
+    if bins is None:
+        bins = np.zeros(len(prob), dtype=int)
+
+    use = mask & (bins >= 0) & (bins < nbins)
+
+    # number of thresholds passed by each object
+    rank = np.searchsorted(thresholds[order], prob, side='right')
+
+    keys = np.where(use, bins * (nthr + 1) + rank, nbins * (nthr + 1))
+
+    return keys, order
+
+
+def resample_hist(keys, nkeys, indx=None):
+    """
+    Count objects per key in a set of resamples.
+
+    input: keys, array of int
+           output from pass_keys
+
+           nkeys, int
+           number of valid keys, larger keys are discarded
+
+           indx, array of int - optional
+           index matrix, one resample per row.
+           If None, count the original sample. Default is None
+
+    output: array, shape (nresamples, nkeys)
+    """
+    if indx is None:
+        indx = np.arange(len(keys))[None, :]
+
+    nres = indx.shape[0]
+    shift = np.arange(nres)[:, None] * (nkeys + 1)
+    hist = np.bincount((shift + keys[indx]).ravel(),
+                       minlength=nres * (nkeys + 1))
+
+    return hist.reshape(nres, nkeys + 1)[:, :nkeys]
+
+
+def passed_counts(hist, order, nbins):
+    """
+    Convert histogram of keys in counts per threshold.
+
+    input: hist, array
+           output from resample_hist
+
+           order, array of int
+           output from pass_keys
+
+           nbins, int
+           number of bins
+
+    output: array, shape (nresamples, len(thresholds), nbins)
+    """
+    nthr = len(order)
+    hist = hist.reshape(hist.shape[0], nbins, nthr + 1)
+
+    # objects passing sorted threshold k have rank > k
+    passed = np.cumsum(hist[:, :, ::-1], axis=2)[:, :, ::-1][:, :, 1:]
+
+    counts = np.empty((hist.shape[0], nthr, nbins), dtype=int)
+    counts[:, order] = passed.transpose(0, 2, 1)
+
+    return counts
+
+
+def count_passed(prob, mask, thresholds, bins=None, nbins=1):
+    """
+    Count objects with probability above each threshold, per bin.
+
+    input: prob, array
+           probability of being Ia
+
+           mask, array of bool
+           objects to be counted
+
+           thresholds, array
+           probability thresholds, objects with prob >= threshold pass
+
+           bins, array of int - optional
+           bin index of each object, objects outside [0, nbins) are
+           ignored. If None all objects are in bin 0. Default is None
+
+           nbins, int - optional
+           number of bins. Default is 1
+
+    output: array, shape (len(thresholds), nbins)
+            number of objects in mask passing each threshold, per bin
+    """
+    keys, order = pass_keys(prob, mask, thresholds, bins, nbins)
+    hist = resample_hist(keys, nbins * (len(order) + 1))
+
+    return passed_counts(hist, order, nbins)[0]
+
+
+def calc_diag(cc_Ia, wc_Ia, tot_Ia, orig_Ia=None):
+    """
+    Calculate efficiency, purity and figure of merit.
+
+    Entries with no Ia, no object classified as Ia, or no Ia in the
+    original sample are set to zero.
+
+    input: cc_Ia, array
+           number of correctly classified Ia
+
+           wc_Ia, array
+           number of wrongly classified Ia
+
+           tot_Ia, array
+           number of Ia surviving selection cuts
+
+           orig_Ia, array - optional
+           number of Ia in original sample. If None, efficiency and
+           figure of merit before cuts are not calculated. Default is None
+
+    output: diag, dict
+            keywords: eff, pur, fom (and effb, fomb if orig_Ia is given)
+    """
+    cc_Ia = np.asarray(cc_Ia, dtype=float)
+    tot_Ia = np.asarray(tot_Ia, dtype=float) * np.ones(cc_Ia.shape)
+    ntot = cc_Ia + np.asarray(wc_Ia, dtype=float)
+
+    valid = (tot_Ia > 0) & (ntot > 0)
+    if orig_Ia is not None:
+        orig_Ia = np.asarray(orig_Ia, dtype=float) * np.ones(cc_Ia.shape)
+        valid = valid & (orig_Ia > 0)
+
+    diag = {}
+    diag['eff'] = np.zeros(cc_Ia.shape)
+    diag['pur'] = np.zeros(cc_Ia.shape)
+    diag['eff'][valid] = cc_Ia[valid] / tot_Ia[valid]
+    diag['pur'][valid] = cc_Ia[valid] / ntot[valid]
+    diag['fom'] = diag['eff'] * diag['pur']
+
+    if orig_Ia is not None:
+        diag['effb'] = np.zeros(cc_Ia.shape)
+        diag['effb'][valid] = cc_Ia[valid] / orig_Ia[valid]
+        diag['fomb'] = diag['effb'] * diag['pur']
+
+    return diag
+
+
+def global_diag(res, thresholds, orig_Ia=None):
+    """
+    Calculate global diagnostics for a set of thresholds.
+
+    input: res, dict
+           output from class_arrays
+
+           thresholds, array
+           probability thresholds
+
+           orig_Ia, int - optional
+           number of Ia in original sample. Default is None
+
+    output: diag, dict
+            keywords: eff, pur, fom (and effb, fomb if orig_Ia is given)
+            each an array with one entry per threshold
+    """
+    cc_Ia = count_passed(res['prob'], res['is_Ia'], thresholds)[:, 0]
+    wc_Ia = count_passed(res['prob'], res['is_nonIa'], thresholds)[:, 0]
+    tot_Ia = np.sum(res['is_Ia'])
+
+    return calc_diag(cc_Ia, wc_Ia, tot_Ia, orig_Ia)
+
+
+def binned_diag(res, thresholds, dz, nbins, orig_Ia_bins=None):
+    """
+    Calculate diagnostics per redshift bin for a set of thresholds.
+
+    input: res, dict
+           output from class_arrays, with redshift
+
+           thresholds, array
+           probability thresholds
+
+           dz, float
+           width of redshift bin
+
+           nbins, int
+           number of redshift bins
+
+           orig_Ia_bins, array - optional
+           number of Ia per redshift bin in original sample.
+           Default is None
+
+    output: diag, dict
+            keywords: eff, pur, fom (and effb, fomb if orig_Ia_bins is
+            given), each an array of shape (len(thresholds), nbins)
+    """
+    bins = z_bins(res['redshift'], dz, nbins)
+
+    cc_Ia = count_passed(res['prob'], res['is_Ia'], thresholds, bins, nbins)
+    wc_Ia = count_passed(res['prob'], res['is_nonIa'], thresholds, bins,
+                         nbins)
+    tot_Ia = np.bincount(bins[res['is_Ia'] & (bins >= 0) & (bins < nbins)],
+                         minlength=nbins)
+
+    return calc_diag(cc_Ia, wc_Ia, tot_Ia, orig_Ia_bins)
+
+
+def z_bins(redshift, dz, nbins):
+    """
+    Determine redshift bin of each object.
+
+    input: redshift, array
+           object redshifts
+
+           dz, float
+           width of redshift bin
+
+           nbins, int
+           number of redshift bins
+
+    output: array of int
+            bin index, -1 or nbins for objects outside all bins
+    """
+    edges = np.array([i * dz for i in xrange(nbins + 1)])
+
+    return np.digitize(redshift, edges) - 1
+
+
+def resample_blocks(nobj, nboot, rng, block_size=None):
+    """
+    Generate bootstrap index matrices in blocks of resamples.
+
+    input: nobj, int
+           number of objects
+
+           nboot, int
+           total number of resamples
+
+           rng, numpy.random.RandomState
+           random number generator
+
+           block_size, int - optional
+           number of resamples per block. If None, choose it to keep
+           about 2e6 indexes in memory. Default is None
+
+    output: generator of arrays of shape (block, nobj)
+    """
+    if block_size is None:
+        block_size = max(1, int(2e6 // max(nobj, 1)))
+
+    for first in xrange(0, nboot, block_size):
+        nres = min(block_size, nboot - first)
+        yield rng.randint(0, nobj, size=(nres, nobj))
+
+
+def bootstrap_diag(res, thresholds, nboot=1000, dz=None, nbins=1,
+                   orig_Ia=None, seed=None, block_size=None):
+    """
+    Calculate bootstrap samples of efficiency, purity and figure of merit.
+
+    input: res, dict
+           output from class_arrays, with redshift if dz is given
+
+           thresholds, array
+           probability thresholds
+
+           nboot, int - optional
+           number of bootstrap resamples. Default is 1000
+
+           dz, float - optional
+           width of redshift bin. If None, calculate global diagnostics.
+           Default is None
+
+           nbins, int - optional
+           number of redshift bins. Default is 1
+
+           orig_Ia, int or array - optional
+           number of Ia in original sample (per redshift bin).
+           Default is None
+
+           seed, int - optional
+           random seed. Default is None
+
+           block_size, int - optional
+           number of resamples treated at once. Default is None
+
+    output: diag, dict
+            keywords: eff, pur, fom (and effb, fomb if orig_Ia is given)
+            each an array of shape (nboot, len(thresholds), nbins)
+    """
+    rng = np.random.RandomState(seed)
+
+    if dz is None:
+        bins = None
+        nbins = 1
+    else:
+        bins = z_bins(res['redshift'], dz, nbins)
+
+    thresholds = np.atleast_1d(thresholds)
+    nkeys = nbins * (len(thresholds) + 1)
+    keys_Ia, order = pass_keys(res['prob'], res['is_Ia'], thresholds, bins,
+                               nbins)
+    keys_nonIa = pass_keys(res['prob'], res['is_nonIa'], thresholds, bins,
+                           nbins)[0]
+
+    diag = {}
+    for indx in resample_blocks(len(res['prob']), nboot, rng, block_size):
+        hist_Ia = resample_hist(keys_Ia, nkeys, indx)
+        hist_nonIa = resample_hist(keys_nonIa, nkeys, indx)
+
+        cc_Ia = passed_counts(hist_Ia, order, nbins)
+        wc_Ia = passed_counts(hist_nonIa, order, nbins)
+        tot_Ia = hist_Ia.reshape(-1, 1, nbins,
+                                 len(thresholds) + 1).sum(axis=3)
+
+        block = calc_diag(cc_Ia, wc_Ia, tot_Ia, orig_Ia)
+        for key in block.keys():
+            diag.setdefault(key, []).append(block[key])
+
+    for key in diag.keys():
+        diag[key] = np.concatenate(diag[key])
+
+    return diag
+
+
+def bootstrap_roc(res, nboot=1000, seed=None, block_size=None):
+    """
+    Calculate bootstrap samples of ROC curve and area under it.
+
+    Objects which are not Ia are taken as negatives. Thresholds are the
+    distinct probabilities found in the original sample.
+
+    input: res, dict
+           output from class_arrays
+
+           nboot, int - optional
+           number of bootstrap resamples. Default is 1000
+
+           seed, int - optional
+           random seed. Default is None
+
+           block_size, int - optional
+           number of resamples treated at once. Default is None
+
+    output: roc, dict
+            keywords, value type:
+                thresholds, array: distinct probabilities, decreasing
+                tpr, array: true positive rate, shape (nboot, nthresholds)
+                fpr, array: false positive rate, shape (nboot, nthresholds)
+                auc, array: area under ROC curve, shape (nboot,)
+    """
+    rng = np.random.RandomState(seed)
+
+    # decreasing distinct probabilities
+    values, inv = np.unique(-res['prob'], return_inverse=True)
+    nval = len(values)
+
+    keys_pos = np.where(res['is_Ia'], inv, nval)
+    keys_neg = np.where(res['is_Ia'], nval, inv)
+
+    roc = {'thresholds': -values, 'tpr': [], 'fpr': [], 'auc': []}
+    for indx in resample_blocks(len(res['prob']), nboot, rng, block_size):
+        pos = resample_hist(keys_pos, nval, indx).astype(float)
+        neg = resample_hist(keys_neg, nval, indx).astype(float)
+
+        npos = pos.sum(axis=1)[:, None]
+        nneg = neg.sum(axis=1)[:, None]
+
+        roc['tpr'].append(np.cumsum(pos, axis=1) / npos)
+        roc['fpr'].append(np.cumsum(neg, axis=1) / nneg)
+
+        # negatives ranked below each positive, ties count one half
+        neg_below = nneg - np.cumsum(neg, axis=1)
+        roc['auc'].append(np.sum(pos * (neg_below + 0.5 * neg), axis=1) /
+                          (npos * nneg)[:, 0])
+
+    for key in ['tpr', 'fpr', 'auc']:
+        roc[key] = np.concatenate(roc[key])
+
+    return roc
+
+
+def confidence_band(samples, level=0.68):
+    """
+    Calculate central confidence interval from resampled values.
+
+    input: samples, array
+           resampled values, resamples along first axis
+
+           level, float - optional
+           probability contained in the interval. Default is 0.68
+
+    output: low, array
+            lower limit
+
+            high, array
+            upper limit
+    """
+    tail = 50.0 * (1.0 - level)
+
+    # column by column, np.nanpercentile needs numpy >= 1.9
+    samples = np.asarray(samples, dtype=float)
+    flat = samples.reshape(len(samples), -1)
+    limits = np.empty((2, flat.shape[1]))
+    limits.fill(np.nan)
+    for j in xrange(flat.shape[1]):
+        column = flat[:, j][~np.isnan(flat[:, j])]
+        if len(column) > 0:
+            limits[:, j] = np.percentile(column, [tail, 100.0 - tail])
+
+    return (limits[0].reshape(samples.shape[1:])[()],
+            limits[1].reshape(samples.shape[1:])[()])
+
+
+def bootstrap_config(pars):
+    """
+    Calculate bootstrap samples for one classification configuration.
+
+    input: pars, dict
+           keywords, value type:
+               class_res, dict: results from classification
+               thresholds, array: probability thresholds
+               nboot, int: number of resamples
+               seed, int: random seed
+               orig_Ia, int: number of Ia in original sample, or None
+               (optional) orig_pop, dict: snid: [sample, type, redshift]
+               (optional) dz, float: width of redshift bin
+               (optional) nbins, int: number of redshift bins
+               (optional) orig_Ia_bins, list: number of Ia per bin in
+                                              original sample
+
+    output: boot, dict
+            keywords, value type:
+                roc, dict: output from bootstrap_roc
+                global, dict: output from bootstrap_diag, global
+                binned, dict: output from bootstrap_diag, per redshift
+                              bin (only if dz is given)
+    """
+    res = class_arrays(pars['class_res'], pars.get('orig_pop'))
+
+    boot = {}
+    boot['roc'] = bootstrap_roc(res, pars['nboot'], pars['seed'])
+    boot['global'] = bootstrap_diag(res, pars['thresholds'], pars['nboot'],
+                                    orig_Ia=pars['orig_Ia'],
+                                    seed=pars['seed'])
+    if pars.get('dz') is not None:
+        boot['binned'] = bootstrap_diag(res, pars['thresholds'],
+                                        pars['nboot'], dz=pars['dz'],
+                                        nbins=pars['nbins'],
+                                        orig_Ia=pars['orig_Ia_bins'],
+                                        seed=pars['seed'])
+
+    return boot
+
+
+def main():
+    """Print documentation."""
+    print __doc__
+
+if __name__ == '__main__':
+    main()
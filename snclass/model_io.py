@@ -0,0 +1,203 @@
+"""
+Binary storage of trained classification models.
+
+A model bundle is a directory holding everything needed to classify new
+objects without refitting the dimensionality reduction:
+
+    model.pkl          -> fitted reduction and neighbor objects,
+                          hyperparameters, version and configuration hash
+    spec_matrix.npy    -> low dimensional spectroscopic matrix
+    binary_types.npy   -> binary types of spectroscopic objects
+    labels.npy         -> classes of spectroscopic objects
+    sntype.npy         -> types as given in raw data
+    training_data.npy  -> training data matrix used by the kernel, if any
+
+All arrays are loaded as memory maps.
+
+- config_hash:
+        Calculate hash of the user choices which define a trained model.
+- has_model:
+        Check if a model bundle exists in a given directory.
+- save_model:
+        Write trained model bundle.
+- load_model_bundle:
+        Read trained model bundle.
+"""
+
+import cPickle
+import hashlib
+import os
+import warnings
+
+import numpy as np
+
+# increase whenever the bundle layout changes
+MODEL_VERSION = 1
+
+# user choices which must agree between training and classification
+CONFIG_KEYS = ['filters', 'epoch_cut', 'epoch_bin', 'ref_filter',
+               'measurement', 'n', 'weights', 'nn_algorithm', 'leaf_size',
+               'precision']
+
+ARRAYS = ['spec_matrix', 'binary_types', 'labels', 'sntype']
+
+
+def config_hash(user_choices):
+    """
+    Calculate hash of the user choices which define a trained model.
+
+    input: user_choices, dict
+           output from snclass.util.read_user_input
+
+    output: str
+            hexadecimal digest
+    """
+    sha = hashlib.sha1()
+    for key in CONFIG_KEYS:
+        if key in user_choices.keys():
+            value = user_choices[key]
+            if isinstance(value, (list, tuple)):
+                value = ' '.join([str(item) for item in value])
+            sha.update(key + ': ' + str(value) + '\n')
+
+    return sha.hexdigest()
+
+
+def has_model(bundle_dir, sources=None):
+    """
+    Check if a model bundle exists in a given directory.
+
+    input: bundle_dir, str
+           directory holding the bundle
+
+           sources, list of str, optional
+           files the model was trained from (hyperparameters, data
+           matrix). If any of them is newer than the bundle, a warning
+           is issued and the bundle is not used. Default is None
+
+    output: bool
+    """
+    meta_file = os.path.join(bundle_dir, 'model.pkl')
+    if not os.path.isfile(meta_file):
+        return False
+
+    if sources is not None:
+        bundle_time = os.path.getmtime(meta_file)
+        newer = [name for name in sources
+                 if name is not None and os.path.isfile(name) and
+                 os.path.getmtime(name) > bundle_time]
+        if len(newer) > 0:
+            warnings.warn('Model bundle in ' + bundle_dir + ' is older ' +
+                          'than ' + ', '.join(newer) + ', ignoring it.')
+            return False
+
+    return True
+
+
+def save_model(model, user_choices, bundle_dir):
+    """
+    Write trained model bundle.
+
+    input: model, dict
+           keywords: obj_kpca, spec_matrix, binary_types, labels, sntype,
+                     nn_clf, pars
+
+           user_choices, dict
+           user choices used for training
+
+           bundle_dir, str
+           directory to store the bundle
+    """
+    import sklearn
+
+    if not os.path.isdir(bundle_dir):
+        os.makedirs(bundle_dir)
+
+    for name in ARRAYS:
+        np.save(os.path.join(bundle_dir, name + '.npy'),
+                np.asarray(model[name]))
+
+    # training data is stored apart, so it can be memory mapped
+    obj_kpca = model['obj_kpca']
+    train = getattr(obj_kpca, 'X_fit_', None)
+    if train is not None:
+        np.save(os.path.join(bundle_dir, 'training_data.npy'), train)
+        obj_kpca.X_fit_ = None
+
+    meta = {}
+    meta['version'] = MODEL_VERSION
+    meta['sklearn_version'] = sklearn.__version__
+    meta['config_hash'] = config_hash(user_choices)
+    meta['obj_kpca'] = obj_kpca
+    meta['nn_clf'] = model['nn_clf']
+    meta['pars'] = model['pars']
+
+    try:
+        op1 = open(os.path.join(bundle_dir, 'model.pkl'), 'wb')
+        cPickle.dump(meta, op1, cPickle.HIGHEST_PROTOCOL)
+        op1.close()
+    finally:
+        if train is not None:
+            obj_kpca.X_fit_ = train
+
+
+def load_model_bundle(bundle_dir, user_choices=None):
+    """
+    Read trained model bundle.
+
+    input: bundle_dir, str
+           directory holding the bundle
+
+           user_choices, dict, optional
+           if given, check if the bundle was trained with compatible
+           choices. Default is None
+
+    output: model, dict
+            keywords: obj_kpca, spec_matrix, binary_types, labels, sntype,
+                      nn_clf, pars, data
+    """
+    import sklearn
+
+    op1 = open(os.path.join(bundle_dir, 'model.pkl'), 'rb')
+    meta = cPickle.load(op1)
+    op1.close()
+
+    if meta['version'] != MODEL_VERSION:
+        raise ValueError('Model bundle in ' + bundle_dir + ' has version ' +
+                         str(meta['version']) + ', expected ' +
+                         str(MODEL_VERSION) + '. Please retrain.')
+
+    if user_choices is not None and \
+       meta['config_hash'] != config_hash(user_choices):
+        raise ValueError('Model bundle in ' + bundle_dir + ' was trained ' +
+                         'with a different configuration!')
+
+    if meta['sklearn_version'] != sklearn.__version__:
+        warnings.warn('Model bundle in ' + bundle_dir + ' was written with ' +
+                      'scikit-learn ' + meta['sklearn_version'])
+
+    model = {}
+    for name in ARRAYS:
+        model[name] = np.load(os.path.join(bundle_dir, name + '.npy'),
+                              mmap_mode='r')
+
+    model['obj_kpca'] = meta['obj_kpca']
+    model['nn_clf'] = meta['nn_clf']
+    model['pars'] = meta['pars']
+
+    train_file = os.path.join(bundle_dir, 'training_data.npy')
+    if os.path.isfile(train_file):
+        model['data'] = np.load(train_file, mmap_mode='r')
+        model['obj_kpca'].X_fit_ = model['data']
+    else:
+        model['data'] = None
+
+    return model
+
+
+def main():
+    """Print documentation."""
+    print __doc__
+
+if __name__ == '__main__':
+    main()
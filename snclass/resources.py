@@ -0,0 +1,254 @@
+"""
+Split cores between worker processes and BLAS threads.
+
+NumPy, SciPy and scikit-learn call a multi-threaded BLAS which starts,
+by default, one thread per core in every process. With n_proc worker
+processes the node runs n_proc times more threads than cores, and the
+eigen and Cholesky decompositions slow down instead of scaling.
+
+pool_args() gives each pool worker cores // n_proc BLAS threads, and
+limit_blas() does the same for the parent around process pools started
+by other packages (gptools MCMC). The number of BLAS threads per worker
+may be fixed with the user choice 'blas_threads' or the environment
+variable SNCLASS_BLAS_THREADS ('auto' or an integer). The benchmark in
+snclass.benchmark.threads measures the best split for a machine.
+
+- cpu_count:
+        Number of cores available.
+- blas_threads:
+        Number of BLAS threads for each of n_proc workers.
+- blas_libraries:
+        List BLAS and OpenMP libraries loaded by this process.
+- get_blas_threads:
+        Current number of threads of each loaded BLAS library.
+- set_blas_threads:
+        Set number of BLAS threads in this process.
+- limit_blas:
+        Limit BLAS threads within a block of code.
+- init_worker:
+        Set BLAS threads of a pool worker.
+- pool_args:
+        Return Pool keyword arguments splitting cores among workers.
+"""
+
+import ctypes
+import multiprocessing
+import os
+from contextlib import contextmanager
+
+from snclass import log
+
+# environment variables read by BLAS and OpenMP libraries when loaded
+ENV_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+            'BLIS_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS']
+
+# library name -> runtime setter and getter of the number of threads
+SETTERS = [['libopenblas', 'openblas_set_num_threads',
+            'openblas_get_num_threads'],
+           ['libmkl_rt', 'MKL_Set_Num_Threads', 'MKL_Get_Max_Threads'],
+           ['libblis', 'bli_thread_set_num_threads',
+            'bli_thread_get_num_threads'],
+           ['libgomp', 'omp_set_num_threads', 'omp_get_max_threads'],
+           ['libiomp', 'omp_set_num_threads', 'omp_get_max_threads']]
+
+
+def cpu_count():
+    """
+    Number of cores available.
+
+    output: int
+    """
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def blas_threads(n_proc, user_choices=None, ncores=None):
+    """
+    Number of BLAS threads for each of n_proc workers.
+
+    input: n_proc, int
+           number of worker processes
+
+           user_choices, dict - optional
+           if keyword 'blas_threads' is given and not 'auto' its value
+           is used. Default is None
+
+           ncores, int - optional
+           number of cores. If None use cpu_count(). Default is None
+
+    output: int
+    """
+    choice = os.environ.get('SNCLASS_BLAS_THREADS', 'auto')
+    if user_choices is not None and 'blas_threads' in user_choices.keys():
+        choice = user_choices['blas_threads'][0]
+
+    if choice != 'auto':
+        return max(int(choice), 1)
+
+    if ncores is None:
+        ncores = cpu_count()
+
+    return max(ncores // max(int(n_proc), 1), 1)
+
+
+def blas_libraries():
+    """
+    List BLAS and OpenMP libraries loaded by this process.
+
+    Only available where /proc/self/maps exists (Linux).
+
+    output: list
+            [library path, setter name, getter name] for each library
+    """
+    try:
+        op1 = open('/proc/self/maps', 'r')
+        lin1 = op1.readlines()
+        op1.close()
+    except IOError:
+        return []
+
+    paths = sorted(set([line.split()[-1] for line in lin1
+                        if len(line.split()) > 5 and '.so' in line]))
+
+    found = []
+    for path in paths:
+        for prefix, setter, getter in SETTERS:
+            if os.path.basename(path).startswith(prefix):
+                found.append([path, setter, getter])
+
+    return found
+
+
+def get_blas_threads():
+    """
+    Current number of threads of each loaded BLAS library.
+
+    output: dict
+            keys are library paths, values are number of threads
+    """
+    threads = {}
+    for path, setter, getter in blas_libraries():
+        try:
+            threads[path] = getattr(ctypes.CDLL(path), getter)()
+        except (OSError, AttributeError):
+            continue
+
+    return threads
+
+
+def set_blas_threads(nthreads):
+    """
+    Set number of BLAS threads in this process.
+
+    Libraries already loaded are changed at run time. Environment
+    variables are set as well, for libraries loaded later and for
+    processes started from this one.
+
+    input: nthreads, int
+           number of threads
+
+    output: dict
+            previous number of threads of each loaded library
+    """
+    nthreads = max(int(nthreads), 1)
+
+    for name in ENV_VARS:
+        os.environ[name] = str(nthreads)
+
+    previous = {}
+    for path, setter, getter in blas_libraries():
+        try:
+            lib = ctypes.CDLL(path)
+            previous[path] = getattr(lib, getter)()
+            getattr(lib, setter)(ctypes.c_int(nthreads))
+        except (OSError, AttributeError):
+            continue
+
+    return previous
+
+
+@contextmanager
+def limit_blas(nthreads):
+    """
+    Limit BLAS threads within a block of code.
+
+    Usage:
+        with limit_blas(blas_threads(n_proc)):
+            start n_proc processes
+
+    input: nthreads, int
+           number of threads
+    """
+    env = dict([[name, os.environ.get(name)] for name in ENV_VARS])
+    previous = set_blas_threads(nthreads)
+    try:
+        yield
+    finally:
+        for name in ENV_VARS:
+            if env[name] is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = env[name]
+
+        for path, setter, getter in blas_libraries():
+            if path in previous.keys():
+                getattr(ctypes.CDLL(path), setter)(
+                    ctypes.c_int(previous[path]))
+
+
+def init_worker(nthreads, initializer=None, initargs=()):
+    """
+    Set BLAS threads of a pool worker.
+
+    input: nthreads, int
+           number of BLAS threads
+
+           initializer, function - optional
+           further worker initializer. Default is None
+
+           initargs, tuple - optional
+           arguments of initializer. Default is ()
+    """
+    set_blas_threads(nthreads)
+
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def pool_args(n_proc, user_choices=None, initializer=None, initargs=()):
+    """
+    Return Pool keyword arguments splitting cores among workers.
+
+    Workers also send their log messages to the parent process
+    (see snclass.log.pool_args).
+
+    Usage:
+        pool = Pool(processes=n_proc, **pool_args(n_proc, user_choices))
+
+    input: n_proc, int
+           number of worker processes
+
+           user_choices, dict - optional
+           see blas_threads. Default is None
+
+           initializer, function - optional
+           further worker initializer. Default is None
+
+           initargs, tuple - optional
+           arguments of initializer. Default is ()
+
+    output: dict
+            keywords: initializer, initargs
+    """
+    nthreads = blas_threads(n_proc, user_choices)
+    return log.pool_args(init_worker, (nthreads, initializer, initargs))
+
+
+def main():
+    """Print documentation."""
+    print __doc__
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,437 @@
+"""
+Local classification service holding a trained model in memory.
+
+The model bundle written by build_spec_matrix (see snclass.model_io) is
+loaded once. Light curves are then sent to an HTTP server bound to the
+local host and their probability of being a SN Ia is returned, without
+rebuilding the data matrix or refitting the dimensionality reduction.
+
+Requests are treated (GP fit or loading, normalization, epoch cuts) in
+the thread handling each connection. Treated objects are collected by a
+single batching thread, which projects and classifies up to batch_size
+objects at once, waiting at most max_wait seconds for a batch to fill.
+
+Endpoints:
+    POST /classify -> JSON object or list of objects, keywords:
+                      lc_file, str: raw light curve file, absolute or
+                                    relative to path_to_obs
+                      fit_file, str, optional: GP fit mean file. The
+                                    samples file is searched in the same
+                                    directory. If not given, the light
+                                    curve is fitted in memory.
+                      returns a list of {snid, true_type, prob_Ia}, or
+                      {lc_file, error} for objects which could not be
+                      classified
+    GET /metrics   -> request, object and batch counts, latency and,
+                      if enabled, the snclass.instrument report
+    GET /health    -> {status: ok}
+
+- prepare_request:
+        Load and treat one light curve.
+- ClassificationService:
+        Trained model and batching queue shared by all requests.
+- ServiceHandler:
+        Handle HTTP requests to a classification service.
+- ThreadedHTTPServer:
+        HTTP server handling each request in a separate thread.
+- serve:
+        Load trained model and serve classification requests.
+"""
+
+import BaseHTTPServer
+import json
+import os
+import Queue
+import SocketServer
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from snclass import instrument
+from snclass.algorithm import classify_prepared, prepare_lc
+from snclass.functions import screen
+from snclass.model_io import load_model_bundle
+from snclass.treat_lc import LC
+from snclass.util import read_snana_lc, read_user_input
+
+
+def prepare_request(user_choices, request):
+    """
+    Load and treat one light curve.
+
+    input: user_choices, dict
+           output from snclass.util.read_user_input
+
+           request, dict
+           keywords: lc_file and optionally fit_file
+
+    output: list -> [LC object, true_type, realizations matrix]
+            raises ValueError if the object can not be classified
+    """
+    if 'lc_file' not in request.keys():
+        raise ValueError('Missing keyword lc_file.')
+
+    # GP results are stored in user choices, keep them per request
+    choices = dict(user_choices)
+    for name in ['GP_fit', 'realizations', 'xarr', 'GP_obj', 'GP_std']:
+        choices[name] = {}
+    choices['path_to_lc'] = [request['lc_file']]
+    if os.path.isabs(request['lc_file']):
+        choices['path_to_obs'] = ['']
+
+    raw = read_snana_lc(choices)
+
+    type_flag = choices['type_flag'][0]
+    if type_flag in raw.keys():
+        true_type = raw[type_flag][0]
+    else:
+        true_type = 'None'
+
+    new_lc = LC(raw, choices)
+
+    if 'fit_file' in request.keys():
+        choices['samples_dir'] = [os.path.dirname(
+                                  os.path.abspath(request['fit_file'])) + '/']
+        new_lc.load_fit_GP(request['fit_file'])
+    else:
+        new_lc.check_basic()
+        if not new_lc.basic_cuts:
+            raise ValueError('Failed to pass basic cuts.')
+
+        new_lc.fit_GP(samples=True, save_mean=False, save_samples=False,
+                      do_mcmc=bool(int(choices['do_mcmc'][0])))
+
+    small_matrix = prepare_lc(new_lc, choices)
+    if small_matrix is None:
+        raise ValueError('Failed to pass epoch cuts or no GP realizations.')
+
+    return [new_lc, true_type, small_matrix]
+
+
+class ClassificationService(object):
+
+    """
+    Trained model and batching queue shared by all requests.
+
+    Methods:
+        - start: Start batching thread.
+        - stop: Stop batching thread.
+        - prepare: Load and treat one light curve.
+        - submit: Queue one treated object for classification.
+        - classify: Classify a list of light curves.
+        - run_batches: Classify queued objects in batches.
+        - metrics: Return service statistics.
+
+    Attributes:
+        - user_choices: dict, user input choices
+        - model: dict, output from snclass.model_io.load_model_bundle
+        - batch_size: int, maximum number of objects per batch
+        - max_wait: float, maximum time to fill a batch, in seconds
+    """
+
+    def __init__(self, user_choices, bundle_dir, batch_size=32,
+                 max_wait=0.01):
+        """
+        Load trained model.
+
+        input: user_choices, dict
+               output from snclass.util.read_user_input
+
+               bundle_dir, str
+               directory holding the model bundle
+
+               batch_size, int - optional
+               maximum number of objects per batch. Default is 32
+
+               max_wait, float - optional
+               maximum time to fill a batch, in seconds. Default is 0.01
+
+        raises ValueError if user choice n_samples is not positive
+        """
+        # probabilities are fractions of GP realizations
+        if int(user_choices['n_samples'][0]) < 1:
+            raise ValueError('n_samples must be > 0 to classify, ' +
+                             'check the user input file!')
+
+        self.user_choices = user_choices
+        self.model = load_model_bundle(bundle_dir, user_choices)
+        self.bundle_dir = bundle_dir
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+
+        self.queue = Queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+        self.start_time = time.time()
+        self.counts = {'requests': 0, 'objects': 0, 'classified': 0,
+                       'rejected': 0, 'batches': 0}
+        self.latency = deque(maxlen=1000)
+
+    def start(self):
+        """Start batching thread."""
+        self.thread = threading.Thread(target=self.run_batches)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop batching thread."""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def prepare(self, request):
+        """
+        Load and treat one light curve.
+
+        input: request, dict
+               keywords: lc_file and optionally fit_file
+
+        output: see prepare_request
+        """
+        return prepare_request(self.user_choices, request)
+
+    def submit(self, obj):
+        """
+        Queue one treated object for classification.
+
+        input: obj, list
+               output from prepare
+
+        output: item, dict
+                keywords: event, set when item['result'] is available
+        """
+        item = {'event': threading.Event(), 'result': None, 'obj': obj}
+        self.queue.put(item)
+
+        return item
+
+    def classify(self, requests):
+        """
+        Classify a list of light curves.
+
+        input: requests, list of dict
+               keywords: lc_file and optionally fit_file
+
+        output: list of dict
+                keywords: snid, true_type, prob_Ia or lc_file, error
+        """
+        start = time.time()
+
+        pending = []
+        for request in requests:
+            try:
+                item = self.submit(self.prepare(request))
+            except Exception as err:
+                item = {'event': threading.Event(),
+                        'result': {'lc_file': request.get('lc_file'),
+                                   'error': str(err)}}
+                item['event'].set()
+            pending.append(item)
+
+        results = []
+        for item in pending:
+            item['event'].wait()
+            results.append(item['result'])
+
+        nrejected = len([1 for line in results if 'error' in line.keys()])
+        with self.lock:
+            self.counts['requests'] = self.counts['requests'] + 1
+            self.counts['objects'] = self.counts['objects'] + len(results)
+            self.counts['classified'] = self.counts['classified'] + \
+                                        len(results) - nrejected
+            self.counts['rejected'] = self.counts['rejected'] + nrejected
+            self.latency.append(time.time() - start)
+
+        return results
+
+    def run_batches(self):
+        """Classify queued objects in batches, until None is queued."""
+        din = {'user_input': self.user_choices, 'do_plot': False}
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            # fill batch
+            batch = [item]
+            deadline = time.time() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except Queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None)
+                    break
+                batch.append(item)
+
+            try:
+                lines = classify_prepared([elem['obj'] for elem in batch],
+                                          self.model, din)
+                for k in xrange(len(batch)):
+                    batch[k]['result'] = {'snid': lines[k][0],
+                                          'true_type': lines[k][1],
+                                          'prob_Ia': float(lines[k][2])}
+            except Exception as err:
+                for elem in batch:
+                    elem['result'] = {'snid': elem['obj'][0].raw['SNID:'][0],
+                                      'error': str(err)}
+
+            with self.lock:
+                self.counts['batches'] = self.counts['batches'] + 1
+            instrument.count('service_batch_objects', len(batch))
+
+            for elem in batch:
+                elem['event'].set()
+
+    def metrics(self):
+        """
+        Return service statistics.
+
+        output: dict
+                keywords: uptime, counts, mean_batch_size, latency,
+                          queue_size, model and, if instrumentation is
+                          enabled, profile
+        """
+        with self.lock:
+            counts = dict(self.counts)
+            latency = np.array(self.latency)
+
+        met = {'uptime': time.time() - self.start_time, 'counts': counts,
+               'queue_size': self.queue.qsize(),
+               'model': {'bundle_dir': self.bundle_dir,
+                         'pars': self.model['pars']}}
+
+        if counts['batches'] > 0:
+            met['mean_batch_size'] = counts['classified'] / \
+                                     float(counts['batches'])
+        else:
+            met['mean_batch_size'] = None
+
+        if len(latency) > 0:
+            met['latency'] = {'mean': float(latency.mean()),
+                              'p50': float(np.percentile(latency, 50)),
+                              'p95': float(np.percentile(latency, 95)),
+                              'max': float(latency.max())}
+        else:
+            met['latency'] = None
+
+        if instrument.STATE['on']:
+            met['profile'] = instrument.report()
+
+        return met
+
+
+class ServiceHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    """Handle HTTP requests to a classification service."""
+
+    def send_json(self, code, content):
+        """
+        Write JSON response.
+
+        input: code, int
+               HTTP status code
+
+               content, dict or list
+        """
+        body = json.dumps(content, default=str)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self.send_json(200, self.server.service.metrics())
+        elif self.path == '/health':
+            self.send_json(200, {'status': 'ok'})
+        else:
+            self.send_json(404, {'error': 'Unknown path ' + self.path})
+
+    def do_POST(self):
+        if self.path != '/classify':
+            self.send_json(404, {'error': 'Unknown path ' + self.path})
+            return
+
+        try:
+            length = int(self.headers.getheader('Content-Length', 0))
+            requests = json.loads(self.rfile.read(length))
+        except ValueError as err:
+            self.send_json(400, {'error': 'Invalid request: ' + str(err)})
+            return
+
+        if isinstance(requests, dict):
+            requests = [requests]
+
+        self.send_json(200, self.server.service.classify(requests))
+
+    def log_message(self, fmt, *args):
+        screen('%s - ' + fmt, self.server.service.user_choices,
+               self.address_string(), *args)
+
+
+class ThreadedHTTPServer(SocketServer.ThreadingMixIn,
+                         BaseHTTPServer.HTTPServer):
+
+    """HTTP server handling each request in a separate thread."""
+
+    daemon_threads = True
+
+
+def serve(input_file, bundle_dir, host='127.0.0.1', port=8765,
+          batch_size=32, max_wait=0.01):
+    """
+    Load trained model and serve classification requests.
+
+    input: input_file, str
+           user input file used for training
+
+           bundle_dir, str
+           directory holding the model bundle
+
+           host, str - optional
+           Default is '127.0.0.1'
+
+           port, int - optional
+           Default is 8765
+
+           batch_size, max_wait
+           see ClassificationService
+    """
+    user_choices = read_user_input(input_file)
+
+    service = ClassificationService(user_choices, bundle_dir,
+                                    batch_size=batch_size,
+                                    max_wait=max_wait)
+    service.start()
+
+    server = ThreadedHTTPServer((host, port), ServiceHandler)
+    server.service = service
+
+    screen('Serving model %s on http://%s:%s', user_choices, bundle_dir,
+           host, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
+
+def main():
+    """Print documentation."""
+    print __doc__
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,499 @@
+"""
+Train and classify a grid of configurations sharing the loaded GP fits.
+
+Each configuration overrides user choices of a base user input file
+which determine the light curve features and selection (filters,
+epoch_cut, epoch_bin, ref_filter, quality_cut, ...). Instead of running
+the pipeline once per configuration, re-reading every fitted light curve
+each time, the fits of the spectroscopic and photometric samples are
+read once, with all filters used by any configuration, and kept in
+memory. Matrix lines and realizations of each configuration are derived
+from them, and the training (one task per configuration and number of
+PCs) and classification tasks of all configurations run on one worker
+pool, which inherits the loaded fits.
+
+Only the original representation is handled: synthetic spectroscopic
+samples are drawn and written per configuration by
+snclass.algorithm.select_GP (see snclass.workflow).
+
+Results of configuration <name> are written to <out_dir>/<name>/ in the
+same layout as snclass.algorithm.classify: data_matrix.npz,
+<n>PC/model/ and <n>PC/class_res_<n>PC.dat.
+
+- read_grid:
+        Read sweep parameters and configurations from a JSON file.
+- config_choices:
+        User choices of one configuration.
+- load_sample:
+        Read all GP fits of one directory.
+- treat_fit:
+        Build matrix line or realizations of one object for one
+        configuration.
+- matrix_task:
+        Build and store the training data matrix of one configuration.
+- train_task:
+        Train model of one configuration and number of PCs.
+- classify_task:
+        Classify photometric sample of one configuration.
+- Sweep:
+        Train and classify a grid of configurations.
+"""
+
+import json
+import os
+from multiprocessing import Pool
+
+import numpy as np
+
+from snclass.functions import screen
+from snclass.resources import pool_args
+from snclass.treat_lc import LC
+from snclass.util import get_dtype, read_fitted, read_snana_lc
+from snclass.util import read_user_input, translate_snid
+
+# GP fits of both samples, read once and inherited by pool workers
+FITS = {'spec': [], 'photo': []}
+
+
+def read_grid(file_name):
+    """
+    Read sweep parameters and configurations from a JSON file.
+
+    input: file_name, str
+           JSON file with keywords input_file, spec_dir, photo_dir,
+           out_dir, range_pcs, type_number, configs and optionally
+           batch_size. configs is a list of dictionaries with a 'name'
+           and the user choices it overrides, ex:
+           {"name": "gr_3_9", "filters": ["g", "r"],
+            "epoch_cut": ["-3", "10"]}
+
+    output: dict
+    """
+    op1 = open(file_name, 'r')
+    params = json.load(op1)
+    op1.close()
+
+    # json strings are unicode
+    for config in params['configs']:
+        for key in config.keys():
+            if isinstance(config[key], list):
+                config[key] = [str(item) for item in config[key]]
+            else:
+                config[key] = str(config[key])
+
+    return params
+
+
+def config_choices(user_choices, config):
+    """
+    User choices of one configuration.
+
+    input: user_choices, dict
+           output from snclass.util.read_user_input
+
+           config, dict
+           'name' and user choices to override. Values are lists of str
+           or str with items separated by spaces.
+
+    output: dict
+    """
+    if config.get('representation', 'original') != 'original':
+        raise ValueError('Configuration ' + config['name'] + ': sweep ' +
+                         'only handles the original representation!')
+
+    choices = dict(user_choices)
+    for key in config.keys():
+        if key in ['name', 'representation']:
+            continue
+        if isinstance(config[key], list):
+            choices[key] = config[key]
+        else:
+            choices[key] = config[key].split()
+
+    return choices
+
+
+def load_sample(fit_dir, user_choices, filters, samples):
+    """
+    Read all GP fits of one directory.
+
+    input: fit_dir, str
+           directory holding <file_root><SNID>_<measurement>_mean.dat
+           (and _samples.dat) files
+
+           user_choices, dict
+           output from snclass.util.read_user_input
+
+           filters, list of str
+           filters to read
+
+           samples, bool
+           if True read GP realizations as well
+
+    output: list
+            {'raw': raw data, 'fitted': GP fit} for each object
+    """
+    meas = user_choices['measurement'][0]
+
+    choices = dict(user_choices)
+    choices['filters'] = filters
+    choices['samples_dir'] = [fit_dir]
+    if not samples:
+        choices['n_samples'] = ['0']
+
+    sample = []
+    for name in sorted(os.listdir(fit_dir)):
+        if not name.endswith('_' + meas + '_mean.dat'):
+            continue
+
+        choices['path_to_lc'] = [translate_snid(name, meas)[0]]
+        raw = read_snana_lc(choices)
+
+        lc_data = dict(raw)
+        lc_data.update(choices)
+        sample.append({'raw': raw,
+                       'fitted': read_fitted(lc_data, fit_dir + name)})
+
+        screen('Loaded SN%s', user_choices, raw['SNID:'][0],
+               extra={'snid': raw['SNID:'][0]})
+
+    return sample
+
+
+def treat_fit(entry, choices, samples):
+    """
+    Build matrix line or realizations of one object for one configuration.
+
+    input: entry, dict
+           one element of the output from load_sample
+
+           choices, dict
+           output from config_choices
+
+           samples, bool
+           if True build realizations matrix, otherwise mean matrix line
+
+    output: None if object does not satisfy selection cuts, otherwise
+            [LC object, matrix line or realizations matrix]
+    """
+    from snclass.algorithm import prepare_lc
+
+    # stored fit is shared by all configurations, only read from it
+    new_lc = LC(entry['raw'], choices)
+    new_lc.fitted = dict(entry['fitted'])
+
+    new_lc.check_basic()
+    if not new_lc.basic_cuts:
+        return None
+
+    if samples:
+        small_matrix = prepare_lc(new_lc, choices)
+        if small_matrix is None:
+            return None
+        return [new_lc, small_matrix]
+
+    if not all(len(new_lc.fitted['GP_fit'][fil]) > 0
+               for fil in choices['filters']):
+        return None
+
+    fil_choice = choices['ref_filter'][0]
+    if fil_choice == 'None':
+        fil_choice = None
+
+    new_lc.normalize(ref_filter=fil_choice)
+    new_lc.mjd_shift()
+    new_lc.check_epoch()
+    if not new_lc.epoch_cuts:
+        return None
+
+    new_lc.build_steps()
+    return [new_lc, new_lc.mean_for_matrix]
+
+
+def matrix_task(pars):
+    """
+    Build and store the training data matrix of one configuration.
+
+    input: pars, dict
+           keywords: choices -> output from config_choices
+                     out_dir -> results directory of this configuration
+
+    output: int
+            number of objects in training matrix
+    """
+    from snclass.matrix import DataMatrix
+
+    choices = pars['choices']
+
+    d = DataMatrix()
+    d.user_choices = choices
+
+    lines = []
+    redshift = []
+    sntype = []
+    for entry in FITS['spec']:
+        obj = treat_fit(entry, choices, samples=False)
+        if obj is not None:
+            raw = obj[0].raw
+            d.snid.append(raw['SNID:'][0])
+            lines.append(obj[1])
+            redshift.append(float(raw[choices['redshift_flag'][0]][0]))
+            sntype.append(raw[choices['type_flag'][0]][0])
+
+    d.datam = np.array(lines, dtype=get_dtype(choices))
+    d.redshift = np.array(redshift)
+    d.sntype = np.array(sntype)
+
+    if not os.path.isdir(pars['out_dir']):
+        os.makedirs(pars['out_dir'])
+    d.store_training(pars['out_dir'] + 'data_matrix.npz')
+
+    return len(lines)
+
+
+def train_task(pars):
+    """
+    Train model of one configuration and number of PCs.
+
+    input: pars, dict
+           keywords: choices -> output from config_choices
+                     out_dir -> results directory of this configuration
+                     npcs -> number of PCs
+                     type_number -> translation between raw data types
+                                    and final classes
+    """
+    from snclass.algorithm import train_model
+    from snclass.matrix import DataMatrix
+
+    d = DataMatrix()
+    d.user_choices = dict(pars['choices'])
+    d.read(pars['out_dir'] + 'data_matrix.npz')
+
+    train_model(d, pars['npcs'], {'out_dir': pars['out_dir']},
+                pars['type_number'], np.array(d.sntype))
+
+
+def classify_task(pars):
+    """
+    Classify photometric sample of one configuration.
+
+    Objects are treated and classified in batches, against the models
+    of all numbers of PCs.
+
+    input: pars, dict
+           keywords: choices -> output from config_choices
+                     out_dir -> results directory of this configuration
+                     range_pcs -> [min_number_PCs, max_number_PCs]
+                     type_number -> translation between raw data types
+                                    and final classes
+                     batch_size -> number of objects classified together
+
+    output: int
+            number of classified objects
+    """
+    from snclass.algorithm import classify_prepared, load_model
+    from snclass.algorithm import write_class_res
+
+    choices = pars['choices']
+    type_number = pars['type_number']
+
+    p1 = {'out_dir': pars['out_dir'], 'plot_dir': None,
+          'plot_proj_dir': None,
+          'data_matrix': pars['out_dir'] + 'data_matrix.npz'}
+    din = {'user_input': choices, 'do_plot': False}
+
+    npcs_list = range(pars['range_pcs'][0], pars['range_pcs'][1])
+    models = dict([[npcs, load_model(p1, npcs, type_number, choices)]
+                   for npcs in npcs_list])
+    results = dict([[npcs, []] for npcs in npcs_list])
+
+    nbatch = max(int(pars['batch_size']), 1)
+    for i in xrange(0, len(FITS['photo']), nbatch):
+        objs = []
+        for entry in FITS['photo'][i:i + nbatch]:
+            obj = treat_fit(entry, choices, samples=True)
+            if obj is None:
+                continue
+
+            raw = obj[0].raw
+            true_type = None
+            for names in type_number.keys():
+                if raw[choices['type_flag'][0]][0] in type_number[names]:
+                    true_type = names
+            objs.append([obj[0], true_type, obj[1]])
+
+        for npcs in npcs_list:
+            results[npcs] = results[npcs] + \
+                            classify_prepared(objs, models[npcs], din)
+
+    for npcs in npcs_list:
+        write_class_res(pars['out_dir'], npcs, results[npcs])
+
+    return len(results[npcs_list[0]])
+
+
+class Sweep(object):
+
+    """
+    Train and classify a grid of configurations.
+
+    Methods:
+        - load: Read GP fits of both samples once.
+        - map: Apply a task function to a list of tasks.
+        - run: Build matrices, train and classify all configurations.
+
+    Attributes:
+        - user_choices: dict, base user input choices
+        - configs: list of dict, configurations
+        - params: dict, sweep parameters
+        - type_number: dict, translation between raw data types and
+                       final classes
+        - n_proc: int, number of worker processes
+    """
+
+    def __init__(self, params, type_number, n_proc=1):
+        """
+        Read base user input and check configurations.
+
+        input: params, dict
+               keywords, value type:
+                   input_file, str: base user input file
+                   spec_dir, str: directory of GP fitted spec sample
+                   photo_dir, str: directory of GP fitted photo sample
+                   out_dir, str: directory to store results
+                   range_pcs, list: [min_number_PCs, max_number_PCs]
+                   configs, list of dict: see read_grid
+                   batch_size, int, optional: number of photometric
+                                              objects classified together.
+                                              Default is 100
+
+               type_number, dict
+               dictionary to translate types between raw data and final
+               classification
+
+               n_proc, int - optional
+               number of worker processes shared by all configurations.
+               Default is 1
+        """
+        self.params = params
+        self.type_number = type_number
+        self.n_proc = max(int(n_proc), 1)
+        self.user_choices = read_user_input(params['input_file'])
+
+        names = [config['name'] for config in params['configs']]
+        if len(set(names)) < len(names):
+            raise ValueError('Configuration names must be unique!')
+
+        self.configs = []
+        for config in params['configs']:
+            choices = config_choices(self.user_choices, config)
+            if self.n_proc > 1:
+                # tasks already run in pool workers
+                choices['n_proc'] = ['0']
+            self.configs.append([config['name'], choices])
+
+        self.pool = None
+
+    def load(self):
+        """Read GP fits of both samples once, with all filters needed."""
+        filters = []
+        for name, choices in self.configs:
+            for fil in choices['filters']:
+                if fil not in filters:
+                    filters.append(fil)
+
+        screen('Loading spectroscopic sample', self.user_choices)
+        FITS['spec'] = load_sample(self.params['spec_dir'],
+                                   self.user_choices, filters, False)
+
+        screen('Loading photometric sample', self.user_choices)
+        FITS['photo'] = load_sample(self.params['photo_dir'],
+                                    self.user_choices, filters, True)
+
+    def map(self, func, tasks):
+        """
+        Apply a task function to a list of tasks.
+
+        input: func, function
+               one of matrix_task, train_task, classify_task
+
+               tasks, list of dict
+
+        output: list
+                output of func for each task, in the same order
+        """
+        if self.pool is None:
+            return [func(pars) for pars in tasks]
+
+        return self.pool.map(func, tasks, chunksize=1)
+
+    def run(self):
+        """
+        Build matrices, train and classify all configurations.
+
+        output: dict
+                keys are configuration names, values are number of
+                training and classified objects
+        """
+        self.load()
+
+        out_dir = self.params['out_dir']
+        range_pcs = self.params['range_pcs']
+        if 'batch_size' in self.params.keys():
+            batch_size = self.params['batch_size']
+        else:
+            batch_size = 100
+
+        base = [{'choices': choices, 'out_dir': out_dir + name + '/',
+                 'type_number': self.type_number}
+                for name, choices in self.configs]
+
+        # pool is forked once the fits are loaded
+        if self.n_proc > 1:
+            self.pool = Pool(processes=self.n_proc,
+                             **pool_args(self.n_proc, self.user_choices))
+
+        try:
+            screen('Building %d training matrices', self.user_choices,
+                   len(base))
+            ntrain = self.map(matrix_task, base)
+
+            tasks = []
+            for pars in base:
+                for npcs in xrange(range_pcs[0], range_pcs[1]):
+                    task = dict(pars)
+                    task['npcs'] = npcs
+                    tasks.append(task)
+            screen('Training %d models', self.user_choices, len(tasks))
+            self.map(train_task, tasks)
+
+            tasks = []
+            for pars in base:
+                task = dict(pars)
+                task['range_pcs'] = range_pcs
+                task['batch_size'] = batch_size
+                tasks.append(task)
+            screen('Classifying %d configurations', self.user_choices,
+                   len(tasks))
+            nclass = self.map(classify_task, tasks)
+
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+                self.pool = None
+
+        summary = {}
+        for k in xrange(len(self.configs)):
+            summary[self.configs[k][0]] = {'train': ntrain[k],
+                                           'classified': nclass[k]}
+
+        return summary
+
+
+def main():
+    """Print documentation."""
+    print __doc__
+
+if __name__ == '__main__':
+    main()
@@ -8,12 +8,12 @@ from __future__ import division
 
 import numpy as np
 import os
-import matplotlib.pylab as plt
 from scipy import interpolate
 
 from snclass.fit_lc_gptools import fit_lc
-from snclass.util import read_fitted, read_snana_lc
+from snclass.util import get_dtype, read_fitted, read_snana_lc
 from snclass.functions import screen
+from snclass.instrument import record_array, timed
 
 ##############################################################
 
@@ -154,6 +154,7 @@ class LC(object):
         # load
         self.fitted = read_fitted(self.raw, mean_file)
 
+    @timed('LC.normalize')
     def normalize(self, samples=False, ref_filter=None):
         """
         Normalize GP fit and samples.
@@ -185,12 +186,15 @@ class LC(object):
 
             # check if  realizations were calculated
             if samples and int(self.user_choices['n_samples'][0]) > 0:
-                max_f = self.fitted['max_flux']
-                gp_fitted = self.fitted['realizations'][fil]
-                self.fitted['norm_realizations'][fil] = np.array([np.array(elem) / max_f
-                                                                  for elem in
-                                                                  gp_fitted])
-
+                dtype = get_dtype(self.user_choices)
+                max_f = dtype.type(self.fitted['max_flux'])
+                gp_fitted = np.asarray(self.fitted['realizations'][fil],
+                                       dtype=dtype)
+                self.fitted['norm_realizations'][fil] = gp_fitted / max_f
+                record_array('LC.norm_realizations',
+                             self.fitted['norm_realizations'][fil])
+
+    @timed('LC.mjd_shift')
     def mjd_shift(self):
         """Determine day of maximum and shift all epochs."""
         # determine day of maximum
@@ -230,6 +234,7 @@ class LC(object):
 
         self.epoch_cuts = all(test for test in epoch_flags)
 
+    @timed('LC.build_steps')
     def build_steps(self, samples=False):
         """
         Build lines for the initial data matrix.
@@ -267,22 +272,24 @@ class LC(object):
                 self.mean_for_matrix.append(item)
 
         if samples:
-            self.samples_for_matrix = []
+            # interpolate all realizations of one filter at once
+            dtype = get_dtype(self.user_choices)
             fini = self.user_choices['filters'][0]
-            for j in xrange(len(self.fitted['norm_realizations'][fini])):   
-                line = [] 
+            if len(self.fitted['norm_realizations'][fini]) == 0:
+                self.samples_for_matrix = np.zeros((0,
+                                                    len(self.mean_for_matrix)),
+                                                   dtype=dtype)
+            else:
+                lines = []
                 for fil in self.user_choices['filters']:
                     xaxis2 = self.fitted['xarr_shifted'][fil]
-                    item = self.fitted['norm_realizations'][fil][j]
+                    items = self.fitted['norm_realizations'][fil]
                     # create function interpolating previous results
-                    func_samp = interpolate.interp1d(xaxis2, item)
+                    func_samp = interpolate.interp1d(xaxis2, items, axis=1)
                     # calculate sample grid in epochs
-                    new_grid = func_samp(xnew)
+                    lines.append(func_samp(xnew))
 
-                    # store
-                    for element in new_grid:
-                        line.append(element)
-                self.samples_for_matrix.append(line)
+                self.samples_for_matrix = np.hstack(lines).astype(dtype)
                 
 
     def plot_fitted(self, file_out=None):
@@ -296,6 +303,8 @@ class LC(object):
 
         output: if file_out is str -> plot wrote to file
         """
+        import matplotlib.pylab as plt
+
         # set the number of samples variable according to input
         samples = bool(int(self.user_choices['n_samples'][0]))
 
@@ -422,7 +431,8 @@ def fit_objs(user_choices, plot=False, calc_mean=True, calc_samp=False,
             # initiate light curve object
             my_lc = LC(raw, user_choices)
 
-            screen('Fitting SN' + raw['SNID:'][0], user_choices)
+            screen('Fitting SN%s', user_choices, raw['SNID:'][0],
+                   extra={'snid': raw['SNID:'][0]})
 
             # perform basic check
             my_lc.check_basic()
@@ -441,13 +451,14 @@ def fit_objs(user_choices, plot=False, calc_mean=True, calc_samp=False,
                     my_lc.mjd_shift()
                     my_lc.plot_fitted(file_out=user_choices['path_output_plot'][0] + 'gp-SN' + raw['SNID:'][0] + '_' + user_choices['measurement'][0] + '.png')
 
-                print '\n'
+                screen('\n', user_choices)
 
             else:
                 screen('Failed to pass basic cuts!\n', user_choices)
 
         else:
-            screen('Found fitted SN' + raw['SNID:'][0], user_choices)
+            screen('Found fitted SN%s', user_choices, raw['SNID:'][0],
+                   extra={'snid': raw['SNID:'][0]})
 
 
 def main():
@@ -15,6 +15,9 @@ Miscelaneous functions for supernova classification.
 - check_crossval:
         Check cross-validation function input choices.
 
+- get_dtype:
+        Floating point type of realizations, matrices and projections.
+
 - read_user_input:
         Read user choices from input file
 
@@ -38,6 +41,7 @@ import numpy as np
 import os
 
 from snclass.functions import screen
+from snclass.instrument import timed
 
 
 def translate_snid(snid, meas):
@@ -135,9 +139,13 @@ def check_reduction(params):
             updated dictionary of input parameters
     """
     if 'dim_reduction_func' in params.keys():
-        if params['dim_reduction_func'][0] == 'kpca':
-            from snclass.functions import kpca
-            params['dim_reduction_func'] = kpca
+        if params['dim_reduction_func'][0] in ['kpca', 'approx_kpca']:
+            if params['dim_reduction_func'][0] == 'kpca':
+                from snclass.functions import kpca
+                params['dim_reduction_func'] = kpca
+            else:
+                from snclass.functions import approx_kpca
+                params['dim_reduction_func'] = approx_kpca
 
             for i in xrange(len(params['kpca_pars'])):
                 par = params['kpca_pars'][i]
@@ -216,10 +224,22 @@ def check_crossval(params):
             updated dictionary of input parameters
     """
     if 'cross_validation_func' in params.keys():
-        if params['cross_validation_func'][0] == 'cross_val':
-            from snclass.functions import core_cross_val
-            params['cross_validation_func'] = core_cross_val
-            params['gamma_nparticles'] = int(params['gamma_nparticles'][0])
+        if params['cross_validation_func'][0] in ['cross_val',
+                                                  'cross_val_halving']:
+            if params['cross_validation_func'][0] == 'cross_val':
+                from snclass.functions import core_cross_val
+                params['cross_validation_func'] = core_cross_val
+                params['gamma_nparticles'] = \
+                    int(params['gamma_nparticles'][0])
+            else:
+                from snclass.functions import core_cross_val_halving
+                params['cross_validation_func'] = core_cross_val_halving
+                params['cv_budget'] = int(params['cv_budget'][0])
+                params['halving_eta'] = int(params['halving_eta'][0])
+                if params['halving_eta'] < 2:
+                    raise ValueError('halving_eta must be an integer >= 2!')
+                if params['cv_budget'] < 1:
+                    raise ValueError('cv_budget must be an integer >= 1!')
 
             name = 'n_cross_val_particles'
             params[name] = int(params[name][0])
@@ -236,6 +256,25 @@ def check_crossval(params):
     return params
 
 
+def get_dtype(params):
+    """
+    Floating point type of realizations, matrices and projections.
+
+    input: params, dict
+           dictionary of input parameters. Keyword 'precision' may be
+           ['float64'] (default) or ['float32'].
+
+    output: numpy.dtype
+    """
+    if 'precision' not in params.keys():
+        return np.dtype('float64')
+
+    if params['precision'][0] not in ['float32', 'float64']:
+        raise ValueError('precision must be float32 or float64!')
+
+    return np.dtype(params['precision'][0])
+
+
 def read_user_input(filename):
     """
     Read user input from file and construct initial dictionary parameter.
@@ -307,6 +346,7 @@ def build_indx(params, raw):
     return indx
 
 
+@timed('read_snana_lc')
 def read_snana_lc(params):
     """
     Read light curve in snana format and returns a dictionary.
@@ -458,11 +498,12 @@ def choose_sn(params, output_file='snlist.dat'):
         op2.write(item + '\n')
     op2.close()
 
-    screen('Found ' + str(len(final_list)) +
-           ' SN satisfying sample and type cuts.', params)
-    screen('Surviving objects are listed in file ' + output_file, params)
+    screen('Found %s SN satisfying sample and type cuts.', params,
+           len(final_list))
+    screen('Surviving objects are listed in file %s', params, output_file)
 
 
+@timed('read_fitted')
 def read_fitted(lc_data, mean_file):
     """
     Read GP results and populate dictionary parameters.
@@ -479,20 +520,22 @@ def read_fitted(lc_data, mean_file):
 
     if bool(int(lc_data['n_samples'][0])):
         op1 = open(lc_data['samples_dir'][0] + lc_data['file_root'][0] + \
-                   lc_data['SNID:'][0] + '_samples.dat', 'r')
+                   lc_data['SNID:'][0] + '_' + lc_data['measurement'][0] + \
+                   '_samples.dat', 'r')
         lin1 = op1.readlines()
         op1.close()
 
         data1 = [elem.split() for elem in lin1]
 
+        dtype = get_dtype(lc_data)
+
         loaded['realizations'] = {}
         loaded['xarr'] = {}
         for fil in lc_data['filters']:
-            par = lc_data['n_samples'][0]
-            loaded['realizations'][fil] = [[float(data1[kk][jj])
-                                            for kk in xrange(len(data1))
-                                            if data1[kk][0] == fil]
-                                            for jj in xrange(2, int(par) + 2)]
+            par = int(lc_data['n_samples'][0])
+            rows = [line[2:par + 2] for line in data1 if line[0] == fil]
+            loaded['realizations'][fil] = \
+                np.array(rows, dtype=float).T.astype(dtype)
 
             loaded['xarr'][fil] = []
             for i in xrange(len(data1)):
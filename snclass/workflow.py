@@ -0,0 +1,755 @@
+"""
+Dependency aware runner for the classification pipeline.
+
+A workflow is a set of stages. Each stage declares the files and
+directories it reads and writes, the configuration values it depends on
+and the stages which must run before it. Before a stage runs its key is
+calculated from
+
+    - its configuration values,
+    - name, size and modification time of its input files, including
+      every file inside input directories,
+    - the keys of the stages it depends on.
+
+If the key equals the one stored in the state file after the last
+successful run and all outputs exist, the stage is skipped. Changing
+range_pcs, for instance, only trains the new numbers of PCs and classifies
+again, without redoing GP fits or the data matrix.
+
+Stages which do not depend on each other run in parallel processes if
+n_proc > 1. Each stage may use its own pool of user choice n_proc
+processes.
+
+- path_state:
+        Describe a file or directory by names, sizes and modification times.
+- value_text:
+        Represent a configuration value as text.
+- Stage:
+        One pipeline step with declared inputs, outputs and configuration.
+- run_stage:
+        Run one stage function in a child process.
+- Workflow:
+        Run stages in dependency order, skipping those which are up to date.
+- choice_values:
+        Select user choices relevant to one stage.
+- build_workflow:
+        Declare the complete classification pipeline.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from functools import partial
+
+from snclass import log
+from snclass.functions import screen
+from snclass.resources import blas_threads, set_blas_threads
+from snclass.util import read_user_input
+
+# user choices read by all stages handling raw light curves
+READ_KEYS = ['path_to_obs', 'file_root', 'header', 'param_list',
+             'redshift_flag', 'mjd_flag', 'filter_flag', 'photon_flag',
+             'photonerr_flag', 'quality_flag', 'epoch_flag', 'type_flag',
+             'measurement', 'filters']
+
+# sample selection through header variables
+SELECT_KEYS = READ_KEYS + ['sample_flag', 'type_cut']
+
+# GP fit of each light curve
+FIT_KEYS = READ_KEYS + ['quality_cut', 'epoch_predict', 'do_mcmc',
+                        'n_samples', 'nsamp_mcmc', 'burn', 'thin']
+
+# selection cuts on fitted light curves
+CUT_KEYS = READ_KEYS + ['quality_cut', 'epoch_cut', 'epoch_bin',
+                        'epoch_predict', 'ref_filter']
+
+# data matrix lines
+MATRIX_KEYS = CUT_KEYS + ['matrix_dtype', 'precision']
+
+# dimensionality reduction, cross-validation and classifier
+TRAIN_KEYS = MATRIX_KEYS + ['dim_reduction_func', 'kpca_pars', 'kpca_val',
+                            'approx_method', 'n_landmarks', 'approx_seed',
+                            'classifier_func', 'classifier_pars',
+                            'classifier_val', 'nn_algorithm', 'leaf_size',
+                            'transform_types_func', 'Ia_flag',
+                            'cross_validation_func', 'cross_val_par',
+                            'n_cross_val_particles', 'gamma_lim',
+                            'gamma_nparticles', 'cv_budget', 'halving_eta']
+
+
+def path_state(path):
+    """
+    Describe a file or directory by names, sizes and modification times.
+
+    File contents are not read, so that directories holding thousands of
+    GP fits are checked quickly.
+
+    input: path, str
+           file or directory
+
+    output: str
+            hexadecimal digest, 'missing' if path does not exist
+    """
+    if not os.path.exists(path):
+        return 'missing'
+
+    sha = hashlib.sha1()
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                fname = os.path.join(root, name)
+                try:
+                    stat = os.stat(fname)
+                except OSError:
+                    continue
+                sha.update(os.path.relpath(fname, path) + ' ' +
+                           str(stat.st_size) + ' ' + repr(stat.st_mtime) +
+                           '\n')
+    else:
+        stat = os.stat(path)
+        sha.update(str(stat.st_size) + ' ' + repr(stat.st_mtime))
+
+    return sha.hexdigest()
+
+
+def value_text(value):
+    """
+    Represent a configuration value as text.
+
+    Functions (as set by snclass.util.read_user_input) are represented by
+    their names.
+
+    input: value, any type
+
+    output: str
+    """
+    return json.dumps(value, sort_keys=True,
+                      default=lambda obj: getattr(obj, '__name__', str(obj)))
+
+
+class Stage(object):
+
+    """
+    One pipeline step with declared inputs, outputs and configuration.
+
+    Methods:
+        - key: Calculate key identifying inputs and configuration.
+        - done: Check if all outputs exist.
+
+    Attributes:
+        - name: str, stage identifier
+        - func: function, called without arguments to run the stage
+        - inputs: list of str, files or directories read by the stage
+        - outputs: list of str, files or directories written by the stage
+        - config: dict, configuration values the results depend on
+        - after: list of str, stages which must run before this one
+    """
+
+    def __init__(self, name, func, inputs=None, outputs=None, config=None,
+                 after=None):
+        """
+        Set stage declarations.
+
+        input: name, str
+               stage identifier
+
+               func, function
+               called without arguments to run the stage
+
+               inputs, outputs, list of str - optional
+               files or directories read and written. Default is None
+
+               config, dict - optional
+               configuration values the results depend on. Default is None
+
+               after, list of str - optional
+               stages which must run before this one. Default is None
+        """
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs) if inputs is not None else []
+        self.outputs = list(outputs) if outputs is not None else []
+        self.config = dict(config) if config is not None else {}
+        self.after = list(after) if after is not None else []
+
+    def key(self, upstream):
+        """
+        Calculate key identifying inputs and configuration.
+
+        input: upstream, dict
+               keys are names of the stages in self.after,
+               values are their keys
+
+        output: str
+                hexadecimal digest
+        """
+        sha = hashlib.sha1()
+        sha.update('stage: ' + self.name + '\n')
+        for name in sorted(self.config.keys()):
+            sha.update('config: ' + name + ' ' +
+                       value_text(self.config[name]) + '\n')
+        for path in self.inputs:
+            sha.update('input: ' + path + ' ' + path_state(path) + '\n')
+        for name in sorted(upstream.keys()):
+            sha.update('after: ' + name + ' ' + upstream[name] + '\n')
+
+        return sha.hexdigest()
+
+    def done(self):
+        """
+        Check if all outputs exist.
+
+        output: bool
+        """
+        return all([os.path.exists(path) for path in self.outputs])
+
+
+def run_stage(func, nthreads):
+    """
+    Run one stage function in a child process.
+
+    input: func, function
+           Stage.func
+
+           nthreads, int
+           number of BLAS threads of the child process
+    """
+    log.after_fork()
+    set_blas_threads(nthreads)
+    try:
+        func()
+    finally:
+        log.stop_listener()
+
+
+class Workflow(object):
+
+    """
+    Run stages in dependency order, skipping those which are up to date.
+
+    Methods:
+        - add: Add one stage.
+        - order: Sort stages so that each comes after those it depends on.
+        - required: List stages needed to produce a set of targets.
+        - write_state: Write stage keys to state file.
+        - up_to_date: Check if a stage ran successfully with a given key.
+        - status: Report which stages are up to date.
+        - finish: Store key of a successful stage run.
+        - run: Run stages which are out of date.
+
+    Attributes:
+        - stages: OrderedDict, keys are stage names, values are Stage objects
+        - state_file: str, JSON file holding the key of each stage after
+                      its last successful run
+        - state: dict, content of state_file
+        - n_proc: int, maximum number of stages running at once
+    """
+
+    def __init__(self, state_file, n_proc=1, user_choices=None):
+        """
+        Read state file.
+
+        input: state_file, str
+               JSON file holding stage keys. Created if necessary.
+
+               n_proc, int - optional
+               maximum number of stages running at once. If 1 stages run
+               in this process. Default is 1
+
+               user_choices, dict - optional
+               used for screen output. Default is None (print messages)
+        """
+        self.stages = OrderedDict()
+        self.state_file = state_file
+        self.n_proc = max(int(n_proc), 1)
+        self.user_choices = user_choices
+        if self.user_choices is None:
+            self.user_choices = {'screen': ['1']}
+
+        self.state = {}
+        if os.path.isfile(state_file):
+            op1 = open(state_file, 'r')
+            self.state = json.load(op1)
+            op1.close()
+
+    def add(self, stage):
+        """
+        Add one stage.
+
+        input: stage, Stage object
+        """
+        if stage.name in self.stages.keys():
+            raise ValueError('Stage ' + stage.name + ' already exists.')
+
+        self.stages[stage.name] = stage
+
+    def order(self):
+        """
+        Sort stages so that each comes after those it depends on.
+
+        Stages keep the order they were added in whenever possible.
+
+        output: list of str
+                stage names
+        """
+        done = []
+        visiting = []
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError('Circular dependency through stage ' +
+                                 name + '.')
+            if name not in self.stages.keys():
+                raise ValueError('Unknown stage ' + name + '.')
+
+            visiting.append(name)
+            for dep in self.stages[name].after:
+                visit(dep)
+            visiting.remove(name)
+            done.append(name)
+
+        for name in self.stages.keys():
+            visit(name)
+
+        return done
+
+    def required(self, targets=None):
+        """
+        List stages needed to produce a set of targets.
+
+        input: targets, list of str - optional
+               stage names. If None all stages. Default is None
+
+        output: list of str
+                stage names, in execution order
+        """
+        order = self.order()
+        if targets is None:
+            return order
+
+        needed = set()
+        todo = list(targets)
+        while len(todo) > 0:
+            name = todo.pop()
+            if name not in self.stages.keys():
+                raise ValueError('Unknown stage ' + name + '.')
+            if name not in needed:
+                needed.add(name)
+                todo.extend(self.stages[name].after)
+
+        return [name for name in order if name in needed]
+
+    def write_state(self):
+        """Write stage keys to state file."""
+        dirname = os.path.dirname(self.state_file)
+        if dirname != '' and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        op1 = open(self.state_file + '.tmp', 'w')
+        json.dump(self.state, op1, indent=2, sort_keys=True)
+        op1.close()
+        os.rename(self.state_file + '.tmp', self.state_file)
+
+    def up_to_date(self, name, key):
+        """Check if a stage ran successfully with a given key."""
+        return name in self.state.keys() and \
+               self.state[name]['key'] == key and self.stages[name].done()
+
+    def status(self, targets=None):
+        """
+        Report which stages are up to date.
+
+        Stages after one which is out of date are reported as out of
+        date, since their inputs will change.
+
+        input: targets, list of str - optional
+               stage names. If None all stages. Default is None
+
+        output: OrderedDict
+                keys are stage names, values are True if up to date
+        """
+        keys = {}
+        status = OrderedDict()
+        for name in self.required(targets):
+            stage = self.stages[name]
+            keys[name] = stage.key(dict([[dep, keys[dep]]
+                                         for dep in stage.after]))
+            status[name] = self.up_to_date(name, keys[name]) and \
+                           all([status[dep] for dep in stage.after])
+
+        return status
+
+    def finish(self, name, key, start):
+        """Store key of a successful stage run."""
+        elapsed = time.time() - start
+        self.state[name] = {'key': key, 'elapsed': elapsed,
+                            'time': time.time()}
+        self.write_state()
+        screen('Stage %s done in %.1f s', self.user_choices, name, elapsed,
+               extra={'stage': name, 'elapsed': elapsed})
+
+    def run(self, targets=None, force=None):
+        """
+        Run stages which are out of date.
+
+        input: targets, list of str - optional
+               stage names. Only these and the stages they depend on are
+               considered. If None all stages. Default is None
+
+               force, list of str - optional
+               stages run even if up to date. Default is None
+
+        output: OrderedDict
+                keys are stage names, values are 'ran' or 'skipped'
+        """
+        if force is None:
+            force = []
+
+        pending = self.required(targets)
+        keys = {}
+        result = OrderedDict()
+        running = {}
+        failed = []
+
+        while len(pending) > 0 or len(running) > 0:
+
+            # start stages whose dependencies are finished
+            for name in list(pending):
+                if len(failed) > 0 or len(running) >= self.n_proc:
+                    break
+
+                stage = self.stages[name]
+                if any([dep in pending or dep in running
+                        for dep in stage.after]):
+                    continue
+
+                pending.remove(name)
+                keys[name] = stage.key(dict([[dep, keys[dep]]
+                                             for dep in stage.after]))
+
+                if name not in force and self.up_to_date(name, keys[name]):
+                    result[name] = 'skipped'
+                    screen('Stage %s is up to date', self.user_choices, name,
+                           extra={'stage': name})
+                    continue
+
+                screen('Running stage %s', self.user_choices, name,
+                       extra={'stage': name})
+                result[name] = 'ran'
+                self.state.pop(name, None)
+                self.write_state()
+
+                if self.n_proc == 1:
+                    start = time.time()
+                    stage.func()
+                    self.finish(name, keys[name], start)
+                else:
+                    nthreads = blas_threads(self.n_proc, self.user_choices)
+                    proc = multiprocessing.Process(target=run_stage,
+                                                   args=(stage.func,
+                                                         nthreads))
+                    proc.start()
+                    running[name] = [proc, time.time()]
+
+            if len(failed) > 0 and len(running) == 0:
+                break
+
+            # wait for one running stage to finish
+            if len(running) > 0:
+                time.sleep(0.1)
+                for name in running.keys():
+                    proc, start = running[name]
+                    if proc.is_alive():
+                        continue
+                    proc.join()
+                    del running[name]
+                    if proc.exitcode == 0:
+                        self.finish(name, keys[name], start)
+                    else:
+                        failed.append(name)
+
+        if len(failed) > 0:
+            raise RuntimeError('Stage ' + ', '.join(failed) + ' failed.')
+
+        return result
+
+
+def choice_values(user_choices, keys):
+    """
+    Select user choices relevant to one stage.
+
+    input: user_choices, dict
+           output from snclass.util.read_user_input
+
+           keys, list of str
+           relevant keywords
+
+    output: dict
+    """
+    return dict([[key, user_choices[key]] for key in keys
+                 if key in user_choices.keys()])
+
+
+def choose_stage(p, sample):
+    """Select objects of one sample through header variables."""
+    from snclass.util import choose_sn
+
+    params = read_user_input(p['input_file'])
+    params['sample_cut'] = p[sample + '_cut']
+    if not os.path.isdir(p['list_dir']):
+        os.makedirs(p['list_dir'])
+    choose_sn(params, output_file=p['list_dir'] + sample + '_raw.list')
+
+
+def fit_stage(p, sample):
+    """Fit all objects of one sample with GP."""
+    from snclass.treat_lc import fit_objs
+
+    params = read_user_input(p['input_file'])
+    params['snlist'] = [p['list_dir'] + sample + '_raw.list']
+    params['samples_dir'] = [p[sample + '_dir']]
+    fit_objs(params, calc_samp=True, save_samp=True)
+
+
+def lclist_stage(p, sample):
+    """List fitted objects of one sample satisfying selection cuts."""
+    from snclass.algorithm import set_lclist
+
+    params = {}
+    params['plot_dir'] = p.get('plot_dir')
+    params['fitted_data_dir'] = p[sample + '_dir']
+    params['list_dir'] = p['list_dir']
+    params['sample'] = sample
+    params['user_choices'] = read_user_input(p['input_file'])
+    set_lclist(params)
+
+
+def synthetic_stage(p, type_number):
+    """Build the synthetic spectroscopic sample."""
+    from snclass.algorithm import sample_pop, photo_frac, get_names
+    from snclass.algorithm import set_parameters, select_GP, lclist_name
+
+    params = dict(p)
+    params['user_choices'] = read_user_input(p['input_file'])
+    user_choices = params['user_choices']
+
+    spec_list = lclist_name(p['list_dir'], 'spec', user_choices)
+    photo_list = lclist_name(p['list_dir'], 'photo', user_choices)
+
+    params['list_name'] = spec_list
+    params['spec_pop'] = sample_pop(user_choices, params, type_number)
+    params['list_name'] = photo_list
+    params['photo_pop'] = sample_pop(user_choices, params, type_number)
+    params['photo_perc'] = photo_frac(params['spec_pop'], params['photo_pop'],
+                                      params['representation'])
+
+    params['list_name'] = spec_list
+    params['surv_spec_names'] = get_names(user_choices, params, type_number)
+    params['fitted_data_dir'] = p['spec_dir']
+    params = set_parameters(params)
+
+    select_GP(params, user_choices)
+
+
+def matrix_stage(p):
+    """Build spectroscopic data matrix."""
+    from snclass.algorithm import build_train_matrix
+
+    build_train_matrix(p)
+
+
+def train_stage(p, type_number, data_matrix, npcs):
+    """Train model for one number of PCs."""
+    import numpy as np
+
+    from snclass.algorithm import train_model
+    from snclass.matrix import DataMatrix
+
+    d = DataMatrix(p['input_file'])
+    d.read(data_matrix)
+    train_model(d, npcs, p, type_number, np.array(d.sntype))
+
+
+def classify_stage(p, type_number, data_matrix):
+    """Classify photometric sample with all trained models."""
+    from snclass.algorithm import classify, lclist_name
+
+    p1 = dict(p)
+    user_choices = read_user_input(p['input_file'])
+    p1['fname_photo_list'] = lclist_name(p['list_dir'], 'photo',
+                                         user_choices)
+    p1['data_matrix'] = data_matrix
+    p1.setdefault('plot_dir', None)
+    p1.setdefault('plot_proj_dir', None)
+    classify(p1, user_choices, type_number, do_plot=False)
+
+
+def roc_stage(p):
+    """Calculate area under ROC curve for each number of PCs."""
+    from snclass.diagnostic_plots import calc_ROC
+
+    params = {'range_pcs': p['range_pcs'], 'class_res_dir': p['out_dir'],
+              'representation': p['representation']}
+    params = calc_ROC(params)
+
+    op1 = open(p['out_dir'] + 'auc_values.dat', 'w')
+    op1.write('npcs    auc\n')
+    for k in xrange(len(params['auc_set'])):
+        op1.write(str(p['range_pcs'][0] + k) + '    ' +
+                  str(params['auc_set'][k]) + '\n')
+    op1.close()
+
+
+def build_workflow(p, type_number, state_file=None, n_proc=1):
+    """
+    Declare the complete classification pipeline.
+
+    Stages are
+
+        choose_spec, choose_photo -> select samples through header
+                                     variables (if spec_cut and
+                                     photo_cut are given)
+        fit_spec, fit_photo       -> GP fit (if spec_cut and photo_cut
+                                     are given)
+        lclist_spec, lclist_photo -> list fitted objects satisfying
+                                     selection cuts
+        synthetic                 -> build synthetic spectroscopic sample
+        matrix                    -> build spectroscopic data matrix
+        train_<n>PC               -> optimize hyperparameters and store
+                                     model, one stage per number of PCs
+        classify                  -> classify photometric sample
+        roc                       -> write area under ROC curve for each
+                                     number of PCs to out_dir/auc_values.dat
+
+    input: p, dict
+           keywords, value type:
+               input_file, str: user input file
+               representation, str: 'original', 'balanced' or
+                                    'representative'
+               sample_size, int: size of synthetic spectroscopic sample
+               spec_dir, str: directory of GP fitted spec sample
+               photo_dir, str: directory of GP fitted photo sample
+               list_dir, str: directory to store lists of objects
+               synthetic_dir, str: directory to store synthetic sample
+               mat_dir, str: directory to store data matrices
+               out_dir, str: directory to store classification results
+               range_pcs, list: [min_number_PCs, max_number_PCs]
+               plot_dir, str, optional: directory to store light curve
+                                        plots. Default is None
+               spec_cut, photo_cut, list of str, optional: sample_cut
+                                        values selecting raw spec and
+                                        photo samples. If not given, both
+                                        samples must already be fitted.
+               batch_size, single_pass, plot_proj_dir, optional: see
+                                        snclass.algorithm.classify
+
+           type_number, dict
+           dictionary to translate types between raw data and final
+           classification
+           keywords -> final classificaton elements
+           values -> identifiers in raw data
+
+           state_file, str - optional
+           JSON file holding stage keys.
+           If None use out_dir/workflow_state.json. Default is None
+
+           n_proc, int - optional
+           maximum number of stages running at once. Default is 1
+
+    output: Workflow object
+    """
+    from snclass.algorithm import lclist_name, matrix_name
+
+    user_choices = read_user_input(p['input_file'])
+
+    if state_file is None:
+        state_file = p['out_dir'] + 'workflow_state.json'
+
+    flow = Workflow(state_file, n_proc=n_proc, user_choices=user_choices)
+
+    samples = ['spec', 'photo']
+    lists = dict([[sample, lclist_name(p['list_dir'], sample, user_choices)]
+                  for sample in samples])
+
+    for sample in samples:
+        fit_after = []
+        if sample + '_cut' in p.keys():
+            raw_list = p['list_dir'] + sample + '_raw.list'
+            config = choice_values(user_choices, SELECT_KEYS)
+            config['sample_cut'] = p[sample + '_cut']
+            flow.add(Stage('choose_' + sample,
+                           partial(choose_stage, p, sample),
+                           inputs=[user_choices['path_to_obs'][0]],
+                           outputs=[raw_list], config=config))
+            flow.add(Stage('fit_' + sample, partial(fit_stage, p, sample),
+                           inputs=[raw_list], outputs=[p[sample + '_dir']],
+                           config=choice_values(user_choices, FIT_KEYS),
+                           after=['choose_' + sample]))
+            fit_after = ['fit_' + sample]
+
+        config = choice_values(user_choices, CUT_KEYS)
+        config['plot_dir'] = p.get('plot_dir')
+        flow.add(Stage('lclist_' + sample, partial(lclist_stage, p, sample),
+                       inputs=[p[sample + '_dir']], outputs=[lists[sample]],
+                       config=config, after=fit_after))
+
+    config = choice_values(user_choices, CUT_KEYS)
+    config['representation'] = p['representation']
+    config['sample_size'] = p['sample_size']
+    config['type_number'] = type_number
+    flow.add(Stage('synthetic', partial(synthetic_stage, p, type_number),
+                   inputs=[lists['spec'], lists['photo'], p['spec_dir']],
+                   outputs=[p['synthetic_dir']], config=config,
+                   after=['lclist_spec', 'lclist_photo']))
+
+    data_matrix = matrix_name(p['mat_dir'], p['representation'],
+                              user_choices) + '_data_matrix.npz'
+    config = choice_values(user_choices, MATRIX_KEYS)
+    config['representation'] = p['representation']
+    flow.add(Stage('matrix', partial(matrix_stage, p),
+                   inputs=[p['synthetic_dir']], outputs=[data_matrix],
+                   config=config, after=['synthetic']))
+
+    models = []
+    results = []
+    for npcs in xrange(p['range_pcs'][0], p['range_pcs'][1]):
+        pc_dir = p['out_dir'] + str(npcs) + 'PC/'
+        config = choice_values(user_choices, TRAIN_KEYS)
+        config['npcs'] = npcs
+        config['type_number'] = type_number
+        flow.add(Stage('train_' + str(npcs) + 'PC',
+                       partial(train_stage, p, type_number, data_matrix, npcs),
+                       inputs=[data_matrix],
+                       outputs=[pc_dir + 'model/',
+                                pc_dir + 'hyperpar_values.dat'],
+                       config=config, after=['matrix']))
+        models.append('train_' + str(npcs) + 'PC')
+        results.append(pc_dir + 'class_res_' + str(npcs) + 'PC.dat')
+
+    config = choice_values(user_choices, CUT_KEYS)
+    config['range_pcs'] = p['range_pcs']
+    config['type_number'] = type_number
+    flow.add(Stage('classify', partial(classify_stage, p, type_number,
+                                       data_matrix),
+                   inputs=[lists['photo'], p['photo_dir']], outputs=results,
+                   config=config, after=['lclist_photo'] + models))
+
+    flow.add(Stage('roc', partial(roc_stage, p), inputs=results,
+                   outputs=[p['out_dir'] + 'auc_values.dat'],
+                   config={'range_pcs': p['range_pcs']}, after=['classify']))
+
+    return flow
+
+
+def main():
+    """Print documentation."""
+    print __doc__
+
+if __name__ == '__main__':
+    main()